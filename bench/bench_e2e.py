@@ -0,0 +1,215 @@
+"""
+オフラインの通し（end-to-end）ベンチマーク。
+
+実サイト・g4f・Google Drive を使わずに、ダウンローダーを最初から最後まで動かして計測します。
+
+- bench.stub_site      : 合成したカクヨム / なろう / なろうR18 のページとなろう小説API を返すローカルサーバー
+                         （ページ分割された目次・大きな作品を含む）
+- bench.fake_translator: 遅延と失敗率を指定できる偽の翻訳API
+- bench.fake_rclone    : ローカルのディレクトリを Drive に見立てた rclone の代わり
+
+ダウンローダー（サイトごと、および全サイト一括）を1つずつ別の子プロセスで、
+毎回空の作業ディレクトリから動かし、話/秒・各段の p50 / p95・ピークのメモリ使用量（RSS）を表示します。
+
+    python -m bench.bench_e2e [--episodes 100] [--large-episodes 600] [--translate-latency 0.3]
+                              [--downloaders kakuyomu narou narouR18 all] [--json 結果.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.stub_site import StubSite
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOWNLOADERS = {
+    'kakuyomu': ['kakuyomu'],
+    'narou': ['narou'],
+    'narouR18': ['narouR18'],
+    'all': ['kakuyomu', 'narou', 'narouR18'],
+}
+STAGES = ['precheck', 'toc', 'fetch', 'translate', 'write']
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def make_fake_rclone(bin_dir):
+    """
+    PATH の先頭に置く「rclone」（bench.fake_rclone を呼ぶだけのシェルスクリプト）を作ります。
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 'rclone')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(REPO_DIR, "bench", "fake_rclone.py")}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def prepare_root(root, kakuyomu_urls, narou_urls, narou18_urls):
+    """
+    root に各サイトの URL 一覧と偽の rclone を置きます（downloader_env がここを指す）。
+    """
+    write_lines(os.path.join(root, 'kakuyomu.txt'), kakuyomu_urls)
+    write_lines(os.path.join(root, 'narou.txt'), narou_urls)
+    write_lines(os.path.join(root, 'narou18.txt'), narou18_urls)
+    make_fake_rclone(os.path.join(root, 'bin'))
+
+
+def run_downloader(sites, env, stats_path, translate_latency=0.0):
+    """
+    bench.run_downloader を子プロセスで1回動かし、subprocess.CompletedProcess（出力は stdout）を返します。
+    """
+    command = [sys.executable, '-m', 'bench.run_downloader', *sites, '--stats', stats_path,
+               '--translate-latency', str(translate_latency)]
+    return subprocess.run(command, cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True)
+
+
+def count_files(root, lang):
+    total = 0
+    for dirpath, _, names in os.walk(root):
+        if os.path.basename(dirpath) == lang:
+            total += sum(1 for name in names if name.endswith('.txt'))
+    return total
+
+
+def downloader_env(site, root, work_dir, drive_dir, host_limit):
+    """
+    ダウンローダーの子プロセス用の環境変数（スタブサーバー・偽の rclone・root の URL 一覧を使う）。
+    """
+    env = dict(os.environ)
+    env.update({
+        'PATH': f'{os.path.join(root, "bin")}{os.pathsep}{env.get("PATH", "")}',
+        'PYTHONPATH': REPO_DIR,
+        'WORK_DIR': work_dir,
+        'HTTP_CACHE_DIR': os.path.join(work_dir, 'http_cache'),
+        'FAKE_RCLONE_ROOT': drive_dir,
+        'KAKUYOMU_BASE_URL': site.base_url,
+        'NAROU_BASE_URL': site.base_url,
+        'NAROU18_BASE_URL': f'{site.base_url}/r18',
+        'NAROU_API_URL': f'{site.base_url}/novelapi/api/',
+        'NAROU18_API_URL': f'{site.base_url}/novel18api/api/',
+        'KAKUYOMU_URL_FILE': os.path.join(root, 'kakuyomu.txt'),
+        'NAROU_URL_FILE': os.path.join(root, 'narou.txt'),
+        'NAROU18_URL_FILE': os.path.join(root, 'narou18.txt'),
+        # 本番のホスト別の制限ではなく、スタブサーバー用の制限で動かす
+        'HOST_LIMITS': f'127.0.0.1={host_limit}',
+    })
+    env.setdefault('RETRY_BASE_DELAY', '0.05')
+    return env
+
+
+def run_one(name, site, root, args):
+    """
+    1つのダウンローダーを空の作業ディレクトリから子プロセスで動かし、結果を返します。
+    """
+    base = os.path.join(root, name)
+    work_dir = os.path.join(base, 'work')
+    drive_dir = os.path.join(base, 'drive')
+    os.makedirs(work_dir)
+    os.makedirs(drive_dir)
+    stats_path = os.path.join(base, 'stats.json')
+    log_path = os.path.join(base, 'log.txt')
+
+    env = downloader_env(site, root, work_dir, drive_dir, args.host_limit)
+
+    command = [sys.executable, '-m', 'bench.run_downloader', *DOWNLOADERS[name], '--stats', stats_path,
+               '--translate-latency', str(args.translate_latency),
+               '--translate-per-1k-chars', str(args.translate_per_1k_chars),
+               '--translate-failure-rate', str(args.translate_failure_rate)]
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        result = subprocess.run(command, cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0 or not os.path.exists(stats_path):
+        with open(log_path, 'r', encoding='utf-8') as f:
+            tail = f.read()[-2000:]
+        raise RuntimeError(f'{name} が失敗しました (exit {result.returncode})\n{tail}')
+
+    with open(stats_path, 'r', encoding='utf-8') as f:
+        stats = json.load(f)
+    stats['process_seconds'] = elapsed
+    stats['english_files'] = count_files(work_dir, 'english')
+    stats['uploaded_files'] = count_files(drive_dir, 'english')
+    return stats
+
+
+def print_report(results, expected):
+    print(f"\n{'ダウンローダー':<10}{'話数':>7}{'期待':>7}{'Drive':>7}{'秒':>8}{'話/秒':>8}{'RSS(MB)':>9}")
+    for name, stats in results.items():
+        rate = stats['episodes'] / stats['wall_seconds'] if stats['wall_seconds'] else 0
+        print(f"{name:<14}{stats['english_files']:>7}{expected[name]:>7}{stats['uploaded_files']:>7}"
+              f"{stats['wall_seconds']:>8.1f}{rate:>8.2f}{stats['peak_rss_mb']:>9.1f}")
+
+    print(f"\n{'段 p50 / p95 (ms)':<20}" + ''.join(f'{stage:>18}' for stage in STAGES))
+    for name, stats in results.items():
+        cells = []
+        for stage in STAGES:
+            values = stats['stages'].get(stage)
+            cells.append(f"{values['p50'] * 1000:>8.1f} /{values['p95'] * 1000:>8.1f}" if values else f"{'-':>18}")
+        print(f'{name:<20}' + ''.join(f'{cell:>18}' for cell in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--downloaders', nargs='+', choices=list(DOWNLOADERS), default=list(DOWNLOADERS))
+    parser.add_argument('--kakuyomu', type=int, default=3, help='カクヨムの作品数')
+    parser.add_argument('--narou', type=int, default=3, help='なろう（R18 も同数）の作品数')
+    parser.add_argument('--episodes', type=int, default=100, help='1作品あたりの話数')
+    parser.add_argument('--large-episodes', type=int, default=600, help='各サイト1作品だけの大きな作品の話数（0 で無し）')
+    parser.add_argument('--paragraphs', type=int, default=60, help='1話あたりの段落数')
+    parser.add_argument('--page-latency', type=float, default=0.02, help='スタブサーバーの1リクエストあたりの遅延（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='スタブサーバーが 503 を返す割合')
+    parser.add_argument('--translate-latency', type=float, default=0.3, help='偽翻訳の1リクエストあたりの遅延（秒）')
+    parser.add_argument('--translate-per-1k-chars', type=float, default=0.0, help='偽翻訳の 1000 文字あたりの追加遅延（秒）')
+    parser.add_argument('--translate-failure-rate', type=float, default=0.0, help='偽翻訳が失敗する割合')
+    parser.add_argument('--host-limit', default='16:200:1000', help='スタブサーバーへの 同時接続数:開始レート:最大レート')
+    parser.add_argument('--json', help='結果を JSON で保存するパス（前回の結果との比較用）')
+    parser.add_argument('--keep', action='store_true', help='作業ディレクトリを消さずに残す')
+    args = parser.parse_args(argv)
+
+    site = StubSite.generate(args.kakuyomu, args.narou, args.episodes, args.large_episodes,
+                             paragraphs=args.paragraphs, latency=args.page_latency,
+                             error_rate=args.error_rate).start()
+    root = tempfile.mkdtemp(prefix='bench-e2e-')
+    try:
+        prepare_root(root, site.kakuyomu_urls(), site.narou_urls(), site.narou_urls(r18=True))
+
+        per_site = {
+            'kakuyomu': sum(site.kakuyomu_works.values()),
+            'narou': sum(site.narou_novels.values()),
+            'narouR18': sum(site.narou_novels.values()),
+        }
+        expected = {name: sum(per_site[s] for s in sites) for name, sites in DOWNLOADERS.items()}
+        print(f'カクヨム {len(site.kakuyomu_works)} 作品 / なろう・R18 各 {len(site.narou_novels)} 作品 '
+              f'（{per_site["kakuyomu"]} / {per_site["narou"]} 話）、翻訳の遅延 {args.translate_latency} 秒、'
+              f'失敗率 {args.translate_failure_rate}')
+
+        results = {}
+        for name in args.downloaders:
+            print(f'{name} を実行中…', flush=True)
+            results[name] = run_one(name, site, root, args)
+        print_report(results, expected)
+        print(f'\nスタブサーバー: {site.hits} リクエスト（304: {site.not_modified} / 503: {site.errors}）')
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=1)
+        if args.keep:
+            print(f'作業ディレクトリ: {root}')
+    finally:
+        site.stop()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
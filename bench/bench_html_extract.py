@@ -0,0 +1,74 @@
+"""
+本文抽出バックエンドのベンチマーク。
+
+bench/corpus/ の話ページの HTML を、common.html_extract の各バックエンドで処理し、
+処理速度（ページ/秒・MB/秒）と、出力が bs4（従来の処理）と1バイトも違わないかを確認します。
+
+コーパスは実サイトのページではなく、bench.synthetic で作った合成ページ（実サイトの本文まわりの構造を再現したもの）と、
+CRLF・文字参照・空白だけの文字列・対応のない終了タグなどを含む境界ケースのページ（*_edge_cases.html）です。
+
+    python -m bench.bench_html_extract [--rounds 20]
+
+違いが出たファイルがあれば終了コード 1 を返します。
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from common.html_extract import BACKENDS, extract_text
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# ファイル名の先頭で、ダウンロードスクリプトと同じ抽出条件を選ぶ
+SELECTORS = {
+    'kakuyomu': ('div.widget-episodeBody', True),
+    'narou': ('.p-novel__body', False),
+}
+
+
+def load_corpus():
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.html'))):
+        name = os.path.basename(path)
+        # 改行（CRLF）も保存したときのまま読む
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            html = f.read()
+        selector, strip = SELECTORS[name.split('_')[0]]
+        corpus.append((name, html, selector, strip))
+    return corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus()
+    total_bytes = sum(len(html.encode('utf-8')) for _, html, _, _ in corpus)
+    print(f'コーパス: {len(corpus)} ファイル / {total_bytes / 1024:.0f} KB / {args.rounds} 回')
+    print(f"{'バックエンド':<10}{'ページ/秒':>12}{'MB/秒':>10}{'bs4 と一致':>14}")
+
+    reference = {name: extract_text(html, selector, strip, backend='bs4')
+                 for name, html, selector, strip in corpus}
+    failed = False
+    for backend in sorted(BACKENDS):
+        mismatches = [name for name, html, selector, strip in corpus
+                      if extract_text(html, selector, strip, backend=backend) != reference[name]]
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            for name, html, selector, strip in corpus:
+                extract_text(html, selector, strip, backend=backend)
+        elapsed = time.perf_counter() - start
+        pages = len(corpus) * args.rounds
+        same = 'はい' if not mismatches else f'いいえ ({", ".join(mismatches)})'
+        print(f'{backend:<10}{pages / elapsed:>12.1f}{total_bytes * args.rounds / elapsed / 1024 / 1024:>10.1f}{same:>14}')
+        failed = failed or bool(mismatches)
+    if 'lxml' not in BACKENDS:
+        print('lxml が入っていないため、bs4 のみ計測しました')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+カクヨム作品情報の取得ベンチマーク。
+
+従来の「get_novel_title + get_episode_links（同じページを2回取得し、BeautifulSoup と正規表現で解析）」と、
+common.kakuyomu_work.load_work（1回取得して埋め込み JSON を1回デコード）を、
+ローカルの HTTP サーバーに置いた合成ページで比べます。
+
+    python -m bench.bench_kakuyomu_work [--episodes 2000] [--filler-mb 3] [--rounds 5]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# HTTP キャッシュはベンチマーク専用の一時ディレクトリに置く（common.session の読み込み前に設定）
+os.environ.setdefault('HTTP_CACHE_DIR', tempfile.mkdtemp(prefix='bench-http-cache-'))
+# 従来方式は素の requests.get なので、load_work 側もローカルサーバーへのレート制限なしで比べる
+# （既定の 127.0.0.1 の制限 5 リクエスト/秒のままだと、取得ではなく待ち時間を測ってしまう）
+os.environ.setdefault('HOST_LIMITS', '127.0.0.1=4:100000')
+
+import requests
+from bs4 import BeautifulSoup
+
+from bench.synthetic import kakuyomu_work_page
+from common import kakuyomu_work
+
+WORK_ID = '1177354054880000000'
+
+
+def serve(page_bytes):
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            hits.append(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page_bytes)))
+            self.end_headers()
+            self.wfile.write(page_bytes)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, hits
+
+
+def old_path(novel_url):
+    """
+    変更前の kakuyomu/download_kakuyomu.py と同じ処理。
+    """
+    response = requests.get(novel_url)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, "html.parser")
+    title_tag = soup.find("title")
+    title = re.sub(r'\s*[-ー]?\s*カクヨム.*$', '', title_tag.text.strip()) if title_tag else "タイトルなし"
+
+    response = requests.get(novel_url)
+    response.raise_for_status()
+    matches = re.findall(r'"__typename":"Episode","id":"(.*?)","title":"(.*?)"', response.text)
+    return title, [(f"{novel_url}/episodes/{ep_id}", ep_title) for ep_id, ep_title in matches]
+
+
+def new_path(novel_url):
+    work = kakuyomu_work.load_work(novel_url, refresh=True)
+    return work.title, [(episode.url, episode.title) for episode in work.episodes]
+
+
+def measure(func, novel_url, rounds, hits):
+    times = []
+    before = len(hits)
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = func(novel_url)
+        times.append(time.perf_counter() - start)
+    return result, times, (len(hits) - before) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--episodes', type=int, default=2000)
+    parser.add_argument('--filler-mb', type=float, default=3.0)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    page = kakuyomu_work_page(WORK_ID, args.episodes, filler_bytes=int(args.filler_mb * 1024 * 1024))
+    page_bytes = page.encode('utf-8')
+    server, hits = serve(page_bytes)
+    novel_url = f'http://127.0.0.1:{server.server_port}/works/{WORK_ID}'
+    print(f'ページサイズ {len(page_bytes) / 1024 / 1024:.1f} MB / {args.episodes} 話 / {args.rounds} 回')
+
+    old_result, old_times, old_fetches = measure(old_path, novel_url, args.rounds, hits)
+    new_result, new_times, new_fetches = measure(new_path, novel_url, args.rounds, hits)
+    server.shutdown()
+
+    print(f"{'方式':<28}{'中央値(ms)':>12}{'最小(ms)':>12}{'取得回数':>10}")
+    for name, times, fetches in (('従来 (title + regex)', old_times, old_fetches),
+                                 ('load_work (JSON 1回)', new_times, new_fetches)):
+        print(f'{name:<28}{statistics.median(times) * 1000:>12.1f}{min(times) * 1000:>12.1f}{fetches:>10.0f}')
+    print(f'速度比: {statistics.median(old_times) / statistics.median(new_times):.2f} 倍')
+
+    # 結果の比較（エスケープを含むタイトルは従来方式が生の \" のまま返すので、そこだけ差が出る）
+    old_title, old_links = old_result
+    new_title, new_links = new_result
+    differing = [i for i, (a, b) in enumerate(zip(old_links, new_links)) if a != b]
+    print(f'タイトル一致: {old_title == new_title} / 話数 従来 {len(old_links)} 新 {len(new_links)} / '
+          f'内容が異なる話 {len(differing)} 件（エスケープを含むタイトル）')
+    if differing:
+        i = differing[0]
+        print(f'  例: 従来 {old_links[i][1]!r} → 新 {new_links[i][1]!r}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+rclone の代わり（ベンチマーク用）。「drive:」をローカルのディレクトリ FAKE_RCLONE_ROOT に読み替えて、
+スクリプトが使う copyto / copy（--files-from-raw）だけをまねます。
+
+bench.bench_e2e が PATH の先頭に「rclone」という名前でこれを呼ぶラッパーを置きます。
+"""
+import os
+import shutil
+import sys
+
+REMOTE_PREFIX = 'drive:'
+
+
+def _local(path):
+    if path.startswith(REMOTE_PREFIX):
+        return os.path.join(os.environ['FAKE_RCLONE_ROOT'], path[len(REMOTE_PREFIX):])
+    return path
+
+
+def _copy_file(src, dst):
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    shutil.copyfile(src, dst)
+
+
+def main(argv):
+    args = [arg for arg in argv if not arg.startswith('--') or arg.startswith('--files-from-raw')]
+    files_from = None
+    if '--files-from-raw' in args:
+        i = args.index('--files-from-raw')
+        files_from = args[i + 1]
+        del args[i:i + 2]
+    if len(args) != 3 or args[0] not in ('copyto', 'copy'):
+        print(f'fake rclone: 対応していない呼び出し: {argv}', file=sys.stderr)
+        return 2
+    command, src, dst = args[0], _local(args[1]), _local(args[2])
+
+    if command == 'copyto':
+        if not os.path.isfile(src):
+            print(f'fake rclone: ファイルがありません: {args[1]}', file=sys.stderr)
+            return 3
+        _copy_file(src, dst)
+        return 0
+
+    if files_from is not None:
+        with open(files_from, 'r', encoding='utf-8') as f:
+            rel_paths = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        rel_paths = [os.path.relpath(os.path.join(root, name), src)
+                     for root, _, names in os.walk(src) for name in names]
+    for rel in rel_paths:
+        if os.path.isfile(os.path.join(src, rel)):
+            _copy_file(os.path.join(src, rel), os.path.join(dst, rel))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
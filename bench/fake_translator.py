@@ -0,0 +1,66 @@
+"""
+翻訳APIの代わりに使う偽のクライアント（common.translate.set_client に渡す）。
+
+latency 秒（±20% の揺らぎ、長い入力ほど少し長く）待ってから、入力と同じくらいの長さの
+「訳文」を返します。failure_rate の割合で例外を投げ、empty_rate の割合で空の応答を返します。
+stream=True なら g4f と同じく1行ずつの断片（choices[0].delta.content）を返し、失敗する場合は
+半分ほど返したところで例外を投げます（長い応答が終わり際に切れる場合の再現）。
+"""
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeCompletions:
+    def __init__(self, latency=0.5, failure_rate=0.0, empty_rate=0.0, per_1k_chars=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.empty_rate = empty_rate
+        self.per_1k_chars = per_1k_chars
+        self.calls = 0
+        self.failures = 0
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, stream=False, **kwargs):
+        text = messages[-1]['content']
+        with self._lock:
+            self.calls += 1
+            jitter = self._rnd.uniform(0.8, 1.2)
+            roll = self._rnd.random()
+        delay = (self.latency + self.per_1k_chars * len(text) / 1000) * jitter
+        failed = roll < self.failure_rate
+        if roll < self.failure_rate + self.empty_rate and not failed:
+            content = ''
+        else:
+            # 1行ごとに「訳した」ことがわかる程度の文字列を返す
+            content = '\n'.join(f'[en] {line}' if line.strip() else '' for line in text.splitlines())
+        if stream:
+            return self._stream(content, delay, failed)
+        time.sleep(delay)
+        if failed:
+            self._fail()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def _fail(self):
+        with self._lock:
+            self.failures += 1
+        raise RuntimeError('fake translator: simulated failure')
+
+    def _stream(self, content, delay, failed):
+        pieces = content.splitlines(keepends=True) or ['']
+        for i, piece in enumerate(pieces):
+            if failed and i >= len(pieces) // 2:
+                self._fail()
+            time.sleep(delay / len(pieces))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+class FakeClient:
+    """
+    g4f の Client と同じ形（client.chat.completions.create）の偽クライアント。
+    """
+
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**kwargs))
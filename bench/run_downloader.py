@@ -0,0 +1,104 @@
+"""
+bench.bench_e2e が子プロセスとして起動する、計測付きのダウンローダー。
+
+common.crawler.crawl をそのまま動かし、翻訳APIだけを bench.fake_translator に差し替えます。
+目次・取得・翻訳・保存の各段の所要時間を記録し、終了時に --stats の JSON に書き出します。
+
+    python -m bench.run_downloader kakuyomu narou --stats out.json --translate-latency 0.3
+"""
+import argparse
+import json
+import resource
+import sys
+import threading
+import time
+
+from bench.fake_translator import FakeClient
+from common import crawler, translate
+from common.sites import SITES
+
+_durations = {}
+_lock = threading.Lock()
+
+
+def timed(stage, func):
+    """
+    func の1回ごとの所要時間を stage の名前で記録するラッパー。
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                _durations.setdefault(stage, []).append(elapsed)
+    return wrapper
+
+
+def percentile(values, p):
+    """
+    最近傍順位法によるパーセンタイル。
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='計測付きでダウンローダーを動かします')
+    parser.add_argument('sites', nargs='+', choices=list(SITES))
+    parser.add_argument('--stats', required=True)
+    parser.add_argument('--translate-latency', type=float, default=0.3)
+    parser.add_argument('--translate-per-1k-chars', type=float, default=0.0)
+    parser.add_argument('--translate-failure-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    fake = FakeClient(latency=args.translate_latency, failure_rate=args.translate_failure_rate,
+                      per_1k_chars=args.translate_per_1k_chars)
+    translate.set_client(fake)
+
+    # 各段を計測用のラッパーで包む（処理の中身は本番と同じ）
+    run_pipeline = crawler.run_pipeline
+
+    def timed_pipeline(items, fetch, translate_, write, **kwargs):
+        return run_pipeline(items, timed('fetch', fetch), timed('translate', translate_),
+                            timed('write', write), **kwargs)
+
+    crawler.run_pipeline = timed_pipeline
+    sites = [SITES[name] for name in args.sites]
+    for site in sites:
+        site.metadata = timed('precheck', site.metadata)
+        site.read_toc = timed('toc', site.read_toc)
+
+    start = time.perf_counter()
+    crawler.crawl(sites)
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for stage, values in _durations.items():
+        stages[stage] = {
+            'count': len(values),
+            'total': sum(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+        }
+    stats = {
+        'sites': args.sites,
+        'wall_seconds': wall,
+        'episodes': len(_durations.get('write', [])),
+        # Linux の ru_maxrss は KB 単位
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'translator_calls': fake.chat.completions.calls,
+        'translator_failures': fake.chat.completions.failures,
+        'stages': stages,
+    }
+    with open(args.stats, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
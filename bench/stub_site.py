@@ -0,0 +1,250 @@
+"""
+カクヨム / 小説家になろう（R18 も同じ形）/ なろう小説API をまねるローカルの HTTP サーバー。
+
+    /works/<作品ID>                       カクヨムの作品ページ（__NEXT_DATA__ 入り）
+    /works/<作品ID>/episodes/<話ID>       カクヨムの話ページ
+    /<ncode>/?p=<ページ>                  なろうの目次（ページ分割あり）
+    /<ncode>/<話数>/                      なろうの話ページ（前書き・後書き付き）
+    /r18/<ncode>/...                      なろうR18（同じ作品を別の本文で。over18=yes の Cookie が必要）
+    /novelapi/api/ , /novel18api/api/     なろう小説API（out=json&of=n-ga-nu&ncode=a-b）
+
+すべてのページに ETag を付け、If-None-Match が一致すれば 304 を返します。
+latency で1リクエストごとの遅延、error_rate で 503（Retry-After: 0）を返す割合を指定できます。
+fail() で特定のパスだけを（決まった回数、または取り消すまで）失敗させられ、
+受けたリクエストのパスは requested に順に残ります（テスト用）。
+
+    python -m bench.stub_site --kakuyomu 3 --narou 3 --episodes 150
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench.synthetic import kakuyomu_episode_page, kakuyomu_work_page, narou_episode_page, narou_toc_page
+
+KAKUYOMU_WORK_RE = re.compile(r'^/works/(\d+)$')
+KAKUYOMU_EPISODE_RE = re.compile(r'^/works/(\d+)/episodes/(\d+)$')
+NAROU_TOC_RE = re.compile(r'^/(n\d+[a-z]+)/?$')
+NAROU_EPISODE_RE = re.compile(r'^/(n\d+[a-z]+)/(\d+)/?$')
+API_RE = re.compile(r'^/novel(?:18)?api/api/?$')
+
+
+class StubSite:
+    """
+    合成した作品の一覧と、それを返す HTTP サーバー。
+
+    kakuyomu_works : {作品ID: 話数}
+    narou_novels   : {ncode: 話数}
+    """
+
+    def __init__(self, kakuyomu_works, narou_novels, paragraphs=60, toc_per_page=100,
+                 work_filler_bytes=200_000, latency=0.0, error_rate=0.0, seed=0):
+        self.kakuyomu_works = kakuyomu_works
+        self.narou_novels = narou_novels
+        self.paragraphs = paragraphs
+        self.toc_per_page = toc_per_page
+        self.work_filler_bytes = work_filler_bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+        self._pages = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.requested = []
+        # パス → [ステータス, 残り回数（None なら取り消すまで）]
+        self._failures = {}
+        self.server = None
+
+    @classmethod
+    def generate(cls, n_kakuyomu, n_narou, episodes, large_episodes=0, **kwargs):
+        """
+        カクヨム n_kakuyomu 作品・なろう n_narou 作品（各 episodes 話）を作ります。
+        large_episodes を指定すると、それぞれ1作品だけその話数の大きな作品にします。
+        """
+        kakuyomu = {}
+        for i in range(n_kakuyomu):
+            kakuyomu[f'1177354054{i:09d}'] = large_episodes if (large_episodes and i == 0) else episodes
+        narou = {}
+        for i in range(n_narou):
+            narou[f'n{1000 + i}bz'] = large_episodes if (large_episodes and i == 0) else episodes
+        return cls(kakuyomu, narou, **kwargs)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def kakuyomu_urls(self):
+        return [f'{self.base_url}/works/{work_id}' for work_id in self.kakuyomu_works]
+
+    def narou_urls(self, r18=False):
+        prefix = '/r18' if r18 else ''
+        return [f'{self.base_url}{prefix}/{ncode}' for ncode in self.narou_novels]
+
+    def fail(self, path, status=503, times=None):
+        """
+        path へのリクエストに status を返します（times 回まで。None なら clear_failures() まで）。
+        """
+        with self._lock:
+            self._failures[path] = [status, times]
+
+    def clear_failures(self):
+        with self._lock:
+            self._failures.clear()
+
+    def _injected_failure(self, path):
+        with self._lock:
+            failure = self._failures.get(path)
+            if failure is None:
+                return None
+            status, remaining = failure
+            if remaining is not None:
+                if remaining <= 1:
+                    del self._failures[path]
+                else:
+                    failure[1] = remaining - 1
+            return status
+
+    def _cached(self, key, build):
+        # 作品ページ・目次は作るのが重いので1回だけ作る（話ページは毎回作る）
+        with self._lock:
+            page = self._pages.get(key)
+        if page is None:
+            page = build().encode('utf-8')
+            with self._lock:
+                self._pages[key] = page
+        return page
+
+    def render(self, path, query, cookie=''):
+        """
+        パスに対応するページを (ステータス, Content-Type, 本文 bytes) で返します。
+        """
+        salt = ''
+        if path.startswith('/r18/'):
+            if 'over18=yes' not in cookie:
+                return 403, 'text/plain; charset=utf-8', b'over18 cookie required'
+            path, salt = path[len('/r18'):], 'r18'
+
+        match = KAKUYOMU_WORK_RE.match(path)
+        if match and match.group(1) in self.kakuyomu_works:
+            work_id = match.group(1)
+            return 200, 'text/html; charset=utf-8', self._cached(path, lambda: kakuyomu_work_page(
+                work_id, self.kakuyomu_works[work_id], title=f'合成作品{work_id[-3:]}',
+                filler_bytes=self.work_filler_bytes, seed=int(work_id[-6:])))
+
+        match = KAKUYOMU_EPISODE_RE.match(path)
+        if match and match.group(1) in self.kakuyomu_works:
+            page = kakuyomu_episode_page(self.paragraphs, seed=int(match.group(2)))
+            return 200, 'text/html; charset=utf-8', page.encode('utf-8')
+
+        match = NAROU_TOC_RE.match(path)
+        if match and match.group(1) in self.narou_novels:
+            ncode = match.group(1)
+            page = int((query.get('p') or ['1'])[0])
+            return 200, 'text/html; charset=utf-8', self._cached(f'{salt}{path}?p={page}', lambda: narou_toc_page(
+                ncode, f'合成なろう{salt.upper()}作品 {ncode}', self.narou_novels[ncode], page, self.toc_per_page))
+
+        match = NAROU_EPISODE_RE.match(path)
+        if match and match.group(1) in self.narou_novels:
+            index = int(match.group(2))
+            if 1 <= index <= self.narou_novels[match.group(1)]:
+                page = narou_episode_page(self.paragraphs, preface=index % 3 == 0, afterword=index % 2 == 0,
+                                          seed=f'{salt}{match.group(1)}-{index}')
+                return 200, 'text/html; charset=utf-8', page.encode('utf-8')
+
+        if API_RE.match(path):
+            ncodes = (query.get('ncode') or [''])[0].lower().split('-')
+            rows = [{'ncode': ncode.upper(), 'general_all_no': self.narou_novels[ncode],
+                     'novelupdated_at': '2024-02-01 00:00:00'}
+                    for ncode in ncodes if ncode in self.narou_novels]
+            body = json.dumps([{'allcount': len(rows)}] + rows).encode('utf-8')
+            return 200, 'application/json; charset=utf-8', body
+
+        return 404, 'text/plain; charset=utf-8', b'not found'
+
+    def start(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                with site._lock:
+                    site.hits += 1
+                    site.requested.append(url.path)
+                    fail = site.error_rate and site._rnd.random() < site.error_rate
+                injected = site._injected_failure(url.path)
+                if site.latency:
+                    time.sleep(site.latency)
+                if fail or injected:
+                    with site._lock:
+                        site.errors += 1
+                    self._send(injected or 503, 'text/plain; charset=utf-8', b'busy', {'Retry-After': '0'})
+                    return
+
+                status, content_type, body = site.render(url.path, parse_qs(url.query),
+                                                         self.headers.get('Cookie', ''))
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    with site._lock:
+                        site.not_modified += 1
+                    self._send(304, content_type, b'', {'ETag': etag})
+                    return
+                self._send(status, content_type, body, {'ETag': etag} if status == 200 else {})
+
+            def _send(self, status, content_type, body, headers):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ローカルのスタブサイトを起動します')
+    parser.add_argument('--kakuyomu', type=int, default=3)
+    parser.add_argument('--narou', type=int, default=3)
+    parser.add_argument('--episodes', type=int, default=150)
+    parser.add_argument('--large-episodes', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    site = StubSite.generate(args.kakuyomu, args.narou, args.episodes, args.large_episodes,
+                             latency=args.latency, error_rate=args.error_rate).start()
+    print(f'起動しました: {site.base_url}')
+    for url in site.kakuyomu_urls() + site.narou_urls():
+        print(url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
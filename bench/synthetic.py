@@ -0,0 +1,161 @@
+"""
+ベンチマーク用の合成ページ（カクヨム作品ページ・話ページなど）を作ります。
+実サイトの構造のうち、ダウンロードスクリプトが読む部分だけを再現しています。
+"""
+import json
+import random
+
+
+def kakuyomu_work_page(work_id, n_episodes, title='合成作品', filler_bytes=2_000_000, seed=0):
+    """
+    __NEXT_DATA__（Apollo の状態 JSON）を埋め込んだカクヨムの作品ページを返します。
+    filler_bytes ぶん、実ページと同じように関係のないデータで水増しします。
+    """
+    rnd = random.Random(seed)
+    state = {}
+    toc = []
+    per_chapter = 50
+    for c in range((n_episodes + per_chapter - 1) // per_chapter):
+        chapter_id = f'{work_id}{c:04d}'
+        state[f'Chapter:{chapter_id}'] = {
+            '__typename': 'Chapter', 'id': chapter_id, 'level': 1, 'title': f'第{c + 1}章',
+        }
+        refs = []
+        for e in range(c * per_chapter, min(n_episodes, (c + 1) * per_chapter)):
+            episode_id = f'{work_id}{e:06d}'
+            # 一部のタイトルにエスケープが必要な文字を混ぜる
+            ep_title = f'第{e + 1}話 "引用" と \\ 記号' if e % 97 == 3 else f'第{e + 1}話 {rnd.randint(0, 10**6)}'
+            state[f'Episode:{episode_id}'] = {
+                '__typename': 'Episode', 'id': episode_id, 'title': ep_title,
+                'publishedAt': f'2024-01-{e % 28 + 1:02d}T00:00:00Z',
+            }
+            refs.append({'__ref': f'Episode:{episode_id}'})
+        state[f'TableOfContentsChapter:{chapter_id}'] = {
+            '__typename': 'TableOfContentsChapter',
+            'chapter': {'__ref': f'Chapter:{chapter_id}'},
+            'episodeUnions': refs,
+        }
+        toc.append({'__ref': f'TableOfContentsChapter:{chapter_id}'})
+    state[f'Work:{work_id}'] = {
+        '__typename': 'Work', 'id': work_id, 'title': title,
+        'publicEpisodeCount': n_episodes,
+        'lastEpisodePublishedAt': '2024-02-01T00:00:00Z',
+        'tableOfContents': toc,
+    }
+    # 作品と関係のない大きなデータ（おすすめ作品など）
+    n = 0
+    while len(json.dumps(state, ensure_ascii=False).encode('utf-8')) < filler_bytes:
+        for _ in range(500):
+            state[f'Recommendation:{n}'] = {'__typename': 'Recommendation', 'text': 'あ' * 200, 'n': n}
+            n += 1
+    # 実ページと同じく空白なしの JSON
+    next_data = json.dumps({'props': {'pageProps': {'__APOLLO_STATE__': state}}},
+                           ensure_ascii=False, separators=(',', ':'))
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f'<title>{title}（合成作者） - カクヨム</title></head><body><div id="__next"></div>'
+        f'<script id="__NEXT_DATA__" type="application/json">{next_data}</script>'
+        '</body></html>'
+    )
+
+
+def _paragraph(rnd, n):
+    """
+    ルビ・傍点・記号・実体参照などを混ぜた1段落。
+    """
+    pieces = ['　']
+    for _ in range(rnd.randint(1, 4)):
+        kind = rnd.random()
+        if kind < 0.15:
+            pieces.append('<ruby>魔法<rp>(</rp><rt>まほう</rt><rp>)</rp></ruby>')
+        elif kind < 0.25:
+            pieces.append('<em class="emphasisDots"><span>本</span><span>当</span></em>')
+        elif kind < 0.3:
+            pieces.append('&amp;&lt;剣&gt;&quot;&#x2F;&nbsp;')
+        pieces.append('あいうえお漢字カタカナ' * rnd.randint(1, 6) + '。')
+    if n % 11 == 0:
+        pieces.insert(0, '「')
+        pieces.append('」')
+    return ''.join(pieces)
+
+
+def kakuyomu_episode_page(n_paragraphs, seed=0):
+    """
+    カクヨムの話ページ（div.widget-episodeBody）。
+    """
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(1, n_paragraphs + 1):
+        if rnd.random() < 0.2:
+            lines.append(f'<p id="p{i}" class="blank"><br /></p>')
+        else:
+            lines.append(f'<p id="p{i}">{_paragraph(rnd, i)}</p>')
+    body = '\n'.join(lines)
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="UTF-8"><title>第1話 - 合成作品 - カクヨム</title>'
+        '<script>window.dataLayer = [];</script></head><body>'
+        '<header class="widget-episodeTitle"><p class="widget-episodeTitle js-vertical-composition-item">第1話</p></header>'
+        '<div class="widget-episode js-episode-body-container"><div class="widget-episode-inner">'
+        f'<div class="widget-episodeBody js-episode-body" data-viewer-history-path="/works/1/episodes/2">\n{body}\n'
+        '<!-- 広告 --></div></div></div>'
+        '<footer><p>© KADOKAWA</p></footer></body></html>'
+    )
+
+
+def narou_episode_page(n_paragraphs, preface=True, afterword=True, seed=0):
+    """
+    小説家になろうの話ページ（.p-novel__body の中に前書き・本文・後書き）。
+    """
+    rnd = random.Random(seed)
+
+    def block(prefix, n, extra_class=''):
+        lines = []
+        for i in range(1, n + 1):
+            if rnd.random() < 0.2:
+                lines.append(f'<p id="{prefix}{i}"><br /></p>')
+            else:
+                lines.append(f'<p id="{prefix}{i}">{_paragraph(rnd, i)}</p>')
+        cls = f'js-novel-text p-novel__text{extra_class}'
+        return f'<div class="{cls}">\n' + '\n'.join(lines) + '\n</div>'
+
+    parts = []
+    if preface:
+        parts.append(block('Lp', 3, ' p-novel__text--preface'))
+    parts.append(block('L', n_paragraphs))
+    if afterword:
+        parts.append(block('La', 4, ' p-novel__text--afterword'))
+    return (
+        '<!DOCTYPE html>\n<html lang="ja">\n<head>\n<meta charset="UTF-8">\n<title>合成作品 - 第1話</title>\n'
+        '<script type="text/javascript">var x = "<p>";</script>\n</head>\n<body>\n'
+        '<div class="l-container"><article class="p-novel">\n'
+        '<h1 class="p-novel__title p-novel__title--rensai">第1話</h1>\n'
+        '<div class="p-novel__body">\n' + '\n'.join(parts) + '\n</div>\n'
+        '</article></div>\n</body>\n</html>\n'
+    )
+
+
+def narou_toc_page(ncode, title, n_episodes, page, per_page=100):
+    """
+    小説家になろうの目次ページ（per_page 話ごとにページ分割、「次へ」「最後へ」リンク付き）。
+    """
+    last_page = max(1, (n_episodes + per_page - 1) // per_page)
+    first = (page - 1) * per_page + 1
+    items = []
+    for n in range(first, min(n_episodes, page * per_page) + 1):
+        items.append(
+            '<div class="p-eplist__sublist">'
+            f'<a href="/{ncode}/{n}/" class="p-eplist__subtitle">\n第{n}話 合成サブタイトル\n</a>'
+            f'<div class="p-eplist__update">2024/01/{n % 28 + 1:02d} 00:00</div></div>'
+        )
+    pager = []
+    if page < last_page:
+        pager.append(f'<a href="/{ncode}/?p={page + 1}" class="c-pager__item c-pager__item--next">次へ</a>')
+        pager.append(f'<a href="/{ncode}/?p={last_page}" class="c-pager__item c-pager__item--last">最後へ</a>')
+    return (
+        '<!DOCTYPE html>\n<html lang="ja">\n<head>\n<meta charset="UTF-8">\n'
+        f'<title>{title}</title>\n</head>\n<body>\n<div class="l-container"><article class="p-novel">\n'
+        f'<h1 class="p-novel__title">{title}</h1>\n'
+        '<div class="p-eplist">\n' + '\n'.join(items) + '\n</div>\n'
+        '<div class="c-pager">' + ''.join(pager) + '</div>\n'
+        '</article></div>\n</body>\n</html>\n'
+    )
@@ -0,0 +1,70 @@
+"""
+話の索引（common.episode_index）による差分取得のテスト。
+スタブサーバー・偽の rclone・偽の翻訳APIでダウンローダーを子プロセスとして2回動かし、2回目に取得した話を確かめます。
+
+    python -m unittest bench.test_episode_index
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from bench.bench_e2e import downloader_env, prepare_root, run_downloader, write_lines
+from bench.stub_site import StubSite
+from common.history import HistoryStore
+
+HISTORY_FILE = '小説家になろうダウンロード経歴.txt'
+
+
+class EpisodeDiffTest(unittest.TestCase):
+    EPISODES = 20
+
+    def setUp(self):
+        self.site = StubSite.generate(0, 1, self.EPISODES, paragraphs=5).start()
+        self.ncode = next(iter(self.site.narou_novels))
+        self.url = self.site.narou_urls()[0]
+        self.root = tempfile.mkdtemp(prefix='test-diff-')
+        self.work_dir = os.path.join(self.root, 'work')
+        self.drive_dir = os.path.join(self.root, 'drive')
+        os.makedirs(self.work_dir)
+        os.makedirs(self.drive_dir)
+        prepare_root(self.root, [], [self.url], [])
+
+    def tearDown(self):
+        self.site.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_once(self):
+        """
+        ダウンローダーを1回動かし、そのあいだに取得した話の番号を返します。
+        """
+        env = downloader_env(self.site, self.root, self.work_dir, self.drive_dir, '4:100:200')
+        env.update({'RETRY_BASE_DELAY': '0.01', 'EPISODE_RETRIES': '1', 'FETCH_RETRIES': '1'})
+        start = len(self.site.requested)
+        result = run_downloader(['narou'], env, os.path.join(self.root, 'stats.json'))
+        self.assertEqual(result.returncode, 0, result.stdout[-2000:])
+        prefix = f'/{self.ncode}/'
+        fetched = [path[len(prefix):].strip('/') for path in self.site.requested[start:] if path.startswith(prefix)]
+        return sorted({int(index) for index in fetched if index.isdigit()})
+
+    def history(self):
+        return HistoryStore._parse(os.path.join(self.work_dir, HISTORY_FILE))[self.url]
+
+    def test_legacy_history_survives_failed_first_run(self):
+        # 話の索引ができる前の履歴（10話まで取得済み）から始め、13話が取れない
+        write_lines(os.path.join(self.drive_dir, HISTORY_FILE), [f'{self.url} | 10'])
+        self.site.fail(f'/{self.ncode}/13/', 404)
+        self.assertEqual(self.run_once()[:3], [11, 12, 13])
+        self.assertEqual(self.history(), 12)
+
+        self.site.clear_failures()
+        self.assertEqual(self.run_once(), list(range(13, self.EPISODES + 1)))
+        self.assertEqual(self.history(), self.EPISODES)
+
+    def test_nothing_refetched_when_up_to_date(self):
+        self.assertEqual(self.run_once(), list(range(1, self.EPISODES + 1)))
+        self.assertEqual(self.run_once(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
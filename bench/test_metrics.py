@@ -0,0 +1,41 @@
+"""
+計測（common.metrics）の Prometheus 出力のテスト。
+
+    python -m unittest bench.test_metrics
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from common import metrics
+
+
+class PrometheusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-metrics-')
+        self.path = os.path.join(self.tmp, 'novel_download.prom')
+        patches = [mock.patch.object(metrics, 'METRICS_LOG', ''), mock.patch.object(metrics, '_gauges', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_per_novel_gauges_become_one_series(self):
+        for i in range(3):
+            with metrics.labels(site='narou', novel=f'n{i}'):
+                metrics.gauge('queue_depth', i + 1, queue='translate')
+        metrics.write_prometheus(self.path)
+        with open(self.path, 'r', encoding='utf-8') as f:
+            lines = [line for line in f.read().splitlines() if not line.startswith('#')]
+        series = [line.rpartition(' ')[0] for line in lines]
+        self.assertEqual(len(series), len(set(series)))
+        self.assertIn('novel_queue_depth_max{queue="translate",site="narou"} 3', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
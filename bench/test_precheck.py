@@ -0,0 +1,157 @@
+"""
+事前チェック（common.precheck）のテスト。スタブサーバー（bench.stub_site）と偽の rclone を使い、
+実サイト・Google Drive には接続しません。
+
+- なろう小説API の ncode 複数指定（バッチ分割・API が返さない作品・問い合わせの失敗）
+- カクヨムの作品ページからの作品情報
+- filter_changed の判定と、NovelStateIndex の記録・Drive との同期
+- 更新のない2回目の実行が、API への問い合わせだけで終わること
+
+    python -m unittest bench.test_precheck
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bench.bench_e2e import downloader_env, make_fake_rclone, prepare_root, run_downloader
+from bench.stub_site import StubSite
+from common import precheck, session
+from common.precheck import NovelStateIndex, filter_changed, kakuyomu_metadata, narou_metadata
+
+
+class MetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.site = StubSite.generate(2, 5, 7, paragraphs=5, work_filler_bytes=1000).start()
+        self.tmp = tempfile.mkdtemp(prefix='test-precheck-')
+        patches = [mock.patch.object(session, 'HTTP_CACHE_DIR', self.tmp),
+                   mock.patch.object(session, 'RETRY_BASE_DELAY', 0.01)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.api_url = f'{self.site.base_url}/novelapi/api/'
+
+    def tearDown(self):
+        self.site.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def api_requests(self):
+        return self.site.requested.count('/novelapi/api/')
+
+    def test_narou_batches_ncodes(self):
+        urls = self.site.narou_urls() + [f'{self.site.base_url}/n9999zz']
+        with mock.patch.object(precheck, 'API_BATCH', 2):
+            result = narou_metadata(urls, api_url=self.api_url)
+        # 6 作品を2件ずつ → 3 リクエスト
+        self.assertEqual(self.api_requests(), 3)
+        # API が返さなかった作品は含めない（filter_changed で変更ありになる）
+        self.assertEqual(set(result), set(self.site.narou_urls()))
+        for meta in result.values():
+            self.assertEqual(meta, {'count': 7, 'updated_at': '2024-02-01 00:00:00'})
+
+    def test_narou_failed_batch_is_left_out(self):
+        self.site.fail('/novelapi/api/', 500)
+        with mock.patch.object(session, 'FETCH_RETRIES', 0):
+            self.assertEqual(narou_metadata(self.site.narou_urls(), api_url=self.api_url), {})
+
+    def test_kakuyomu_work_pages(self):
+        result = kakuyomu_metadata(self.site.kakuyomu_urls())
+        self.assertEqual(set(result), set(self.site.kakuyomu_urls()))
+        for meta in result.values():
+            self.assertEqual(meta['count'], 7)
+            self.assertTrue(meta['updated_at'])
+        # 2回目は条件付き GET（304）
+        kakuyomu_metadata(self.site.kakuyomu_urls())
+        self.assertEqual(self.site.not_modified, 2)
+
+
+class FilterChangedTest(unittest.TestCase):
+
+    def test_only_changed_works_in_original_order(self):
+        meta = {'count': 10, 'updated_at': '2024-01-01 00:00:00'}
+        metadata = {'same': meta, 'more': dict(meta, count=11), 'updated': dict(meta, updated_at='2024-01-02 00:00:00'),
+                    'new': meta}
+        history = {'same': 10, 'more': 10, 'updated': 10, 'new': 10, 'unknown': 10}
+        state = {url: meta for url in ('same', 'more', 'updated', 'unknown')}
+        urls = ['unknown', 'same', 'more', 'updated', 'new']
+        self.assertEqual(filter_changed(urls, metadata, history, state), ['unknown', 'more', 'updated', 'new'])
+
+
+class NovelStateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-state-')
+        self.drive = os.path.join(self.tmp, 'drive')
+        os.makedirs(self.drive)
+        make_fake_rclone(os.path.join(self.tmp, 'bin'))
+        patch = mock.patch.dict(os.environ, {'PATH': f'{os.path.join(self.tmp, "bin")}{os.pathsep}{os.environ["PATH"]}',
+                                             'FAKE_RCLONE_ROOT': self.drive})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def open(self, name, shared=False):
+        return NovelStateIndex(os.path.join(self.tmp, name), 'drive:state.json', shared=shared)
+
+    def test_records_changes_and_syncs_with_drive(self):
+        state = self.open('a.json')
+        with mock.patch('time.time', return_value=1000.0):
+            state.mark('url', {'count': 1, 'updated_at': 'A'})
+        with mock.patch('time.time', return_value=1600.0):
+            state.mark('url', {'count': 2, 'updated_at': 'B'})
+            state.mark('url', {'count': 2, 'updated_at': 'B'})
+        self.assertEqual(state.get('url'), {'count': 2, 'updated_at': 'B', 'changed_at': 1600.0, 'interval': 600.0})
+        state.save()
+        self.assertTrue(os.path.exists(os.path.join(self.drive, 'state.json')))
+
+        # ローカルにないときは Drive から取る
+        self.assertEqual(self.open('b.json').get('url'), state.get('url'))
+
+    def test_shared_save_keeps_other_nodes_entries(self):
+        first = self.open('a.json', shared=True)
+        second = self.open('b.json', shared=True)
+        first.mark('one', {'count': 1, 'updated_at': 'A'})
+        first.save()
+        second.mark('two', {'count': 2, 'updated_at': 'B'})
+        second.save()
+        merged = self.open('c.json', shared=True)
+        self.assertEqual(merged.get('one')['count'], 1)
+        self.assertEqual(merged.get('two')['count'], 2)
+
+
+class UnchangedRunTest(unittest.TestCase):
+    """
+    ダウンローダーを子プロセスで2回動かし、更新がなければ2回目は API への問い合わせだけになることを確かめます。
+    """
+
+    def setUp(self):
+        self.site = StubSite.generate(0, 3, 5, paragraphs=5).start()
+        self.root = tempfile.mkdtemp(prefix='test-precheck-run-')
+        self.work_dir = os.path.join(self.root, 'work')
+        self.drive_dir = os.path.join(self.root, 'drive')
+        os.makedirs(self.work_dir)
+        os.makedirs(self.drive_dir)
+        prepare_root(self.root, [], self.site.narou_urls(), [])
+
+    def tearDown(self):
+        self.site.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_once(self):
+        env = downloader_env(self.site, self.root, self.work_dir, self.drive_dir, '4:100:200')
+        start = len(self.site.requested)
+        result = run_downloader(['narou'], env, os.path.join(self.root, 'stats.json'))
+        self.assertEqual(result.returncode, 0, result.stdout[-2000:])
+        return self.site.requested[start:]
+
+    def test_second_run_only_asks_the_api(self):
+        self.assertGreater(len(self.run_once()), 3 * 5)
+        self.assertEqual(self.run_once(), ['/novelapi/api/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
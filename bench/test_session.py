@@ -0,0 +1,64 @@
+"""
+HTTP アクセス（common.session）のテスト。スタブサーバー（bench.stub_site）を使います。
+
+- 条件付き GET（304 なら前回の解析結果を使う）
+- 429 / 5xx の再試行と、再試行の上限
+
+    python -m unittest bench.test_session
+"""
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bench.stub_site import StubSite
+from common import session
+
+
+class SessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.site = StubSite.generate(0, 1, 5, paragraphs=5).start()
+        self.ncode = next(iter(self.site.narou_novels))
+        self.tmp = tempfile.mkdtemp(prefix='test-session-')
+        patches = [mock.patch.object(session, 'HTTP_CACHE_DIR', self.tmp),
+                   mock.patch.object(session, 'RETRY_BASE_DELAY', 0.01)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.site.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_not_modified_reuses_parsed_result(self):
+        url = f'{self.site.base_url}/{self.ncode}/'
+        parsed = []
+
+        def parse(response):
+            parsed.append(url)
+            return len(response.text)
+
+        first = session.fetch_cached(url, parse, name='toc')
+        second = session.fetch_cached(url, parse, name='toc')
+        self.assertEqual(first, second)
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual(self.site.not_modified, 1)
+
+    def test_retries_server_errors(self):
+        path = f'/{self.ncode}/1/'
+        self.site.fail(path, 503, times=2)
+        response = session.fetch(self.site.base_url + path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.site.requested.count(path), 3)
+
+    def test_gives_up_after_retries(self):
+        path = f'/{self.ncode}/2/'
+        self.site.fail(path, 500)
+        response = session.fetch(self.site.base_url + path, retries=1)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.site.requested.count(path), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
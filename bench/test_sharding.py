@@ -0,0 +1,44 @@
+"""
+分担モードのリース（common.sharding）のテスト。
+
+    python -m unittest bench.test_sharding
+"""
+import shutil
+import tempfile
+import time
+import unittest
+
+from common import sharding
+
+
+class LeaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-lease-')
+        self.a = sharding.LeaseStore(self.tmp, node_id='a', ttl=0.3)
+        self.b = sharding.LeaseStore(self.tmp, node_id='b', ttl=0.3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_busy_until_expired_then_taken_over(self):
+        lease = self.a.acquire('url')
+        with self.assertRaises(sharding.LeaseBusy) as busy:
+            self.b.acquire('url')
+        self.assertEqual(busy.exception.holder, 'a')
+        self.assertTrue(self.a.renew(lease))
+
+        time.sleep(0.4)
+        taken = self.b.acquire('url')
+        self.assertEqual(taken.taken_over_from, 'a')
+        self.assertFalse(self.a.renew(lease))
+        self.assertFalse(lease.valid())
+        # 引き継がれたあとの release はほかのノードのリースを消さない
+        self.a.release(lease)
+        self.assertEqual(self.b.holder('url')['node'], 'b')
+        self.b.release(taken)
+        self.assertIsNone(self.b.holder('url'))
+
+
+if __name__ == '__main__':
+    unittest.main()
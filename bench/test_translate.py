@@ -0,0 +1,70 @@
+"""
+翻訳（common.translate）のテスト。
+
+- チャンク分割
+- 古いチェックポイントの整理
+
+    python -m unittest bench.test_translate
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from common import translate
+from common.translate import estimate_tokens, prune_checkpoints, split_into_chunks
+
+
+class ChunkLimitTest(unittest.TestCase):
+
+    def test_chunks_stay_within_limit_and_rejoin(self):
+        rnd = random.Random(0)
+        pieces = ['。', '「', '」', 'abc ', '\n', '\n\n', '\n◇◇◇\n', '長い文章の一部', 'x' * 40]
+        for _ in range(300):
+            text = ''.join(rnd.choice(pieces) * rnd.randint(1, 30) for _ in range(rnd.randint(1, 60)))
+            max_tokens = rnd.randint(5, 200)
+            chunks = split_into_chunks(text, max_tokens)
+            self.assertEqual(''.join(chunks), text)
+            for chunk in chunks:
+                self.assertLessEqual(estimate_tokens(chunk), max_tokens)
+
+    def test_prefers_scene_break(self):
+        text = 'あ' * 60 + '\n' + 'い' * 30 + '\n\n◇\n\n' + 'う' * 30 + '\n'
+        first = split_into_chunks(text, 100)[0]
+        self.assertTrue(first.endswith('い' * 30 + '\n\n'), first)
+
+
+class PruneCheckpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-partial-')
+        patch = mock.patch.object(translate, 'PARTIAL_DIR', os.path.join(self.tmp, 'translate.partial'))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def make(self, key, age_days):
+        path = os.path.join(translate.PARTIAL_DIR, key)
+        os.makedirs(path)
+        with open(os.path.join(path, '000-0000.txt'), 'w', encoding='utf-8') as f:
+            f.write('translated')
+        mtime = time.time() - age_days * 86400
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_removes_only_stale_episodes(self):
+        self.assertEqual(prune_checkpoints(), 0)
+        stale = self.make('stale', 30)
+        fresh = self.make('fresh', 1)
+        self.assertEqual(prune_checkpoints(7), 1)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+翻訳バックエンドのプール（common.translation_pool）のヘッジのテスト。
+
+    python -m unittest bench.test_translation_pool
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from common import translation_pool
+from common.translation_pool import Backend, BackendPool
+
+
+class HedgeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = BackendPool([Backend('a'), Backend('b')])
+        patch = mock.patch.object(translation_pool, 'HEDGE_DEFAULT_DELAY', 0.2)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def call(self, delays):
+        def call(backend, messages):
+            time.sleep(delays[backend.model])
+            return backend.model
+        return call
+
+    def test_slow_backend_is_hedged(self):
+        self.assertEqual(self.pool.request([], self.call({'a': 1.0, 'b': 0.0})), 'b')
+        self.assertEqual((self.pool.hedges, self.pool.hedge_wins), (1, 1))
+
+    def test_waiting_for_a_thread_does_not_count(self):
+        # スレッドが1本しかなく、ほかのリクエストが使っている間は送り始めていないのでヘッジしない
+        self.pool._executor = ThreadPoolExecutor(max_workers=1)
+        busy = threading.Event()
+        self.pool._executor.submit(busy.wait, 0.5)
+        self.assertEqual(self.pool.request([], self.call({'a': 0.05, 'b': 0.05})), 'a')
+        self.assertEqual(self.pool.hedges, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+翻訳待ちキュー（common.translation_queue）のテスト。
+
+    python -m unittest bench.test_translation_queue
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from common import crawler
+from common.episode_index import EpisodeIndex, body_hash
+from common.translation_queue import TranslationQueue
+
+
+class TranslationQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-queue-')
+        self.path = os.path.join(self.tmp, 'queue.sqlite3')
+        self.queue = TranslationQueue(self.path, 'drive:unused.sqlite3')
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_claim_complete_and_retry(self):
+        for episode in (1, 2):
+            self.queue.enqueue('narou', 'url', episode, f'第{episode}話', f'en/{episode}.txt', '本文')
+        first = self.queue.claim({'narou'})
+        second = self.queue.claim({'narou'})
+        self.assertEqual({first.episode, second.episode}, {1, 2})
+        self.assertIsNone(self.queue.claim({'narou'}))
+        self.assertIsNone(self.queue.claim({'kakuyomu'}))
+
+        self.queue.complete(first)
+        self.assertGreater(self.queue.retry(second, 'timeout'), 0)
+        # 再試行の時刻まではもう一度取り出さない
+        self.assertIsNone(self.queue.claim({'narou'}))
+        self.assertGreater(self.queue.next_due(['narou']), time.time())
+        stats = self.queue.stats()
+        self.assertEqual((stats['pending'], stats['done'], stats['max_attempts']), (1, 1, 1))
+
+    def test_running_jobs_return_to_pending_after_crash(self):
+        self.queue.enqueue('narou', 'url', 1, '第1話', 'en/1.txt', '本文')
+        self.assertIsNotNone(self.queue.claim({'narou'}))
+        self.queue.close()
+        reopened = TranslationQueue(self.path, 'drive:unused.sqlite3')
+        try:
+            job = reopened.claim({'narou'})
+            self.assertEqual((job.episode, job.body), (1, '本文'))
+        finally:
+            reopened.close()
+
+    def test_requeued_job_survives_old_worker(self):
+        self.queue.enqueue('narou', 'url', 1, '第1話', 'en/1.txt', '古い本文')
+        old = self.queue.claim({'narou'})
+        # 取り出し中に改稿された本文で入れ直される
+        self.queue.enqueue('narou', 'url', 1, '第1話', 'en/1.txt', '新しい本文')
+        self.queue.complete(old)
+        self.queue.retry(old, 'timeout')
+        job = self.queue.claim({'narou'})
+        self.assertEqual((job.body, job.attempts), ('新しい本文', 0))
+
+    def test_discard_after_inline_translation(self):
+        self.queue.enqueue('narou', 'url', 1, '第1話', 'en/1.txt', '本文')
+        self.queue.discard('narou', 'url', 1)
+        self.assertIsNone(self.queue.claim({'narou'}))
+        self.assertEqual(self.queue.stats()['dropped'], 1)
+
+
+class StaleJobTest(unittest.TestCase):
+    """
+    その位置の話が変わった翻訳待ちのジョブは、英訳ファイルを書かずに取り消されること。
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='test-stale-')
+        self.queue = TranslationQueue(os.path.join(self.tmp, 'queue.sqlite3'), 'drive:unused.sqlite3')
+        index_path = os.path.join(self.tmp, 'index.sqlite3')
+        open(index_path, 'w').close()
+        self.index = EpisodeIndex(index_path, 'drive:unused.sqlite3')
+        storage = mock.Mock()
+        self.run = SimpleNamespace(site=SimpleNamespace(name='narou', download_dir=self.tmp),
+                                   index=self.index, storage=storage)
+        patch = mock.patch.object(crawler, 'translation_queue', self.queue)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.queue.close()
+        self.index.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_job_for_replaced_episode_is_dropped(self):
+        self.queue.enqueue('narou', 'url', 3, '第3話', 'en/3.txt', '挿入前の3話')
+        # 2話の後ろに話が挿入され、3話の位置には別の話が入った
+        self.index.record('url', '/n1/4/', 3, '挿入された話', None, body_hash('挿入された話の本文'))
+        crawler.translate_job(self.run, self.queue.claim({'narou'}))
+        self.run.storage.write.assert_not_called()
+        self.assertEqual(self.queue.stats()['dropped'], 1)
+        self.assertIsNone(self.queue.claim({'narou'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+常駐モード（common.watch）のテスト。
+
+- 問い合わせ間隔
+- Ctrl+C で、処理中の作品を終えてから閉じること（スタブサーバー・偽の rclone・偽の翻訳APIを使う）
+
+    python -m unittest bench.test_watch
+"""
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from bench.bench_e2e import REPO_DIR, downloader_env, prepare_root
+from bench.stub_site import StubSite
+from common.history import HistoryStore
+from common.watch import WATCH_MAX_POLL, WATCH_MIN_POLL, poll_interval
+
+# 偽の翻訳APIで常駐モードを動かす子プロセス
+WATCH_SCRIPT = """
+from bench.fake_translator import FakeClient
+from common import translate
+from common.sites import SITES
+from common.watch import watch
+translate.set_client(FakeClient(latency=0.2))
+print('started', flush=True)
+watch([SITES['narou']])
+"""
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+
+class PollIntervalTest(unittest.TestCase):
+    NOW = 2_000_000_000.0
+
+    def daily(self, hours_since_change):
+        return {'updated_at': None, 'changed_at': self.NOW - hours_since_change * HOUR, 'interval': DAY}
+
+    def test_daily_work_is_polled_often_around_the_expected_update(self):
+        for hours in (23.9, 24.0, 24.2):
+            self.assertEqual(poll_interval(self.daily(hours), self.NOW), WATCH_MIN_POLL, hours)
+        # 更新の直後は間を空け、見込み時刻に近づくほど詰める
+        delays = [poll_interval(self.daily(hours), self.NOW) for hours in (1, 12, 20, 23)]
+        self.assertEqual(delays, sorted(delays, reverse=True))
+        self.assertLessEqual(poll_interval(self.daily(23), self.NOW), HOUR / 2)
+
+    def test_polls_never_skip_past_the_expected_update(self):
+        now = self.NOW
+        state = self.daily(0)
+        while now < state['changed_at'] + DAY - WATCH_MIN_POLL:
+            now += poll_interval(state, now)
+        self.assertLessEqual(now, state['changed_at'] + DAY)
+
+    def test_dormant_work_is_polled_daily(self):
+        state = {'updated_at': '2019-05-01 10:00:00', 'changed_at': self.NOW - 60, 'interval': None}
+        self.assertEqual(poll_interval(state, self.NOW), WATCH_MAX_POLL)
+        state['interval'] = 30 * DAY
+        self.assertEqual(poll_interval(state, self.NOW), WATCH_MAX_POLL)
+
+
+class InterruptTest(unittest.TestCase):
+    EPISODES = 30
+
+    def setUp(self):
+        self.site = StubSite.generate(0, 2, self.EPISODES, paragraphs=5).start()
+        self.root = tempfile.mkdtemp(prefix='test-watch-')
+        self.work_dir = os.path.join(self.root, 'work')
+        self.drive_dir = os.path.join(self.root, 'drive')
+        os.makedirs(self.work_dir)
+        os.makedirs(self.drive_dir)
+        prepare_root(self.root, [], self.site.narou_urls(), [])
+
+    def tearDown(self):
+        self.site.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_ctrl_c_finishes_novels_in_progress(self):
+        env = downloader_env(self.site, self.root, self.work_dir, self.drive_dir, '4:100:200')
+        process = subprocess.Popen([sys.executable, '-c', WATCH_SCRIPT], cwd=REPO_DIR, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        self.assertEqual(process.stdout.readline().strip(), 'started')
+        # 話の取得が始まってから Ctrl+C
+        deadline = time.monotonic() + 30
+        while not any(path.count('/') > 2 for path in self.site.requested) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        process.send_signal(signal.SIGINT)
+        output, _ = process.communicate(timeout=120)
+        self.assertEqual(process.returncode, 0, output[-3000:])
+        self.assertNotIn('Traceback', output)
+        self.assertNotIn('エラー発生', output)
+        # 処理中だった作品は最後まで保存され、履歴にも残る
+        history = HistoryStore._parse(os.path.join(self.work_dir, '小説家になろうダウンロード経歴.txt'))
+        self.assertTrue(history)
+        self.assertTrue(all(last == self.EPISODES for last in history.values()), history)
+
+
+if __name__ == '__main__':
+    unittest.main()
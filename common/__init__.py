@@ -0,0 +1,3 @@
+"""
+カクヨム / 小説家になろう / なろうR18 の各ダウンロードスクリプトで共有する処理。
+"""
@@ -0,0 +1,98 @@
+"""
+前書き・後書き（作者の挨拶・宣伝・更新のお知らせなど）と本文の切り分け。
+
+以前は前書き・後書きも本文と一緒に翻訳APIへ送り、システムプロンプトで「訳さずに捨てる」よう
+頼んでいたため、捨てられる分まで送信・待ち時間・料金がかかっていました。
+ここで本文から切り離し、翻訳には本文だけを送ります。前書き・後書きは <話数>.txt と並ぶ
+notes/<話数>.txt に原文のまま残します。
+
+- なろう / なろうR18 : ページ上で前書き（.p-novel__text--preface）・後書き（--afterword）が
+                       別の要素になっているので、それで分ける（common.sites）
+- カクヨム           : 本文と区別する仕組みがないため、split_kakuyomu() で控えめに推定する。
+                       末尾 NOTE_MAX_SHARE 以内にある「あとがき」などの見出しの後、または区切り線（◇◇◇、―――など）の後に
+                       「お読みいただき」「★評価」「フォローお願い」のような読者への呼びかけが AFTERWORD_MIN_MARKERS 種類以上
+                       ある場合だけを後書きとし（「フォロー」「次回更新」だけなら物語の台詞でもありうるので本文のまま）、
+                       前書きは冒頭が「まえがき」などの見出しで始まり、区切り線で閉じている場合だけとします。
+                       迷う場合は本文に残します（KAKUYOMU_SPLIT_NOTES=0 で推定しない）。
+"""
+import os
+import re
+from collections import namedtuple
+
+KAKUYOMU_SPLIT_NOTES = os.environ.get('KAKUYOMU_SPLIT_NOTES', '1') != '0'
+# 前書き・後書きとみなす部分が全体に占める割合の上限
+NOTE_MAX_SHARE = 0.3
+
+EpisodeText = namedtuple('EpisodeText', 'body preface afterword')
+
+# 記号だけの3文字以上の行（場面転換・本文との区切り）
+SEPARATOR_RE = re.compile(r'^[\s◇◆○●□■☆★＊*※〇―ー─\-=＝~〜・…]{3,}$')
+NOTE_HEADING_RE = re.compile(
+    r'^[\s【（(<＜\[〈―ー─\-・]*(あとがき|後書き|まえがき|前書き|作者より|作者から)[\s】）)>＞\]〉―ー─\-・:：]*$'
+)
+PREFACE_HEADING_RE = re.compile(r'^[\s【（(<＜\[〈―ー─\-・]*(まえがき|前書き|作者より|お知らせ)')
+# 後書きに特有の読者への呼びかけ（物語の台詞にはまず出てこない言い回しだけ）
+AFTERWORD_MARKER_RE = re.compile(
+    r'お読みいただき|読んでいただき|読んでくださ|'
+    r'(?:フォロー|ブックマーク|レビュー|感想|応援|評価)(?:を|や|して|など)?(?:いただ|くださ|お願い|よろしく|お待ち)|'
+    r'[★☆](?:評価|レビュー|で応援|をいただ|を入れ)|星評価|作品フォロー'
+)
+# 区切り線の後を後書きとみなすのに必要な、呼びかけの種類の数
+AFTERWORD_MIN_MARKERS = 2
+
+
+def _share_ok(part, total):
+    return len(part) <= len(total) * NOTE_MAX_SHARE
+
+
+def split_kakuyomu(text):
+    """
+    カクヨムの本文（get_text("\\n", strip=True) の結果）を EpisodeText に分けます。
+    """
+    if not KAKUYOMU_SPLIT_NOTES or not text:
+        return EpisodeText(text, '', '')
+    lines = text.split('\n')
+    preface = afterword = ''
+
+    # 後書き: 末尾から見て、最後の区切り線・見出しの後に呼びかけがある
+    tail_start = len(text) - int(len(text) * NOTE_MAX_SHARE)
+    position = len(text)
+    for i in range(len(lines) - 1, 0, -1):
+        position -= len(lines[i]) + 1
+        if position < tail_start:
+            break
+        if SEPARATOR_RE.match(lines[i]) or NOTE_HEADING_RE.match(lines[i]):
+            rest = '\n'.join(lines[i:])
+            markers = set(AFTERWORD_MARKER_RE.findall(rest))
+            if NOTE_HEADING_RE.match(lines[i]) or len(markers) >= AFTERWORD_MIN_MARKERS:
+                afterword = rest
+                lines = lines[:i]
+            break
+
+    # 前書き: 冒頭が見出しで始まり、区切り線で閉じている
+    if lines and PREFACE_HEADING_RE.match(lines[0]):
+        for i in range(1, len(lines)):
+            if SEPARATOR_RE.match(lines[i]):
+                head = '\n'.join(lines[:i + 1])
+                if _share_ok(head, text):
+                    preface = head
+                    lines = lines[i + 1:]
+                break
+
+    body = '\n'.join(lines)
+    if not body.strip():
+        # 全部を前書き・後書きとみなしてしまった → 何もしない
+        return EpisodeText(text, '', '')
+    return EpisodeText(body, preface, afterword)
+
+
+def notes_text(parts):
+    """
+    サイドカーファイルに書く内容（前書き・後書きがなければ空文字）。
+    """
+    sections = []
+    if parts.preface.strip():
+        sections.append(f'【前書き】\n{parts.preface.strip()}')
+    if parts.afterword.strip():
+        sections.append(f'【後書き】\n{parts.afterword.strip()}')
+    return '\n\n'.join(sections)
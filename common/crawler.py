@@ -0,0 +1,575 @@
+"""
+全サイト共通のダウンロード処理と、複数サイト・複数作品をまとめて回すスケジューラ。
+
+以前は サイトごとのスクリプトを別々に起動し、1作品ずつ順番に処理していたため、
+カクヨムの通信と syosetu.com の通信が重ならず、翻訳待ちの間もほかの作品は進みませんでした。
+
+ここでは common.sites のアダプタを使って
+
+- 作品ごとの処理（目次 → 取得 → 翻訳 → 保存 → 履歴・アップロード）を1回だけ書き
+- NOVEL_WORKERS 本のスレッドで、サイトを順番に回りながら作品を並行して処理します
+  （1サイトあたりの同時作品数は SITE_NOVEL_WORKERS まで）
+
+相手サーバーへの同時接続数・間隔は common.session がホストごとに制限するので、
+作品を並行させてもホストあたりの負荷は上がりません。
+
+SHARD_LEASE_DIR を指定すると複数台で分担します（common.sharding）。
+各ノードは担当の作品だけを、リースを取ってから処理し、履歴・作品状態・翻訳キャッシュは
+Drive 上の内容とマージしてから上げます。落ちたノードの作品は、そのリースが切れたあとで引き継ぎます。
+
+翻訳の進め方は TRANSLATE_MODE で選べます（翻訳待ちの話は common.translation_queue に記録）。
+
+- inline    : 取得した話をその場で翻訳する（既定）。翻訳に失敗した話は英訳ファイルを書かずに翻訳待ちへ回し、
+              最後に、翻訳する時刻になった翻訳待ちの話を翻訳する
+- both      : 日本語本文の保存だけを全速で進めて翻訳待ちに入れ、同時に BACKLOG_WORKERS 本のスレッドで翻訳待ちを翻訳する
+- crawl     : 日本語本文の保存と翻訳待ちへの登録だけを行う（翻訳はあとで translate で）
+- translate : 取得はせず、翻訳待ちの話だけを翻訳する
+
+履歴は「日本語本文を保存した話数」を表し、英訳ファイルは翻訳がすべて成功したときだけ（一時ファイル経由で）書きます。
+"""
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics, sharding
+from common.history import HistoryStore
+from common.pipeline import run_pipeline
+from common.precheck import NovelStateIndex, filter_changed
+from common.session import report_limits, retry_delay
+from common.storage import open_storage
+from common.author_notes import notes_text
+from common.episode_index import EpisodeIndex, NovelDiff, body_hash
+from common.translate import TranslationError, estimate_tokens, prune_checkpoints, translate_text
+from common.translation_cache import cache as translation_cache
+from common.translation_pool import pool as translation_pool
+from common.translation_queue import queue as translation_queue
+from common.uploader import Uploader
+
+NOVEL_WORKERS = int(os.environ.get('NOVEL_WORKERS', '4'))
+SITE_NOVEL_WORKERS = int(os.environ.get('SITE_NOVEL_WORKERS', '2'))
+# 何話ごとに裏でアップロードを始めるか
+UPLOAD_EVERY = 10
+# 1話の本文取得を何回まで取り直すか（HTTP の再試行は common.session が別に行う）
+EPISODE_RETRIES = int(os.environ.get('EPISODE_RETRIES', '3'))
+TRANSLATE_MODE = os.environ.get('TRANSLATE_MODE', 'inline')
+TRANSLATE_MODES = ('inline', 'both', 'crawl', 'translate')
+# 翻訳待ちを翻訳するスレッド数
+BACKLOG_WORKERS = int(os.environ.get('BACKLOG_WORKERS', '4'))
+
+# 取得段から書き込み段へ渡す1話分（unchanged: 前回と同じ本文が同じ位置に保存済み）
+Fetched = namedtuple('Fetched', 'episode body ja_path en_path notes hash unchanged')
+
+
+class SiteRun:
+    """
+    1サイト分の実行状態（URL一覧・履歴・話の索引・アップローダー・作品状態・事前チェックの結果）。
+    """
+
+    def __init__(self, site, shard=None):
+        self.site = site
+        self.shard = shard
+        os.makedirs(site.download_dir, exist_ok=True)
+        self.urls = site.load_urls()
+        self.history = HistoryStore(site.local_history_path, site.remote_history_path, shared=shard is not None)
+        self.index = EpisodeIndex(site.local_index_path, site.remote_index_path, shared=shard is not None)
+        # 1話1ファイル、または作品ごとのパック（STORAGE_FORMAT）
+        self.storage = open_storage(site, UPLOAD_EVERY)
+        # <作業ディレクトリ>/<サイト>_dl/<タイトル>/... → drive:<タイトル>/...
+        with metrics.labels(site=site.name):
+            self.uploader = Uploader(site.download_dir, site.remote_root)
+        self.state = NovelStateIndex(site.local_state_path, site.remote_state_path, shared=shard is not None)
+        self.metadata = {}
+        self.pending = deque()
+        # リースが切れるのを待っている作品 [(期限, URL)]
+        self.deferred = []
+        # このノードが受け持った作品（分担モードで、途中から担当になった作品を見つけるため）
+        self.assigned = set()
+        # ほかのノードが処理中だった作品（そのノードが落ちたら引き継ぐ）
+        self.contested = set()
+        self.active = 0
+
+    def precheck(self, urls=None):
+        """
+        まだ受け持っていない作品について check() します。
+        分担モードでは、このノードが担当の作品だけを対象にします。
+        """
+        urls = [url for url in (self.urls if urls is None else urls) if url not in self.assigned]
+        if self.shard is not None:
+            urls = [url for url in urls if self.shard.owns(url)]
+        self.assigned.update(urls)
+        return self.check(urls)
+
+    def check(self, urls):
+        """
+        話数・最終更新日時が前回から変わった作品だけを処理待ちに加え、加えた数を返します。
+        """
+        with metrics.labels(site=self.site.name), metrics.span('precheck'):
+            self.metadata.update(self.site.metadata(urls))
+        changed = filter_changed(urls, self.metadata, self.history, self.state)
+        self.pending.extend(changed)
+        print(f'[{self.site.name}] 処理対象: {len(changed)} 作品')
+        return len(changed)
+
+    def adopt_orphans(self):
+        """
+        落ちたノードの担当だった作品のうち、今はこのノードの担当になったものを処理待ちに加えます。
+        """
+        orphans = [url for url in self.urls if url not in self.assigned and self.shard.owns(url)]
+        return self.precheck(orphans) if orphans else 0
+
+    def recheck_contested(self):
+        """
+        ほかのノードが処理中だった作品を見直し、持ち主が落ちていればリースの期限後に処理する予定に入れます。
+        予定に入れた数を返します。
+        """
+        deferred = 0
+        for url in list(self.contested):
+            holder = self.shard.holder(url)
+            if holder is None:
+                # 持ち主が処理を終えた
+                self.contested.discard(url)
+            elif not self.shard.is_alive(holder.get('node')):
+                self.contested.discard(url)
+                self.deferred.append((holder.get('expires', 0) + 1, url))
+                deferred += 1
+        return deferred
+
+    def flush_uploads(self):
+        """
+        保存先の書きかけ（パックのスナップショット）を確定させてから、ここまでの分のアップロードを始めます。
+        """
+        for path in self.storage.sync():
+            self.uploader.add(path)
+        self.uploader.flush()
+
+    def checkpoint(self):
+        """
+        ここまでの分のアップロードを始め、履歴・話の索引・作品状態を Drive へ同期します（常駐モード用）。
+        """
+        with metrics.labels(site=self.site.name):
+            self.flush_uploads()
+            self.history.sync()
+            self.index.save()
+            self.state.save()
+
+    def close(self):
+        """
+        保存先を閉じ、アップロードの残りを送り切ってから、未同期の履歴・作品状態をまとめて保存します。
+        """
+        with metrics.labels(site=self.site.name):
+            for path in self.storage.sync():
+                self.uploader.add(path)
+            self.storage.close()
+            self.uploader.close()
+            self.history.close()
+            self.index.save()
+            self.state.save()
+
+
+def fetch_episode(site, episode):
+    """
+    1話分の本文（前書き・後書きと分けた EpisodeText）を取得します。失敗したら揺らぎを入れた間隔で取り直します。
+    """
+    for attempt in range(EPISODE_RETRIES + 1):
+        try:
+            return site.fetch_episode(episode)
+        except Exception as e:
+            if attempt == EPISODE_RETRIES:
+                raise
+            metrics.count('episode_retries')
+            delay = retry_delay(attempt)
+            print(f'[{site.name}] {episode.index:03d}_{episode.title} の取得に失敗しました（{e}）。'
+                  f'{delay:.0f}秒後に取り直します')
+            time.sleep(delay)
+
+
+def process_novel(run, novel_url, mode='inline'):
+    """
+    1作品分の新しい話・改稿された話を取得・翻訳して保存します。
+
+    - 目次を話の索引（common.episode_index）と比べ、新しい話・更新日時や位置が変わった話だけを取得する
+      （取り直した本文が前回と同じなら保存も翻訳もしない）
+    - 取得・翻訳は common.pipeline で並列に先読みし、保存と履歴・索引の更新は話数順
+    - 各話の保存後に履歴を即時更新（ローカルのジャーナルに記録）
+    - 保存は run.storage（1話1ファイル / 作品ごとのパック）に行い、書いたファイルは uploader に記録して
+      UPLOAD_EVERY 話（パックなら PACK_UPLOAD_EVERY 話）ごとと最後に裏でアップロード
+    - 本文の取得に失敗した話は EPISODE_RETRIES 回まで間をおいて取り直す（作品ごと諦めない）
+    - 前書き・後書きは翻訳に送らず notes/<話数>.txt に保存し、省けた文字数・トークン数を作品ごとに表示
+    - 最後まで処理できた作品は、事前チェックで得た作品情報を state に記録
+    - 分担モードではリースを取ってから処理し（取れなければ sharding.LeaseBusy）、終わったら返す
+    - mode が inline 以外なら翻訳せずに翻訳待ちへ入れる。inline でも翻訳に失敗した話は翻訳待ちへ
+    """
+    with metrics.labels(site=run.site.name, novel=novel_url):
+        if run.shard is None:
+            return _process_novel(run, novel_url, mode=mode)
+        lease = run.shard.acquire(novel_url)
+        try:
+            if lease.taken_over_from:
+                # 落ちたノードが最後に同期したところから続ける
+                run.history.refresh()
+            return _process_novel(run, novel_url, lease, mode)
+        finally:
+            run.shard.release(lease)
+
+
+def _process_novel(run, novel_url, lease=None, mode='inline'):
+    site = run.site
+    print(f'\n[{site.name}] --- 処理開始: {novel_url} ---')
+    with metrics.span('toc'):
+        folder_title, episodes = site.read_toc(novel_url)
+
+    def bootstrap(episode):
+        run.index.record(novel_url, episode.key, episode.index, episode.title, episode.updated_at, None)
+
+    diff = NovelDiff(run.index.entries(novel_url), run.history.get(novel_url, 0), bootstrap)
+    new_downloaded = unchanged = 0
+    notes_chars = notes_tokens = 0
+
+    # 取得済みで変わっていない話はスキップ
+    pending = (episode for episode in episodes if diff.needs(episode))
+
+    @metrics.timed('fetch')
+    def fetch(episode):
+        parts = fetch_episode(site, episode)
+        body = parts.body
+        hash_value = body_hash(body)
+        if diff.unchanged(episode, hash_value):
+            return Fetched(episode, body, None, None, None, hash_value, True)
+        ja_path, en_path = site.episode_paths(folder_title, episode.index)
+        ja_path = run.storage.write(ja_path, f'{episode.title}\n\n{body}')
+        notes = notes_text(parts)
+        if notes:
+            notes_path = run.storage.write(site.notes_path(folder_title, episode.index), notes)
+            stripped = parts.preface + parts.afterword
+            notes = (notes_path, len(stripped), estimate_tokens(stripped))
+        return Fetched(episode, body, ja_path, en_path, notes or None, hash_value, False)
+
+    def translate(fetched):
+        if mode != 'inline' or fetched.unchanged:
+            return fetched, None
+        episode = fetched.episode
+        try:
+            with metrics.span('translate'):
+                return fetched, translate_text(fetched.body, strict=True)
+        except TranslationError as e:
+            print(f'[{site.name}] {episode.index:03d}_{episode.title} の翻訳に失敗したため、翻訳待ちに回します（{e}）')
+            return fetched, None
+
+    def write(translated):
+        nonlocal new_downloaded, unchanged, notes_chars, notes_tokens
+        fetched, translated_body = translated
+        episode, body, ja_path, en_path, notes = fetched[:5]
+        if lease is not None and not lease.valid():
+            raise sharding.LeaseLost(f'リースを失ったため中断します: {novel_url}')
+        if fetched.unchanged:
+            run.index.record(novel_url, episode.key, episode.index, episode.title, episode.updated_at, fetched.hash)
+            unchanged += 1
+            metrics.count('episodes_unchanged')
+            return
+        if translated_body is None:
+            # 翻訳待ちのジョブは書く前に索引の本文ハッシュと比べるので、索引を先に更新する
+            run.index.record(novel_url, episode.key, episode.index, episode.title, episode.updated_at, fetched.hash)
+            translation_queue.enqueue(site.name, novel_url, episode.index, episode.title,
+                                      os.path.relpath(en_path, site.download_dir), body)
+            metrics.count('episodes_queued')
+            print(f'[{site.name}] {folder_title} {episode.index:03d}_{episode.title} を保存しました（翻訳待ち）')
+        else:
+            with metrics.span('write'):
+                written_path = run.storage.write(en_path, f'{episode.title}\n\n{translated_body}')
+            run.uploader.add(written_path)
+            # 前に翻訳待ちに入った同じ位置の話（古い本文）が、この英訳を上書きしないようにする
+            translation_queue.discard(site.name, novel_url, episode.index)
+            run.index.record(novel_url, episode.key, episode.index, episode.title, episode.updated_at, fetched.hash)
+            print(f'[{site.name}] {folder_title} {episode.index:03d}_{episode.title} を翻訳して保存しました')
+
+        run.history[novel_url] = max(run.history.get(novel_url, 0), episode.index)
+        run.uploader.add(ja_path)
+        if notes is not None:
+            notes_path, chars, tokens = notes
+            run.uploader.add(notes_path)
+            notes_chars += chars
+            notes_tokens += tokens
+            metrics.count('notes_chars_skipped', chars)
+            metrics.count('notes_tokens_skipped', tokens)
+        new_downloaded += 1
+        if new_downloaded % run.storage.upload_every == 0:
+            run.flush_uploads()
+
+    try:
+        run_pipeline(pending, fetch, translate, write)
+    finally:
+        # 途中で失敗しても、そこまでに保存できた分はアップロードしておく
+        if new_downloaded % run.storage.upload_every != 0:
+            run.flush_uploads()
+        if notes_chars:
+            print(f'[{site.name}] {folder_title}: 前書き・後書き {notes_chars} 文字'
+                  f'（約 {notes_tokens} トークン）を翻訳せずに notes へ保存しました')
+
+    # 目次を最後まで見終えたので、目次から消えた話を反映する
+    removed = diff.removed()
+    if removed:
+        run.index.remove(novel_url, removed)
+    if diff.seen and run.history.get(novel_url, 0) != len(diff.seen):
+        run.history[novel_url] = len(diff.seen)
+    if diff.revised or diff.moved or removed or unchanged:
+        print(f'[{site.name}] {folder_title}: 新しい話 {diff.new} / 改稿 {diff.revised} / 位置の変化 {diff.moved}'
+              f' / 削除 {len(removed)}（取り直して本文が同じだった話 {unchanged}）')
+
+    run.state.mark(novel_url, run.metadata.get(novel_url))
+    return new_downloaded
+
+
+class Scheduler:
+    """
+    複数サイトの処理待ちの作品を、サイトを順番に回りながらワーカーへ配ります。
+    stopping（threading.Event）がセットされたら、新しい作品は配らず、処理中の作品が終わるのを待って終わります。
+    """
+
+    def __init__(self, runs, site_workers=SITE_NOVEL_WORKERS, shard=None, mode='inline', stopping=None):
+        self.runs = runs
+        self.site_workers = site_workers
+        self.shard = shard
+        self.mode = mode
+        self.stopping = stopping
+        self._turn = 0
+        self._cond = threading.Condition()
+
+    def _pick(self):
+        now = time.time()
+        for run in self.runs:
+            for item in [item for item in run.deferred if item[0] <= now]:
+                run.deferred.remove(item)
+                run.pending.append(item[1])
+        for offset in range(len(self.runs)):
+            run = self.runs[(self._turn + offset) % len(self.runs)]
+            if run.pending and run.active < self.site_workers:
+                self._turn = (self._turn + offset + 1) % len(self.runs)
+                run.active += 1
+                return run, run.pending.popleft()
+        return None
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if self.stopping is not None and self.stopping.is_set():
+                    return None
+                job = self._pick()
+                if job is not None:
+                    return job
+                if not any(run.pending or run.deferred for run in self.runs):
+                    return None
+                # 空きのあるサイトに処理待ちがない → どこかの作品が終わるか、リースが切れるまで待つ
+                deadlines = [until for run in self.runs for until, _ in run.deferred]
+                self._cond.wait(max(0.1, min(deadlines) - time.time()) if deadlines else None)
+
+    def _done(self, run):
+        with self._cond:
+            run.active -= 1
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            run, novel_url = job
+            try:
+                process_novel(run, novel_url, self.mode)
+            except sharding.LeaseBusy as e:
+                self._lease_busy(run, e)
+            except Exception as e:
+                print(f'[{run.site.name}] エラー発生: {novel_url} → {e}')
+            finally:
+                self._done(run)
+
+    def _lease_busy(self, run, busy):
+        if busy.until and not self.shard.is_alive(busy.holder):
+            # 持ち主のノードが落ちている → リースが切れたら引き継ぐ
+            print(f'[{run.site.name}] {busy.key} は停止したノード {busy.holder} のリースが切れるのを待ちます')
+            with self._cond:
+                run.deferred.append((busy.until + 1, busy.key))
+                self._cond.notify_all()
+        else:
+            print(f'[{run.site.name}] {busy}。そのノードが終えるか落ちるまで待ちます')
+            with self._cond:
+                run.contested.add(busy.key)
+
+    def run(self, workers=NOVEL_WORKERS):
+        threads = [threading.Thread(target=self._worker) for _ in range(max(1, workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def drain(scheduler, runs, shard, workers):
+    """
+    自分の担当が終わったあと、ほかのノードが処理中の作品を見届けます。
+    途中で落ちたノードがあれば、その担当分（未着手の作品・処理中だった作品）を引き受けます。
+    """
+    deadline = time.monotonic() + sharding.DRAIN_WAIT
+    while True:
+        added = sum(run.adopt_orphans() + run.recheck_contested() for run in runs)
+        if added:
+            scheduler.run(workers)
+            continue
+        waiting = any(run.contested for run in runs) or shard.busy_elsewhere()
+        if not waiting or time.monotonic() >= deadline:
+            return
+        time.sleep(shard.ttl / 3)
+
+
+def _stale(run, job):
+    """
+    job の本文が、索引に記録されたその位置の話の本文と違えば、ジョブを取り消して True を返します。
+    （索引にその位置がない・本文のハッシュがない（従来の履歴から作った記録）ときは判断せずに False）
+    """
+    entry = run.index.at(job.novel_url, job.episode)
+    if entry is None or entry.body_hash is None or entry.body_hash == body_hash(job.body):
+        return False
+    translation_queue.drop(job)
+    metrics.count('translate_jobs_dropped')
+    print(f'[{run.site.name}] {job.en_path} の翻訳待ちは、その位置の話が変わったため取り消しました')
+    return True
+
+
+def translate_job(run, job):
+    """
+    翻訳待ちの1話を翻訳して英訳ファイルを書きます。失敗したら間をおいて再試行する予定に戻します。
+    ジョブの本文が、その位置（話数）の今の索引の本文と違えば（改稿・話の挿入や削除のあとの古いジョブ）、
+    英訳ファイルは今の話のものなので書かずに取り消します。
+    """
+    site = run.site
+    with metrics.labels(site=site.name, novel=job.novel_url):
+        if _stale(run, job):
+            return
+        try:
+            with metrics.span('translate'):
+                translated = translate_text(job.body, strict=True)
+        except Exception as e:
+            delay = translation_queue.retry(job, e)
+            print(f'[{site.name}] {job.episode:03d}_{job.title} の翻訳に失敗しました（{e}）。'
+                  f'{delay / 60:.0f}分後以降に再試行します')
+            return
+        # 翻訳している間に、同じ位置の話が取り直されていることもある
+        if _stale(run, job):
+            return
+        en_path = os.path.join(site.download_dir, job.en_path)
+        with metrics.span('write'):
+            written_path = run.storage.write(en_path, f'{job.title}\n\n{translated}')
+        run.uploader.add(written_path)
+        translation_queue.complete(job)
+        print(f'[{site.name}] {job.en_path} を翻訳して保存しました（翻訳待ちから）')
+        if run.uploader.pending_count() >= run.storage.upload_every:
+            run.flush_uploads()
+
+
+def translate_backlog(runs, crawling=None, workers=None, stopping=None):
+    """
+    翻訳待ちの話のうち、翻訳する時刻になったものを BACKLOG_WORKERS 本のスレッドで翻訳します。
+    crawling（threading.Event）を渡すと、それがセットされるまでは新しく入る話を待ち続けます。
+    stopping（threading.Event）がセットされたら、翻訳中の話を書き終えたところで終わります。
+    分担モードでは、このノードが担当の作品の話だけを翻訳します。
+    """
+    by_site = {run.site.name: run for run in runs}
+    shard = runs[0].shard if runs else None
+    accept = (lambda job: shard.owns(job.novel_url)) if shard is not None else None
+
+    def worker():
+        while stopping is None or not stopping.is_set():
+            job = translation_queue.claim(by_site, accept)
+            if job is not None:
+                translate_job(by_site[job.site], job)
+            elif crawling is None or crawling.is_set():
+                return
+            else:
+                translation_queue.wait(1.0)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, workers or BACKLOG_WORKERS))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def check_mode(mode):
+    mode = mode or TRANSLATE_MODE
+    if mode not in TRANSLATE_MODES:
+        raise ValueError(f'不明な TRANSLATE_MODE: {mode}（指定できるのは {", ".join(TRANSLATE_MODES)}）')
+    return mode
+
+
+def open_runs(sites):
+    """
+    分担モードの開始・サイトごとの SiteRun の作成・翻訳キャッシュと翻訳待ちキューの取得を行います。
+    戻り値: (runs, shard)
+    """
+    shard = sharding.from_env()
+    runs = [SiteRun(site, shard) for site in sites]
+    translation_cache.pull()
+    translation_queue.pull()
+    return runs, shard
+
+
+def process_pending(runs, shard, mode, workers=None, site_workers=None, drain_peers=True, stopping=None):
+    """
+    処理待ちに入っている作品を処理し、mode に応じて翻訳待ちの話を翻訳します。
+    stopping（threading.Event）がセットされたら、処理中の作品・話を終えたところで戻ります。
+    """
+    if mode != 'translate':
+        crawling = threading.Event()
+        backlog = None
+        if mode == 'both':
+            backlog = threading.Thread(target=translate_backlog, args=(runs, crawling, None, stopping))
+            backlog.start()
+        try:
+            scheduler = Scheduler(runs, site_workers or SITE_NOVEL_WORKERS, shard, mode, stopping)
+            scheduler.run(workers or NOVEL_WORKERS)
+            if shard is not None and drain_peers:
+                drain(scheduler, runs, shard, workers or NOVEL_WORKERS)
+        finally:
+            crawling.set()
+            if backlog is not None:
+                backlog.join()
+    if mode in ('inline', 'translate'):
+        translate_backlog(runs, stopping=stopping)
+
+
+def close_runs(runs, shard):
+    """
+    SiteRun を閉じ、集計を表示して、翻訳キャッシュと翻訳待ちキューを Drive へ上げます。
+    """
+    try:
+        for run in runs:
+            run.close()
+        if shard is not None:
+            shard.stop()
+    finally:
+        report_limits()
+        metrics.report()
+        translation_pool.report()
+        # 翻訳キャッシュも Drive へ（分担モードでは他のノードの分とマージ）
+        translation_cache.report()
+        prune_checkpoints()
+        translation_cache.push(merge=shard is not None)
+        translation_queue.report()
+        translation_queue.push(merge=shard is not None)
+
+
+def crawl(sites, workers=None, site_workers=None, mode=None):
+    """
+    指定したサイトの全作品を処理します（1サイトだけでも可）。
+    mode は TRANSLATE_MODE と同じ（inline / both / crawl / translate）。
+    """
+    mode = check_mode(mode)
+    runs, shard = open_runs(sites)
+    try:
+        if mode != 'translate':
+            # 事前チェックはサイトごとに別のホストへ問い合わせるので、並行して行う
+            with ThreadPoolExecutor(max_workers=len(runs)) as executor:
+                list(executor.map(SiteRun.precheck, runs))
+        process_pending(runs, shard, mode, workers, site_workers)
+    finally:
+        close_runs(runs, shard)
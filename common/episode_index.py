@@ -0,0 +1,211 @@
+"""
+作品ごと・話ごとの索引（SQLite）。
+
+履歴（「小説URL | 最終ダウンロード話数」）だけでは「何話目まで取ったか」しかわからないため、
+作者が40話を改稿しても取り直されず、途中に話が挿入・削除されると後ろの話がすべてずれていました。
+
+ここでは話ごとに
+
+- key        : 話の変わらない ID（カクヨムはエピソード ID、なろうは本文ページのパス）
+- updated_at : 目次に出ている更新日時（なろうは改稿日時があればそれ、カクヨムは公開日時）
+- body_hash  : 保存した日本語本文の SHA-256
+- file_index : 保存したファイルの話数（<話数>.txt）
+
+を記録し、目次と比べて「新しい話」「更新日時が変わった話」「並び順が変わった話」だけを取り直します。
+取り直した本文が前回と同じ（body_hash が同じで、ファイルの位置も同じ）なら保存も翻訳もしません。
+本文が同じで位置だけ変わった話は保存し直しますが、翻訳は翻訳キャッシュから取り出すので API は使いません。
+
+索引のない作品は、履歴の話数までを「取得済み」として目次から索引を作ります（従来の履歴からの移行）。
+カクヨムは話ごとの改稿日時を公開していないため、カクヨムで検出できるのは話の追加・削除・並べ替えと
+公開日時の変化だけです。
+
+履歴・翻訳キャッシュと同じく rclone copyto で Drive と同期し、複数台では push(merge=True) で
+話ごとに記録日時が新しいほうを採ります。
+"""
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+Entry = namedtuple('Entry', 'key file_index title updated_at body_hash')
+
+
+def body_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EpisodeIndex:
+    """
+    1サイト分の話ごとの索引。複数スレッドから同時に使えます。
+    """
+
+    def __init__(self, local_path, remote_path, shared=False):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._conn = None
+        self._dirty = False
+        if not os.path.exists(local_path):
+            subprocess.run(['rclone', 'copyto', remote_path, local_path], check=False)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.local_path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS episodes ('
+                ' novel_url TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' file_index INTEGER NOT NULL,'
+                ' title TEXT,'
+                ' updated_at TEXT,'
+                ' body_hash TEXT,'
+                ' recorded_at REAL NOT NULL,'
+                ' PRIMARY KEY (novel_url, key))'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def entries(self, novel_url):
+        """
+        作品の索引を {key: Entry} で返します（なければ空）。
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT key, file_index, title, updated_at, body_hash FROM episodes WHERE novel_url = ?',
+                (novel_url,)
+            ).fetchall()
+        return {row[0]: Entry(*row) for row in rows}
+
+    def at(self, novel_url, file_index):
+        """
+        file_index（保存したファイルの話数）の位置に今ある話の Entry。なければ None。
+        並べ替えの途中で同じ位置の記録が2件あるときは、新しく記録したほうを返します。
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT key, file_index, title, updated_at, body_hash FROM episodes'
+                ' WHERE novel_url = ? AND file_index = ? ORDER BY recorded_at DESC LIMIT 1',
+                (novel_url, file_index)
+            ).fetchone()
+        return Entry(*row) if row else None
+
+    def record(self, novel_url, key, file_index, title, updated_at, hash_value):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO episodes'
+                ' (novel_url, key, file_index, title, updated_at, body_hash, recorded_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (novel_url, key, file_index, title, updated_at, hash_value, time.time())
+            )
+            conn.commit()
+            self._dirty = True
+
+    def remove(self, novel_url, keys):
+        """
+        目次から消えた話を索引から除きます。
+        """
+        with self._lock:
+            conn = self._connect()
+            conn.executemany('DELETE FROM episodes WHERE novel_url = ? AND key = ?',
+                             [(novel_url, key) for key in keys])
+            conn.commit()
+            self._dirty = True
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def merge_remote(self):
+        """
+        Drive 上の索引を取り込みます（話ごとに記録日時が新しいほうを採る）。
+        """
+        remote_copy = f'{self.local_path}.remote'
+        result = subprocess.run(['rclone', 'copyto', self.remote_path, remote_copy], check=False)
+        if result.returncode != 0 or not os.path.exists(remote_copy):
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('ATTACH DATABASE ? AS remote', (remote_copy,))
+                try:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO episodes SELECT * FROM remote.episodes r WHERE NOT EXISTS ('
+                        ' SELECT 1 FROM episodes l WHERE l.novel_url = r.novel_url AND l.key = r.key'
+                        ' AND l.recorded_at >= r.recorded_at)'
+                    )
+                    conn.commit()
+                finally:
+                    conn.execute('DETACH DATABASE remote')
+        except sqlite3.DatabaseError as e:
+            print(f'Drive 上の話の索引を取り込めませんでした: {e}')
+        finally:
+            os.remove(remote_copy)
+
+    def save(self):
+        """
+        変更があれば Drive へ上書きコピーします（shared=True なら先に Drive 上の分を取り込む）。
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        if self.shared:
+            self.merge_remote()
+        self.close()
+        result = subprocess.run(['rclone', 'copyto', self.local_path, self.remote_path], check=False)
+        if result.returncode != 0:
+            print(f'話の索引のアップロード失敗 (rclone exit {result.returncode})')
+
+
+class NovelDiff:
+    """
+    1作品分の目次と索引の比較。needs(episode) で取り直しが必要かどうかを返し、
+    目次を最後まで見たあとで removed() が目次から消えた話の key を返します。
+    索引のない作品で履歴の話数までを取得済みとみなした話は、その場で on_bootstrap(episode) に渡します
+    （本処理が途中で失敗しても、次の実行で移行分を取り直さないように）。
+    """
+
+    def __init__(self, entries, legacy_count=0, on_bootstrap=None):
+        self.entries = entries
+        # 索引がまだない作品は、履歴の話数までを取得済みとみなす
+        self.legacy_count = 0 if entries else legacy_count
+        self.on_bootstrap = on_bootstrap
+        self.seen = set()
+        self.bootstrapped = 0
+        self.new = self.revised = self.moved = 0
+
+    def needs(self, episode):
+        self.seen.add(episode.key)
+        entry = self.entries.get(episode.key)
+        if entry is None:
+            if episode.index <= self.legacy_count:
+                self.bootstrapped += 1
+                if self.on_bootstrap is not None:
+                    self.on_bootstrap(episode)
+                return False
+            self.new += 1
+            return True
+        if episode.updated_at and entry.updated_at and episode.updated_at != entry.updated_at:
+            self.revised += 1
+            return True
+        if entry.file_index != episode.index:
+            self.moved += 1
+            return True
+        return False
+
+    def unchanged(self, episode, hash_value):
+        """
+        取り直した本文が、前回と同じ位置に保存したものと同じなら True。
+        """
+        entry = self.entries.get(episode.key)
+        return entry is not None and entry.body_hash == hash_value and entry.file_index == episode.index
+
+    def removed(self):
+        return [key for key in self.entries if key not in self.seen]
@@ -0,0 +1,217 @@
+"""
+ダウンロード履歴（「小説URL | 最終ダウンロード話数」）の保存。
+
+以前は1話ごとに履歴ファイル全体を書き直して rclone copyto で Drive に上げていたため、
+1話あたり 1〜3 秒のリモート往復がかかっていました。ここでは
+
+- 1話ごとの更新はローカルの追記ジャーナル（<履歴ファイル>.journal）に1行書いて fsync するだけ
+- Drive への同期は SYNC_EVERY 話ごと・SYNC_INTERVAL 秒ごと・sync() を呼んだとき・終了時にまとめて行う
+- 同期の前にジャーナルを従来形式の履歴ファイルへまとめ直す（重複行もここで消える）
+
+とします。Drive 上のファイル形式は従来と同じです。
+途中で落ちても、ローカルにはジャーナルが残るので次回はそこから再開し、
+Drive 側は最後に同期したところから再開します（取り直しになることはあっても、飛ばすことはない）。
+
+複数台で同じ履歴を使う場合（shared=True）は、上書きではなくマージします。
+読み込み時と同期のたびに Drive 上の履歴を取ってきて作品ごとに大きいほうの話数を採り、
+アップロード後にもう一度取り直して、自分の分が消されていないか（同時に上書きされていないか）を確かめます。
+そのため、手で話数を減らした場合は他のノードの値で戻ることがあります。
+"""
+import atexit
+import os
+import re
+import subprocess
+import threading
+import time
+
+from common import metrics
+
+SYNC_EVERY = int(os.environ.get('HISTORY_SYNC_EVERY', '20'))
+SYNC_INTERVAL = float(os.environ.get('HISTORY_SYNC_INTERVAL', '120'))
+# shared=True で、アップロード後に他のノードと競合していたときにやり直す回数
+MERGE_ATTEMPTS = 3
+
+LINE_RE = re.compile(r'(https?://[^\s|]+)\s*\|\s*(\d+)')
+
+
+class HistoryStore:
+    """
+    dict のように使える履歴。history[url] = 話数 で即座にジャーナルへ記録されます。
+    """
+
+    def __init__(self, local_path, remote_path, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL,
+                 shared=False):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.shared = shared
+        self.journal_path = f'{local_path}.journal'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._data = {}
+        self._lock = threading.RLock()
+        self._journal = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._load()
+        atexit.register(self.close)
+
+    def _load(self):
+        if not os.path.exists(self.local_path):
+            # ローカルにない場合はリモートからコピーしてみる
+            subprocess.run(['rclone', 'copyto', self.remote_path, self.local_path], check=False)
+
+        if os.path.exists(self.local_path):
+            self._data.update(self._parse(self.local_path))
+
+        # 前回の実行でまとめきれなかったジャーナルを反映
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # 書きかけで落ちた最後の行は改行がないので捨てる
+                    if not line.endswith('\n'):
+                        break
+                    url, _, last = line.rstrip('\n').partition('\t')
+                    if last.isdigit():
+                        self._data[url] = int(last)
+                        replayed += 1
+        if replayed:
+            self._unsynced = replayed
+            self.compact()
+        if self.shared:
+            # 他のノードが進めた分を取り込む
+            self.refresh()
+
+    @staticmethod
+    def _parse(path):
+        data = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                match = LINE_RE.match(line.strip())
+                if match:
+                    url, last = match.groups()
+                    data[url.rstrip('/')] = int(last)
+        return data
+
+    def _fetch_remote(self):
+        """
+        Drive 上の履歴を読みます。取れなければ None。
+        """
+        tmp_path = f'{self.local_path}.remote'
+        try:
+            result = subprocess.run(['rclone', 'copyto', self.remote_path, tmp_path], check=False)
+            if result.returncode != 0 or not os.path.exists(tmp_path):
+                return None
+            return self._parse(tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def refresh(self):
+        """
+        Drive 上の履歴を取り込み（作品ごとに大きいほうの話数）、Drive 上の内容を返します。
+        """
+        remote = self._fetch_remote()
+        if remote is None:
+            return None
+        with self._lock:
+            for url, last in remote.items():
+                if last > self._data.get(url, 0):
+                    self._data[url] = last
+        return remote
+
+    def __getitem__(self, url):
+        return self._data[url]
+
+    def __contains__(self, url):
+        return url in self._data
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, url, default=None):
+        return self._data.get(url, default)
+
+    def items(self):
+        return list(self._data.items())
+
+    def __setitem__(self, url, last):
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(f'{url}\t{int(last)}\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._data[url] = int(last)
+            self._unsynced += 1
+            if (self._unsynced >= self.sync_every
+                    or time.monotonic() - self._last_sync >= self.sync_interval):
+                self.sync()
+
+    def compact(self):
+        """
+        現在の内容を従来形式の履歴ファイルへ書き出し（一時ファイル経由で置き換え）、
+        ジャーナルを空にします。
+        """
+        with self._lock:
+            tmp_path = f'{self.local_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for url, last in self._data.items():
+                    f.write(f'{url}  |  {last}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.local_path)
+
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def sync(self):
+        """
+        ジャーナルをまとめてから Drive へ上書きコピーします。
+        失敗しても例外にはせず、次の同期で再送します。
+        """
+        with self._lock:
+            self.compact()
+            self._last_sync = time.monotonic()
+            if not self._unsynced:
+                return
+            with metrics.span('history_sync'):
+                ok = self._upload_merged() if self.shared else self._upload()
+            if ok:
+                self._unsynced = 0
+
+    def _upload(self):
+        result = subprocess.run(['rclone', 'copyto', self.local_path, self.remote_path], check=False)
+        if result.returncode != 0:
+            print(f'履歴のアップロード失敗 (rclone exit {result.returncode})。次回の同期で再送します')
+        return result.returncode == 0
+
+    def _upload_merged(self):
+        """
+        Drive 上の履歴とマージしてからアップロードし、自分の分が残っているか確かめます。
+        """
+        for _ in range(MERGE_ATTEMPTS):
+            self.refresh()
+            self.compact()
+            if not self._upload():
+                return False
+            remote = self._fetch_remote()
+            if remote is not None and all(remote.get(url, 0) >= last for url, last in self._data.items()):
+                return True
+            metrics.count('history_merge_conflicts')
+        print('履歴のマージが他のノードと競合し続けています。次回の同期で再送します')
+        return False
+
+    def close(self):
+        """
+        未同期の分があれば同期します。終了時にも自動で呼ばれます。
+        """
+        with self._lock:
+            if self._unsynced or self._journal is not None:
+                self.sync()
@@ -0,0 +1,205 @@
+"""
+話ページの HTML から本文のテキストを取り出す処理。
+
+BeautifulSoup(…, "html.parser") は純 Python で木を組み立てるため、
+翻訳なしで大量に取得するときは1話あたりの CPU 時間の大きな割合を占めます。
+lxml が入っていればそちらで解析し（速い）、なければ従来どおり bs4 を使います。
+どちらを使っても、出力は bs4 の get_text と同じ文字列になるようにしています
+（CR・NUL・CDATA・壊れたコメント・HTML5 にない名前の文字参照を含むページや、
+lxml が解析できないページ（XML 宣言付きなど）は、結果が変わりうるので bs4 で処理します）。
+
+- strip=True  : get_text("\\n", strip=True) と同じ（カクヨム）
+- strip=False : get_text() と同じ（なろう）
+- extract_texts : 1回の解析で複数のセレクタのテキストを取り出す（なろうの前書き・本文・後書き）
+
+HTML_BACKEND 環境変数で auto（既定）/ lxml / bs4 を選べます。
+"""
+import os
+import re
+from html.entities import html5
+
+try:
+    import lxml.etree
+    import lxml.html
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+from common import metrics
+
+HTML_BACKEND = os.environ.get('HTML_BACKEND', 'auto')
+
+# bs4 の get_text が中身を返さない要素（script / style / template、bs4 4.13 以降はルビの rt / rp も）。
+# 入っている bs4 と同じ結果になるよう、bs4 側の定義をそのまま使う
+try:
+    from bs4.builder import HTMLTreeBuilder
+    SKIP_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_STRING_CONTAINERS)
+except (ImportError, AttributeError):
+    SKIP_TAGS = frozenset(['script', 'style', 'template', 'rt', 'rp'])
+# bs4 は空白だけの文字列を「\n」か「 」1文字にまとめる（pre / textarea の中を除く）
+try:
+    PRESERVE_TAGS = frozenset(HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+except (NameError, AttributeError):
+    PRESERVE_TAGS = frozenset(['pre', 'textarea'])
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+# 「div.widget-episodeBody」「.p-novel__body .p-novel__text」のような単純なセレクタだけを XPath に変換する
+# （「.p-novel__text:not(.p-novel__text--preface)」のようなクラス・ID の否定も可）
+SIMPLE_SELECTOR_RE = re.compile(r'^([a-zA-Z][a-zA-Z0-9]*)?((?:[.#][\w-]+)*)$')
+NOT_RE = re.compile(r':not\(([.#])([\w-]+)\)')
+
+
+# lxml と bs4 で出力が変わる入力（lxml は CR を LF に、NUL を U+FFFD にし、CDATA の中身を捨てる。
+# 「;」で閉じていない数値文字参照、<![endif]--> や <!--> のような壊れたコメントも扱いが違う）
+LXML_UNSAFE_CHARS = ('\r', '\x00')
+LXML_UNSAFE_RE = re.compile(r'[<&](?:!\[|!---?>|/(?![A-Za-z])|#(?!\d+;|[xX][0-9a-fA-F]+;))')
+# script / style の中身（テキストとしては出力されないので、上の確認の対象から外す）
+RAW_TEXT_RE = re.compile(r'<(script|style)\b[^>]*>.*?</\1\s*>', re.S | re.I)
+# 対応する開始タグのない終了タグ（bs4 だけがそこで文字列を分ける）は、lxml の解析時のエラーで見分ける
+TAG_MISMATCH = 'ERR_TAG_NAME_MISMATCH'
+# 文書の途中の <!DOCTYPE …> などの宣言（bs4 はそこで文字列を分け、lxml は前後をつなげる）
+DECLARATION_RE = re.compile(r'<![A-Za-z]')
+# 名前付きの文字参照。HTML5 にない名前（&unknown;）や、「;」のない &copy のような古い書き方から
+# 始まるもの（&copya）は、bs4 と lxml で扱いが違う
+NAMED_REF_RE = re.compile(r'&([A-Za-z][A-Za-z0-9]*)(;?)')
+LEGACY_REFS = tuple(name for name in html5 if not name.endswith(';'))
+
+
+def _lxml_safe(html):
+    """
+    lxml で処理しても bs4 と同じ結果になる入力なら True。
+    """
+    if any(c in html for c in LXML_UNSAFE_CHARS):
+        return False
+    html = RAW_TEXT_RE.sub('', html)
+    if LXML_UNSAFE_RE.search(html):
+        return False
+    start = len(html) - len(html.lstrip('\ufeff' + ASCII_SPACES))
+    if DECLARATION_RE.search(html, start + 1):
+        return False
+    for name, semicolon in set(NAMED_REF_RE.findall(html)):
+        if semicolon:
+            if f'{name};' not in html5:
+                return False
+        elif name.startswith(LEGACY_REFS):
+            return False
+    return True
+
+
+def _condition(kind, name):
+    if kind == '.':
+        return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+    return f'@id="{name}"'
+
+
+def _selector_to_xpath(selector):
+    """
+    タグ名・クラス・ID（と :not によるその否定）と子孫結合子（空白）だけからなるセレクタを
+    XPath に変換します。対応していない形なら None。
+    """
+    steps = []
+    for part in selector.split():
+        negations = NOT_RE.findall(part)
+        part = NOT_RE.sub('', part)
+        match = SIMPLE_SELECTOR_RE.match(part)
+        if not match or not part:
+            return None
+        tag, rest = match.groups()
+        conditions = [_condition(kind, name) for kind, name in re.findall(r'([.#])([\w-]+)', rest)]
+        conditions += [f'not({_condition(kind, name)})' for kind, name in negations]
+        step = tag or '*'
+        if conditions:
+            step += '[' + ' and '.join(conditions) + ']'
+        steps.append(step)
+    return '//' + '//'.join(steps) if steps else None
+
+
+def _bs4_string(text, preserve):
+    """
+    bs4 が木に入れるときと同じく、空白だけの文字列を1文字にまとめます。
+    """
+    if preserve or text.strip(ASCII_SPACES):
+        return text
+    return '\n' if '\n' in text else ' '
+
+
+def _strings(element, preserve=None):
+    """
+    bs4 の get_text と同じ順番・同じ範囲・同じ中身で文字列を返します
+    （コメント・処理命令と SKIP_TAGS の中身は含めない）。
+    """
+    if preserve is None:
+        preserve = any(e.tag in PRESERVE_TAGS for e in element.iterancestors())
+    inner = preserve or element.tag in PRESERVE_TAGS
+    if element.text:
+        yield _bs4_string(element.text, inner)
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in SKIP_TAGS:
+            yield from _strings(child, inner)
+        if child.tail:
+            yield _bs4_string(child.tail, inner)
+
+
+def _join(strings, strip):
+    if strip:
+        return '\n'.join(s for s in (s.strip() for s in strings) if s)
+    return ''.join(strings)
+
+
+def _extract_bs4(html, selectors, strip):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    texts = []
+    for selector in selectors:
+        element = soup.select_one(selector)
+        if element is None:
+            texts.append(None)
+        else:
+            texts.append(element.get_text('\n', strip=True) if strip else element.get_text())
+    return texts
+
+
+def _extract_lxml(html, selectors, strip):
+    xpaths = [_selector_to_xpath(selector) for selector in selectors]
+    if None in xpaths or not _lxml_safe(html):
+        metrics.count('parse_bs4_fallbacks')
+        return _extract_bs4(html, selectors, strip)
+    parser = lxml.html.HTMLParser()
+    try:
+        root = lxml.html.fromstring(html, parser=parser)
+    except (ValueError, lxml.etree.ParserError) as e:
+        print(f'lxml で解析できないため bs4 で処理します: {e}')
+        metrics.count('parse_bs4_fallbacks')
+        return _extract_bs4(html, selectors, strip)
+    if any(error.type_name == TAG_MISMATCH for error in parser.error_log):
+        metrics.count('parse_bs4_fallbacks')
+        return _extract_bs4(html, selectors, strip)
+    texts = []
+    for xpath in xpaths:
+        found = root.xpath(xpath)
+        texts.append(_join(_strings(found[0]), strip) if found else None)
+    return texts
+
+
+BACKENDS = {'bs4': _extract_bs4}
+if HAVE_LXML:
+    BACKENDS['lxml'] = _extract_lxml
+
+
+@metrics.timed('parse')
+def extract_texts(html, selectors, strip=False, backend=None):
+    """
+    selectors のそれぞれについて、最初に一致した要素のテキストを並べて返します
+    （見つからなかったものは None）。HTML の解析は1回だけです。
+    """
+    backend = backend or HTML_BACKEND
+    if backend == 'auto':
+        backend = 'lxml' if HAVE_LXML else 'bs4'
+    return BACKENDS[backend](html, selectors, strip)
+
+
+def extract_text(html, selector, strip=False, backend=None):
+    """
+    selector に最初に一致した要素のテキストを返します（見つからなければ None）。
+    """
+    return extract_texts(html, [selector], strip, backend)[0]
@@ -0,0 +1,138 @@
+"""
+カクヨムの作品情報の読み込み。
+
+以前は get_novel_title と get_episode_links がそれぞれ同じ作品ページを取得し、
+片方は <title> のためだけに BeautifulSoup で解析、もう片方は数 MB の HTML 全体に
+非貪欲な正規表現をかけていました（タイトル中のエスケープされた " で壊れる）。
+
+ここでは作品ページを1回だけ取得し、埋め込まれている Next.js / Apollo の状態 JSON
+（<script id="__NEXT_DATA__">）を1回だけデコードして、
+タイトル・話の一覧（順番どおり）・章構成・更新日時をまとめた小さな構造にして返します。
+同じ実行の中で2回目以降に呼ばれた場合は、取得済みの結果を返します。
+"""
+import html
+import json
+import re
+import threading
+from collections import namedtuple
+
+from common import metrics
+from common.session import fetch_cached
+
+Work = namedtuple('Work', ['work_id', 'title', 'work_title', 'updated_at', 'episode_count', 'chapters', 'episodes'])
+Chapter = namedtuple('Chapter', ['id', 'title', 'level'])
+Episode = namedtuple('Episode', ['id', 'title', 'url', 'published_at', 'chapter'])
+
+WORK_URL_RE = re.compile(r'(https?://[^/]+/works/(\d+))')
+TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.S | re.I)
+NEXT_DATA_START = '<script id="__NEXT_DATA__" type="application/json">'
+# __NEXT_DATA__ がないページ用。タイトル中の \" も正しく扱う
+FALLBACK_EPISODE_RE = re.compile(
+    r'"__typename":"Episode","id":"((?:[^"\\]|\\.)*)","title":"((?:[^"\\]|\\.)*)"'
+)
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def _page_title(text):
+    """
+    <title> から「 - カクヨム …」以降を除いたもの（保存フォルダ名の元。従来と同じ値）。
+    """
+    match = TITLE_RE.search(text, 0, 200000)
+    if not match:
+        return 'タイトルなし'
+    title_text = html.unescape(match.group(1)).strip()
+    # 「　− カクヨム …」以降を除去
+    return re.sub(r'\s*[-ー]?\s*カクヨム.*$', '', title_text)
+
+
+def _resolve(state, value):
+    if isinstance(value, dict) and '__ref' in value:
+        return state.get(value['__ref']) or {}
+    return value or {}
+
+
+@metrics.timed('parse')
+def parse_work_page(response):
+    """
+    作品ページの HTML から作品情報を取り出し、JSON にできる辞書で返します
+    （common.session.fetch_cached でそのまま保存できるように）。
+    """
+    text = response.text
+    work_id = WORK_URL_RE.search(response.url).group(2)
+    data = {
+        'work_id': work_id,
+        'title': _page_title(text),
+        'work_title': None,
+        'updated_at': None,
+        'episode_count': 0,
+        'chapters': [],
+        'episodes': [],
+    }
+
+    start = text.find(NEXT_DATA_START)
+    if start < 0:
+        for ep_id, ep_title in FALLBACK_EPISODE_RE.findall(text):
+            data['episodes'].append([json.loads(f'"{ep_id}"'), json.loads(f'"{ep_title}"'), None, None])
+        data['episode_count'] = len(data['episodes'])
+        return data
+
+    start += len(NEXT_DATA_START)
+    end = text.find('</script>', start)
+    state = json.loads(text[start:end])['props']['pageProps']['__APOLLO_STATE__']
+    work = state.get(f'Work:{work_id}') or {}
+    data['work_title'] = work.get('title')
+    data['updated_at'] = work.get('lastEpisodePublishedAt') or work.get('editedAt')
+
+    toc = work.get('tableOfContents')
+    if toc:
+        for entry in toc:
+            entry = _resolve(state, entry)
+            chapter = _resolve(state, entry.get('chapter'))
+            chapter_index = None
+            if chapter:
+                chapter_index = len(data['chapters'])
+                data['chapters'].append([chapter.get('id'), chapter.get('title'), chapter.get('level')])
+            for ref in entry.get('episodeUnions') or entry.get('episodes') or []:
+                episode = _resolve(state, ref)
+                if episode.get('id'):
+                    data['episodes'].append(
+                        [episode['id'], episode.get('title'), episode.get('publishedAt'), chapter_index]
+                    )
+    else:
+        # 目次の構造がなければ、状態に出てくる順に話を並べる
+        for key, value in state.items():
+            if key.startswith('Episode:') and isinstance(value, dict) and value.get('id'):
+                data['episodes'].append([value['id'], value.get('title'), value.get('publishedAt'), None])
+
+    data['episode_count'] = work.get('publicEpisodeCount') or len(data['episodes'])
+    return data
+
+
+def _to_work(novel_url, data):
+    base_url = WORK_URL_RE.match(novel_url).group(1)
+    chapters = [Chapter(*chapter) for chapter in data['chapters']]
+    episodes = [
+        Episode(ep_id, ep_title, f'{base_url}/episodes/{ep_id}', published_at,
+                chapters[chapter_index] if chapter_index is not None else None)
+        for ep_id, ep_title, published_at, chapter_index in data['episodes']
+    ]
+    return Work(data['work_id'], data['title'], data['work_title'], data['updated_at'],
+                int(data['episode_count']), chapters, episodes)
+
+
+def load_work(novel_url, refresh=False):
+    """
+    作品ページを（条件付き GET で）1回だけ取得して Work を返します。
+    同じ実行の中では結果を使い回します（refresh=True で取り直し）。
+    """
+    if not WORK_URL_RE.match(novel_url):
+        raise ValueError(f'カクヨムの作品URLではありません: {novel_url}')
+    with _memo_lock:
+        if not refresh and novel_url in _memo:
+            return _memo[novel_url]
+    work = _to_work(novel_url, fetch_cached(novel_url, parse_work_page, name='kakuyomu-work'))
+    with _memo_lock:
+        _memo[novel_url] = work
+    return work
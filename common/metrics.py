@@ -0,0 +1,280 @@
+"""
+処理の段ごとの所要時間（スパン）とカウンタの記録。
+
+「遅かった夜」が取得・解析・翻訳・保存・履歴の同期・アップロードのどこに使われたのかを
+あとから見られるように、各段をスパンで囲み、取得バイト数・翻訳文字数・再試行・キャッシュヒット・
+キューの長さなどを数えます。
+
+- METRICS_LOG  : 1件ごとのイベントを JSON Lines で追記（既定 <作業ディレクトリ>/metrics.jsonl）
+- METRICS_PROM : 終了時に Prometheus の textfile 形式でサイトごとの集計を書き出し
+                 （既定 <作業ディレクトリ>/novel_download.prom。node_exporter の textfile collector 用）
+- report()     : 実行の最後に、サイトごと・作品ごとの集計表を表示
+
+どちらのファイルも環境変数に空文字を指定すると書き出しません。
+常駐モードでも際限なく大きくならないよう、METRICS_LOG は METRICS_LOG_MAX_BYTES を超えたら「.1」に回し（1世代だけ残す）、
+スパンは段・ラベルごとに回数・合計と直近 SPAN_WINDOW 件の値（パーセンタイル用）だけを持ちます。
+サイト名・作品 URL は labels() で囲んだ範囲の記録に自動で付きます（contextvars で受け渡すので、
+スレッドやスレッドプールに処理を渡すときは copy_context() で文脈を引き継いでください）。
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+WORK_DIR = os.environ.get('WORK_DIR', '/tmp')
+METRICS_LOG = os.environ.get('METRICS_LOG', os.path.join(WORK_DIR, 'metrics.jsonl'))
+METRICS_PROM = os.environ.get('METRICS_PROM', os.path.join(WORK_DIR, 'novel_download.prom'))
+METRICS_LOG_MAX_BYTES = int(os.environ.get('METRICS_LOG_MAX_BYTES', str(64 * 1024 * 1024)))
+SPAN_WINDOW = int(os.environ.get('METRICS_SPAN_WINDOW', '200'))
+
+# 集計表に出す段とカウンタ
+SUMMARY_STAGES = ['fetch', 'parse', 'translate', 'write', 'history_sync', 'upload']
+SUMMARY_COUNTERS = ['bytes_fetched', 'chars_translated', 'http_retries', 'translate_retries',
+                    'translate_cache_hits']
+
+_labels = contextvars.ContextVar('metrics_labels', default=())
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_gauges = {}
+_log = None
+
+
+def _emit(event):
+    global _log
+    if not METRICS_LOG:
+        return
+    line = json.dumps(event, ensure_ascii=False)
+    with _lock:
+        if _log is None:
+            os.makedirs(os.path.dirname(METRICS_LOG) or '.', exist_ok=True)
+            _log = open(METRICS_LOG, 'a', encoding='utf-8')
+        _log.write(line + '\n')
+        _log.flush()
+        if METRICS_LOG_MAX_BYTES and _log.tell() >= METRICS_LOG_MAX_BYTES:
+            _log.close()
+            os.replace(METRICS_LOG, f'{METRICS_LOG}.1')
+            _log = open(METRICS_LOG, 'a', encoding='utf-8')
+
+
+class SpanStats:
+    """
+    1つの段・ラベルの組のスパンの回数・合計秒数と、直近 window 件の値（None なら全部。集計用）。
+    """
+
+    def __init__(self, window=SPAN_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.recent.extend(other.recent)
+
+
+def current_labels():
+    return dict(_labels.get())
+
+
+@contextmanager
+def labels(**extra):
+    """
+    この範囲で記録するスパン・カウンタに site / novel などのラベルを付けます。
+    """
+    merged = dict(_labels.get())
+    merged.update(extra)
+    token = _labels.set(tuple(sorted(merged.items())))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def record_span(name, seconds, ok=True):
+    key = (name, _labels.get())
+    with _lock:
+        stats = _spans.get(key)
+        if stats is None:
+            stats = _spans[key] = SpanStats()
+        stats.add(seconds)
+    _emit({'ts': time.time(), 'kind': 'span', 'name': name, 'seconds': round(seconds, 6), 'ok': ok,
+           **dict(key[1])})
+
+
+@contextmanager
+def span(name):
+    """
+    with span('fetch'): … の所要時間を記録します（例外で抜けた場合も ok=False で記録）。
+    """
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_span(name, time.perf_counter() - start, ok)
+
+
+def timed(name):
+    """
+    関数の呼び出しごとに span(name) で囲むデコレータ。
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    カウンタ name に value を足します。
+    """
+    key = (name, _labels.get())
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _emit({'ts': time.time(), 'kind': 'count', 'name': name, 'value': value, **dict(key[1])})
+
+
+def gauge(name, value, **extra):
+    """
+    キューの長さなど「今の値」を記録します（最後の値と最大値を残す）。
+    """
+    merged = dict(_labels.get())
+    merged.update(extra)
+    key = (name, tuple(sorted(merged.items())))
+    with _lock:
+        _, peak = _gauges.get(key, (0, value))
+        _gauges[key] = (value, max(peak, value))
+    _emit({'ts': time.time(), 'kind': 'gauge', 'name': name, 'value': value, **merged})
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def _group(only_site):
+    """
+    記録を (site, novel) ごとにまとめます（スパンは段ごとの SpanStats）。only_site=True なら novel を区別しない。
+    """
+    spans = {}
+    counters = {}
+    with _lock:
+        span_items = []
+        for key, stats in _spans.items():
+            copy = SpanStats(None)
+            copy.merge(stats)
+            span_items.append((key, copy))
+        counter_items = list(_counters.items())
+    for (name, label_items), stats in span_items:
+        label_map = dict(label_items)
+        group = (label_map.get('site', '-'), None if only_site else label_map.get('novel'))
+        spans.setdefault(group, {}).setdefault(name, SpanStats(None)).merge(stats)
+    for (name, label_items), value in counter_items:
+        label_map = dict(label_items)
+        group = (label_map.get('site', '-'), None if only_site else label_map.get('novel'))
+        counters.setdefault(group, {})[name] = counters.get(group, {}).get(name, 0) + value
+    return spans, counters
+
+
+def write_prometheus(path=None):
+    """
+    サイトごとの集計を Prometheus の textfile 形式で書き出します（一時ファイル経由で置き換え）。
+    """
+    path = METRICS_PROM if path is None else path
+    if not path:
+        return
+    spans, counters = _group(only_site=True)
+    lines = [
+        '# HELP novel_stage_seconds Time spent per pipeline stage.',
+        '# TYPE novel_stage_seconds summary',
+    ]
+    for (site, _), stages in sorted(spans.items()):
+        for stage, stats in sorted(stages.items()):
+            label = f'site="{site}",stage="{stage}"'
+            for q in (50, 95):
+                lines.append(f'novel_stage_seconds{{{label},quantile="0.{q}"}} {_percentile(stats.recent, q):.6f}')
+            lines.append(f'novel_stage_seconds_sum{{{label}}} {stats.total:.6f}')
+            lines.append(f'novel_stage_seconds_count{{{label}}} {stats.count}')
+    names = sorted({name for values in counters.values() for name in values})
+    for name in names:
+        lines.append(f'# TYPE novel_{name}_total counter')
+        for (site, _), values in sorted(counters.items()):
+            if name in values:
+                lines.append(f'novel_{name}_total{{site="{site}"}} {values[name]}')
+    with _lock:
+        gauge_items = list(_gauges.items())
+    # ゲージは作品ごとに記録しているので、novel を除いた同じラベルの組では最大値1行にまとめる
+    # （同じ系列が2行あると node_exporter はファイルごと読まない）
+    peaks = {}
+    for (name, label_items), (_, peak) in gauge_items:
+        label_map = dict(label_items)
+        label_map.pop('novel', None)
+        key = (name, tuple(sorted(label_map.items())))
+        peaks[key] = max(peaks.get(key, peak), peak)
+    for name in sorted({name for name, _ in peaks}):
+        lines.append(f'# TYPE novel_{name}_max gauge')
+        for (gauge_name, label_items), peak in sorted(peaks.items()):
+            if gauge_name == name:
+                label = ','.join(f'{k}="{v}"' for k, v in label_items)
+                lines.append(f'novel_{name}_max{{{label}}} {peak}')
+    lines.append(f'novel_last_run_timestamp_seconds {time.time():.0f}')
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+
+def _summary_rows(only_site):
+    spans, counters = _group(only_site)
+    rows = []
+    for group in sorted(set(spans) | set(counters), key=lambda g: (g[0], g[1] or '')):
+        stages = spans.get(group, {})
+        values = counters.get(group, {})
+        if not only_site and group[1] is None:
+            continue
+        empty = SpanStats()
+        rows.append((group, stages.get('write', empty).count,
+                     [stages.get(stage, empty).total for stage in SUMMARY_STAGES],
+                     [values.get(name, 0) for name in SUMMARY_COUNTERS]))
+    return rows
+
+
+def report():
+    """
+    サイトごと・作品ごとの集計表を表示し、Prometheus のファイルを書き出します。
+    """
+    header = (f"{'':<10}{'話数':>6}" + ''.join(f'{stage:>13}' for stage in SUMMARY_STAGES)
+              + f"{'取得MB':>9}{'翻訳文字':>10}{'再試行':>8}{'キャッシュ':>9}")
+    print('\n=== 段ごとの合計時間（秒）===')
+    print(header)
+    for only_site in (True, False):
+        for (site, novel), episodes, seconds, values in _summary_rows(only_site):
+            bytes_fetched, chars, http_retries, translate_retries, hits = values
+            print(f'{site:<10}{episodes:>6}' + ''.join(f'{s:>13.1f}' for s in seconds)
+                  + f'{bytes_fetched / 1024 / 1024:>9.1f}{chars:>10}{http_retries + translate_retries:>8}{hits:>9}'
+                  + (f'  {novel}' if novel else ''))
+    with _lock:
+        gauge_items = sorted(_gauges.items())
+    peaks = {}
+    for (name, label_items), (_, peak) in gauge_items:
+        queue_name = dict(label_items).get('queue', name)
+        peaks[queue_name] = max(peaks.get(queue_name, 0), peak)
+    if peaks:
+        print('キューの最大長: ' + ', '.join(f'{name} {peak}' for name, peak in sorted(peaks.items())))
+    write_prometheus()
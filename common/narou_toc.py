@@ -0,0 +1,127 @@
+"""
+小説家になろう / なろうR18 の目次（話一覧）の読み込み。
+
+以前は「次へ」リンクを1ページずつたどり、全ページの BeautifulSoup を抱えたまま
+最後のページまで読み終わるまで1話もダウンロードしていませんでした。
+
+ここでは1ページ目の「最後へ」リンクから総ページ数を読み取り、2ページ目以降を並列に取得して、
+(話数, サブタイトル, リンク, 更新日時) の軽いレコードを順番どおりにジェネレータで返します。
+更新日時は改稿されていれば改稿日時、なければ掲載日時です（common.episode_index で改稿の検出に使う）。
+1ページ目の分はすぐに返すので、後ろのページを取得している間にダウンロードを始められます。
+"""
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from common import metrics
+from common.session import fetch_cached
+
+TOC_WORKERS = int(os.environ.get('TOC_WORKERS', '4'))
+
+Episode = namedtuple('Episode', ['index', 'title', 'href', 'updated_at'])
+
+PAGE_RE = re.compile(r'([?&]p=)(\d+)')
+DATE_RE = re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}')
+
+
+def _updated_at(update):
+    """
+    .p-eplist__update から更新日時を取り出します。
+    改稿された話は <span title="2024/02/01 12:00 改稿">（改）</span> の日時を使います。
+    """
+    if update is None:
+        return None
+    revised = update.select_one('span[title]')
+    match = DATE_RE.search(revised.get('title', '')) if revised else None
+    match = match or DATE_RE.search(update.get_text(' '))
+    return match.group(0) if match else None
+
+
+@metrics.timed('parse')
+def parse_toc_page(res):
+    """
+    目次ページ1枚分を、タイトル・[サブタイトル, リンク, 更新日時] の一覧・次ページ / 最終ページのリンクに変換します。
+    """
+    soup = BeautifulSoup(res.text, 'html.parser')
+    next_link = soup.select_one('.c-pager__item--next')
+    last_link = soup.select_one('.c-pager__item--last')
+    return {
+        'title': soup.find('title').get_text(),
+        'episodes': [[sub.text.strip(), sub.get('href'), _updated_at(item.select_one('.p-eplist__update'))]
+                     for item in soup.select('.p-eplist__sublist')
+                     for sub in item.select('.p-eplist__subtitle')],
+        'next': next_link.get('href') if next_link else None,
+        'last': last_link.get('href') if last_link else None,
+    }
+
+
+def _page_hrefs(page):
+    """
+    1ページ目の「最後へ」リンク（…?p=31）から、2ページ目以降のリンクを作ります。
+    総ページ数が読み取れなければ None。
+    """
+    last = page.get('last')
+    match = PAGE_RE.search(last) if last else None
+    if not match:
+        return None
+    last_page = int(match.group(2))
+    return [PAGE_RE.sub(lambda m: f'{m.group(1)}{n}', last, count=1) for n in range(2, last_page + 1)]
+
+
+def read_toc(novel_url, base_url, cookies=None, workers=None):
+    """
+    目次を読み込み、(小説タイトル, Episode のジェネレータ) を返します。
+
+    1ページ目はこの関数の中で取得します（タイトルが必要なため）。
+    2ページ目以降はジェネレータを回し始めてから並列に取得し、順番どおりに返します。
+    """
+    workers = workers or TOC_WORKERS
+
+    def load(url):
+        return fetch_cached(url, parse_toc_page, name='narou-toc-page-v2', cookies=cookies)
+
+    first = load(novel_url)
+
+    def episodes():
+        index = 0
+        for sub_title, link, updated_at in first['episodes']:
+            index += 1
+            yield Episode(index, sub_title, link, updated_at)
+
+        hrefs = _page_hrefs(first)
+        if hrefs is None:
+            # 総ページ数がわからない場合は「次へ」を順にたどる
+            page = first
+            while page['next']:
+                page = load(f'{base_url}{page["next"]}')
+                for sub_title, link, updated_at in page['episodes']:
+                    index += 1
+                    yield Episode(index, sub_title, link, updated_at)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            # 先読みしすぎないよう、ワーカー数の2倍までを先に投げておく
+            futures = []
+            pending_hrefs = iter(hrefs)
+            for href in pending_hrefs:
+                futures.append(executor.submit(load, f'{base_url}{href}'))
+                if len(futures) >= workers * 2:
+                    break
+            while futures:
+                page = futures.pop(0).result()
+                next_href = next(pending_hrefs, None)
+                if next_href is not None:
+                    futures.append(executor.submit(load, f'{base_url}{next_href}'))
+                for sub_title, link, updated_at in page['episodes']:
+                    index += 1
+                    yield Episode(index, sub_title, link, updated_at)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    return first['title'], episodes()
@@ -0,0 +1,154 @@
+"""
+取得 → 翻訳 → 書き込み の3段パイプライン。
+
+1話ずつ「取得して翻訳して保存」を直列に回すと、遅い翻訳の間ネットワークが遊んでしまうため、
+各段をワーカースレッドに分け、段と段の間を上限付きキューでつなぎます。
+
+- fetch     : FETCH_WORKERS 本のスレッドで先読み取得
+- translate : TRANSLATE_WORKERS 本のスレッドで並列翻訳
+- write     : 呼び出し元スレッドで「元の順番どおり」に1件ずつ実行
+
+write が順番どおりにしか呼ばれないので、履歴は今までと同じく1話ずつ前にしか進みません。
+"""
+import contextvars
+import os
+import queue
+import threading
+
+from common import metrics
+
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', '2'))
+TRANSLATE_WORKERS = int(os.environ.get('TRANSLATE_WORKERS', '4'))
+QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '8'))
+
+_STOP = object()
+
+
+def _worker(func, in_q, out_q, stop_event, state, lock, n_next, out_name):
+    """
+    in_q から (連番, 値, 例外) を取り出して func を適用し、out_q へ流します。
+    前段で例外になったものは何もせずにそのまま後ろへ渡します。
+    最後に終わったワーカーが次段のワーカー数ぶんの _STOP を流します。
+    """
+    while True:
+        entry = in_q.get()
+        if entry is _STOP:
+            with lock:
+                state['alive'] -= 1
+                last = state['alive'] == 0
+            if last:
+                for _ in range(n_next):
+                    out_q.put(_STOP)
+            return
+        seq, value, error = entry
+        if stop_event.is_set():
+            # 中断中は処理せずに読み捨てる（キューを詰まらせないため）
+            continue
+        if error is None:
+            try:
+                value = func(value)
+            except Exception as e:
+                value, error = None, e
+        out_q.put((seq, value, error))
+        metrics.gauge('queue_depth', out_q.qsize(), queue=out_name)
+
+
+def run_pipeline(items, fetch, translate, write,
+                 fetch_workers=None, translate_workers=None, queue_size=None):
+    """
+    items の各要素を fetch → translate → write の順に流します。
+
+    - fetch(item) の戻り値が translate に、translate の戻り値が write に渡されます。
+    - fetch / translate は並列、write は items の順番どおりに呼び出し元スレッドで実行。
+    - 途中の要素で例外が出た場合は、それより前の要素の write をすべて終えたあと、
+      残りを打ち切ってその例外を送出します（後ろの話が先に履歴へ載ることはありません）。
+    - items はジェネレータでも構いません（必要になった分だけ先読みします）。
+
+    戻り値: write まで終わった件数
+    """
+    fetch_workers = fetch_workers or FETCH_WORKERS
+    translate_workers = translate_workers or TRANSLATE_WORKERS
+    queue_size = queue_size or QUEUE_SIZE
+
+    fetch_q = queue.Queue(maxsize=queue_size)
+    translate_q = queue.Queue(maxsize=queue_size)
+    done_q = queue.Queue()
+    stop_event = threading.Event()
+    lock = threading.Lock()
+    # 並べ替え待ちで溜まる件数の上限（遅い1話の後ろに無制限に溜め込まないため）
+    in_flight = threading.BoundedSemaphore(queue_size * 2 + fetch_workers + translate_workers)
+    feeder_error = []
+
+    def feeder():
+        try:
+            for seq, item in enumerate(items):
+                while not in_flight.acquire(timeout=0.5):
+                    if stop_event.is_set():
+                        return
+                if stop_event.is_set():
+                    return
+                fetch_q.put((seq, item, None))
+                metrics.gauge('queue_depth', fetch_q.qsize(), queue='fetch')
+        except Exception as e:
+            feeder_error.append(e)
+        finally:
+            for _ in range(fetch_workers):
+                fetch_q.put(_STOP)
+
+    fetch_state = {'alive': fetch_workers}
+    translate_state = {'alive': translate_workers}
+    # ワーカーにも呼び出し元の文脈（metrics のラベルなど）を引き継ぐ
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(feeder,), daemon=True)]
+    threads += [
+        threading.Thread(target=contextvars.copy_context().run, daemon=True,
+                         args=(_worker, fetch, fetch_q, translate_q, stop_event, fetch_state, lock,
+                               translate_workers, 'translate'))
+        for _ in range(fetch_workers)
+    ]
+    threads += [
+        threading.Thread(target=contextvars.copy_context().run, daemon=True,
+                         args=(_worker, translate, translate_q, done_q, stop_event, translate_state, lock,
+                               1, 'write'))
+        for _ in range(translate_workers)
+    ]
+    for t in threads:
+        t.start()
+
+    pending = {}
+    next_seq = 0
+    written = 0
+    first_error = None
+    try:
+        while True:
+            entry = done_q.get()
+            if entry is _STOP:
+                break
+            if stop_event.is_set():
+                continue
+            seq, value, error = entry
+            pending[seq] = (value, error)
+            metrics.gauge('queue_depth', len(pending), queue='reorder')
+            while next_seq in pending:
+                value, error = pending.pop(next_seq)
+                next_seq += 1
+                if error is not None:
+                    raise error
+                write(value)
+                written += 1
+                in_flight.release()
+    except BaseException as e:
+        first_error = e
+        stop_event.set()
+        # 残っているワーカーが終わるまで読み捨てる
+        while entry is not _STOP:
+            entry = done_q.get()
+    finally:
+        stop_event.set()
+        for t in threads:
+            t.join()
+
+    if first_error is not None:
+        raise first_error
+    if feeder_error:
+        raise feeder_error[0]
+    return written
@@ -0,0 +1,181 @@
+"""
+「前回から何か変わったか？」の事前チェック。
+
+毎回すべての小説の目次を取得してから「話数が履歴と同じだった」とわかるのは無駄なので、
+先に話数と最終更新日時だけをまとめて問い合わせ、変わった作品だけを本処理に回します。
+
+- 小説家になろう / なろうR18 : なろう小説API の ncode 複数指定（最大 500 件 / リクエスト）
+- カクヨム                   : 作品ページに埋め込まれた作品情報（条件付き GET なので変化がなければ 304）
+
+問い合わせた結果は作品ごとの状態（NovelStateIndex）と比べ、
+「話数が履歴より多い」「最終更新日時が前回と違う」「情報が取れなかった」ものを変更ありとします。
+状態は本処理が最後まで終わった作品だけ更新するので、途中で失敗した作品は次回も変更ありになります。
+"""
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics
+from common.kakuyomu_work import load_work
+from common.session import fetch
+
+NAROU_API_URL = os.environ.get('NAROU_API_URL', 'https://api.syosetu.com/novelapi/api/')
+NAROU18_API_URL = os.environ.get('NAROU18_API_URL', 'https://api.syosetu.com/novel18api/api/')
+# なろう小説API の1リクエストあたりの最大件数
+API_BATCH = 500
+KAKUYOMU_WORKERS = int(os.environ.get('PRECHECK_WORKERS', '4'))
+
+NCODE_RE = re.compile(r'/(n\d+[a-z]+)', re.IGNORECASE)
+
+
+class NovelStateIndex:
+    """
+    作品ごとの {話数, 最終更新日時} を JSON で保存し、履歴と同じく Drive と同期します。
+    最終更新日時が変わったのを見つけた時刻（changed_at）と、その間隔の移動平均（interval 秒）も残し、
+    常駐モード（common.watch）がよく更新される作品ほど頻繁に見に行くのに使います。
+    shared=True（複数台）では、保存時に Drive 上の内容へ今回記録した作品の分だけを重ねます。
+    """
+
+    def __init__(self, local_path, remote_path, shared=False):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._changed = set()
+        if shared or not os.path.exists(local_path):
+            subprocess.run(['rclone', 'copyto', remote_path, local_path], check=False)
+        self._data = self._load(local_path) or {}
+
+    @staticmethod
+    def _load(path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            print(f'作品状態ファイルが壊れているため作り直します: {path}')
+            return None
+
+    def get(self, url):
+        return self._data.get(url)
+
+    def mark(self, url, meta):
+        """
+        本処理が終わった作品の最新情報を記録します。
+        """
+        if not meta:
+            return
+        with self._lock:
+            previous = self._data.get(url) or {}
+            meta = dict(meta, changed_at=previous.get('changed_at'), interval=previous.get('interval'))
+            if previous.get('updated_at') != meta.get('updated_at'):
+                now = time.time()
+                if previous.get('changed_at'):
+                    gap = now - previous['changed_at']
+                    meta['interval'] = gap if not previous.get('interval') else (previous['interval'] + gap) / 2
+                meta['changed_at'] = now
+            self._data[url] = meta
+            self._changed.add(url)
+            self._dirty = True
+
+    def save(self):
+        """
+        ローカルに書き出して Drive へ上書きコピーします。
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.shared:
+                remote_copy = f'{self.local_path}.remote'
+                subprocess.run(['rclone', 'copyto', self.remote_path, remote_copy], check=False)
+                remote = self._load(remote_copy) or {}
+                if os.path.exists(remote_copy):
+                    os.remove(remote_copy)
+                for url, meta in remote.items():
+                    if url not in self._changed:
+                        self._data[url] = meta
+            tmp_path = f'{self.local_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.local_path)
+            self._dirty = False
+        subprocess.run(['rclone', 'copyto', self.local_path, self.remote_path], check=False)
+
+
+def narou_metadata(urls, api_url=NAROU_API_URL):
+    """
+    なろう小説API で各作品の {count: 総話数, updated_at: 最終更新日時} を取得します。
+    戻り値: {小説URL: 情報}（API が返さなかった作品は含まれない）
+    """
+    by_ncode = {}
+    for url in urls:
+        match = NCODE_RE.search(url)
+        if match:
+            by_ncode[match.group(1).lower()] = url
+
+    result = {}
+    ncodes = list(by_ncode)
+    for start in range(0, len(ncodes), API_BATCH):
+        batch = ncodes[start:start + API_BATCH]
+        try:
+            response = fetch(f'{api_url}?out=json&of=n-ga-nu&lim={API_BATCH}&ncode={"-".join(batch)}')
+            response.raise_for_status()
+            rows = response.json()
+        except Exception as e:
+            print(f'なろう小説API の問い合わせに失敗しました（全件を変更ありとして扱います）: {e}')
+            continue
+        # 先頭の要素は {"allcount": N}
+        for row in rows[1:]:
+            url = by_ncode.get(str(row.get('ncode', '')).lower())
+            if url:
+                result[url] = {
+                    'count': int(row.get('general_all_no') or 0),
+                    'updated_at': row.get('novelupdated_at'),
+                }
+    return result
+
+
+def kakuyomu_metadata(urls, workers=KAKUYOMU_WORKERS):
+    """
+    カクヨムの各作品ページから {count, updated_at} を取得します。
+    条件付き GET なので、変化のない作品はほぼ通信なしで前回の結果が返ります。
+    事前チェックは常に作品ページを取り直し（常駐モードで同じ作品を何度も見るため）、
+    その結果を common.kakuyomu_work が覚えているので、続く本処理で取り直すことはありません。
+    """
+    # ワーカースレッドでも呼び出し元の metrics のラベル（サイト名）を付ける
+    current_labels = metrics.current_labels()
+
+    def one(url):
+        try:
+            with metrics.labels(**current_labels):
+                work = load_work(url, refresh=True)
+            return url, {'count': work.episode_count, 'updated_at': work.updated_at}
+        except Exception as e:
+            print(f'作品情報の取得に失敗しました: {url} → {e}')
+            return url, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {url: meta for url, meta in executor.map(one, urls) if meta}
+
+
+def filter_changed(urls, metadata, history, state):
+    """
+    本処理が必要な作品の URL だけを元の順番で返します。
+    """
+    changed = []
+    for url in urls:
+        meta = metadata.get(url)
+        previous = state.get(url)
+        if (meta is None
+                or meta['count'] > history.get(url, 0)
+                or previous is None
+                or previous.get('updated_at') != meta.get('updated_at')):
+            changed.append(url)
+    print(f'事前チェック: {len(urls)} 作品中 {len(changed)} 作品に更新あり')
+    return changed
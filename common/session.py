@@ -0,0 +1,310 @@
+"""
+3サイト共通の HTTP アクセス。
+
+requests.get を毎回呼ぶと、そのたびに TCP+TLS 接続を張り直すことになるため、
+接続プール付きの Session を使い回します（Keep-Alive / gzip・brotli 圧縮）。
+
+目次ページのように「たいてい前回と同じ」ページは fetch_cached を使うと、
+ETag / Last-Modified で条件付き GET を行い、304 が返れば
+前回解析した結果をそのまま返します（本文のダウンロードも HTML の解析もしない）。
+
+複数のサイト・小説を同時に処理しても相手のサーバーに迷惑をかけないよう、
+ホストごとに同時接続数とリクエストのレートを制限します（HOST_LIMITS）。
+レートは固定ではなく、429 / 503 や遅い応答があれば下げ、問題なければ少しずつ上げて、
+そのホストが受け付けてくれる速さに合わせます。429 / 5xx・接続エラーは待ってから再試行します。
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import metrics
+
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', '/tmp/http_cache')
+USER_AGENT = 'Mozilla/5.0'
+POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '16'))
+TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '60'))
+
+try:
+    # urllib3 は brotli パッケージがあるときだけ br を展開できる
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# ホストごとの (同時接続数, 開始時のレート[リクエスト/秒], 最大レート[リクエスト/秒])
+HOST_LIMITS = {
+    'kakuyomu.jp': (4, 2.0, 8.0),
+    'ncode.syosetu.com': (4, 2.0, 8.0),
+    'novel18.syosetu.com': (4, 2.0, 8.0),
+    'api.syosetu.com': (1, 1.0, 2.0),
+}
+DEFAULT_HOST_LIMIT = (4, 5.0, 20.0)
+MIN_RATE = float(os.environ.get('HOST_MIN_RATE', '0.05'))
+# 成功するたびにレートを少しずつ上げ（加算）、429/503・遅い応答で大きく下げる（乗算）
+RATE_STEP = float(os.environ.get('HOST_RATE_STEP', '0.05'))
+SLOW_RESPONSE = float(os.environ.get('SLOW_RESPONSE_SECONDS', '5'))
+# 429 / 5xx・接続エラーのときの再試行
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', '4'))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '2'))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '120'))
+MAX_RETRY_AFTER = float(os.environ.get('MAX_RETRY_AFTER', '600'))
+
+
+def _parse_host_limits(value):
+    """
+    環境変数 HOST_LIMITS（例: "kakuyomu.jp=2:1.0:4,ncode.syosetu.com=4:2"）を読みます。
+    「同時接続数:開始レート:最大レート」で、最大レートを省くと開始レートと同じ（固定）になります。
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        host, _, spec = item.partition('=')
+        concurrency, rate, max_rate = (spec.split(':') + ['', ''])[:3]
+        rate = float(rate or DEFAULT_HOST_LIMIT[1])
+        limits[host.strip()] = (int(concurrency), rate, float(max_rate or rate))
+    return limits
+
+
+HOST_LIMITS.update(_parse_host_limits(os.environ.get('HOST_LIMITS', '')))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def retry_delay(attempt, retry_after=None):
+    """
+    attempt 回目（0始まり）の再試行までの待ち時間。指数的に伸ばしつつ揺らぎを入れ、
+    Retry-After があればそれより短くはしません。
+    """
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return max(retry_after or 0.0, random.uniform(ceiling / 2, ceiling))
+
+
+def parse_retry_after(value):
+    """
+    Retry-After（秒数または HTTP 日付）を秒数にします。読めなければ None。
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class HostLimiter:
+    """
+    1つのホストへの同時接続数とリクエストのレートを制限するトークンバケット。
+
+    レートは応答を見て自動で調整します。
+    - 普通の応答          : RATE_STEP ずつ上げる（max_rate まで）
+    - 遅い応答            : 0.8 倍
+    - 429 / 503・接続エラー : 半分にし、Retry-After があればその間はこのホストへ送らない
+    """
+
+    def __init__(self, concurrency, rate, max_rate=None):
+        self.rate = rate
+        self.max_rate = max_rate or rate
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_backoff = 0.0
+        self.throttled = 0
+
+    def _take_token(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def __enter__(self):
+        self._slots.acquire()
+        try:
+            self._take_token()
+        except BaseException:
+            self._slots.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+    def _slow_down(self, factor, now):
+        # 同時に飛んでいたリクエストがまとめて失敗しても、下げるのは1回分だけにする
+        if now - self._last_backoff >= 1.0 / self.rate:
+            self.rate = max(MIN_RATE, self.rate * factor)
+            self._last_backoff = now
+
+    def feedback(self, status, elapsed, retry_after=None):
+        """
+        応答の結果（status=None は接続エラー・タイムアウト）からレートを調整します。
+        """
+        with self._lock:
+            now = time.monotonic()
+            if status is None or status in (429, 503):
+                self.throttled += 1
+                self._slow_down(0.5, now)
+                self._tokens = 0.0
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+            elif elapsed >= SLOW_RESPONSE:
+                self._slow_down(0.8, now)
+            elif status < 400:
+                self.rate = min(self.max_rate, self.rate + RATE_STEP)
+
+
+def host_limiter(host):
+    """
+    ホストごとに1つの HostLimiter を返します。
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(*HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+            _limiters[host] = limiter
+        return limiter
+
+
+def report_limits():
+    """
+    ホストごとの最終的なレートと、制限された（429/503 など）回数を表示します。
+    """
+    with _limiters_lock:
+        limiters = sorted(_limiters.items())
+    for host, limiter in limiters:
+        print(f'{host}: {limiter.rate:.2f} リクエスト/秒（制限・エラー {limiter.throttled} 回）')
+
+
+def get_session(cookies=None):
+    """
+    cookies ごとに1つの Session を作って使い回します。
+    """
+    key = tuple(sorted((cookies or {}).items()))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept-Encoding': ACCEPT_ENCODING,
+            })
+            if cookies:
+                session.cookies.update(cookies)
+            _sessions[key] = session
+        return session
+
+
+def fetch(url, cookies=None, headers=None, retries=None):
+    """
+    プール済みの Session で GET します（ステータスの確認は呼び出し側で）。
+    ホストごとの制限を守るまで待ってから送り、429 / 5xx・接続エラーなら
+    retries 回まで（Retry-After を守りつつ）間をおいて再試行します。
+    """
+    limiter = host_limiter(urlparse(url).hostname)
+    session = get_session(cookies)
+    retries = FETCH_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        start = time.monotonic()
+        try:
+            with limiter:
+                start = time.monotonic()
+                response = session.get(url, headers=headers, timeout=TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            limiter.feedback(None, time.monotonic() - start)
+            metrics.count('http_errors')
+            if attempt == retries:
+                raise
+            metrics.count('http_retries')
+            time.sleep(retry_delay(attempt))
+            continue
+
+        elapsed = time.monotonic() - start
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        limiter.feedback(response.status_code, elapsed, retry_after)
+        metrics.record_span('http', elapsed, response.status_code < 400)
+        metrics.count('bytes_fetched', len(response.content))
+        if response.status_code in (429, 503):
+            metrics.count('http_throttled')
+        if response.status_code not in RETRY_STATUSES or attempt == retries:
+            return response
+        metrics.count('http_retries')
+        time.sleep(retry_delay(attempt, retry_after))
+
+
+def _cache_path(url, name):
+    digest = hashlib.sha1(f'{name}\n{url}'.encode('utf-8')).hexdigest()
+    return os.path.join(HTTP_CACHE_DIR, f'{digest}.json')
+
+
+def fetch_cached(url, parse, name='page', cookies=None):
+    """
+    条件付き GET でページを取得し、parse(response) の結果を返します。
+
+    - 前回のレスポンスに ETag / Last-Modified があれば If-None-Match / If-Modified-Since を付ける
+    - 304 なら前回保存した parse の結果をそのまま返す
+    - 200 なら parse し、検証用ヘッダと一緒に結果を保存する
+      （parse の結果は JSON にできる値であること）
+
+    name は同じ URL を別の解析関数で使うときの区別用です。
+    """
+    path = _cache_path(url, name)
+    cached = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    response = fetch(url, cookies=cookies, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached['parsed']
+    response.raise_for_status()
+
+    parsed = parse(response)
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        tmp_path = f'{path}.tmp.{threading.get_ident()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'etag': etag, 'last_modified': last_modified, 'parsed': parsed},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    return parsed
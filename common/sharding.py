@@ -0,0 +1,330 @@
+"""
+複数台での分担（シャーディング）とリース（作品ごとの処理権）。
+
+同じ URL 一覧を複数のマシンで動かすと、どちらも同じ作品を取得して同じ履歴ファイルを上書きし合うため、
+SHARD_LEASE_DIR（全台から見える共有ディレクトリ）を指定したときだけ次のように動きます。
+
+- 各ノードは SHARD_LEASE_DIR/nodes/<ノードID>.json を定期的に書き直して生存を知らせる（ハートビート）
+- 生きているノードでコンシステントハッシュのリングを作り、作品 URL ごとに担当ノードを決める
+  （ノードが増減しても、担当が変わるのはおよそ 1/ノード数 の作品だけ）
+- 作品を処理する前に SHARD_LEASE_DIR/leases/<URLのハッシュ>.json のリースを取る。
+  リースは LEASE_TTL 秒で切れ、処理中はハートビートと一緒に延長する
+- 落ちたノードのリースは期限が切れたあとで、新しく担当になったノードが引き継ぐ
+
+リースの作成は「一時ファイルを書いてから os.link」（既にあれば失敗する）、
+期限切れのリースの回収は「os.rename で退避してから中身を確かめる」で行うので、
+同時に取りに来ても取れるのは1台だけです。オブジェクトストアで代用する場合も、
+「存在しなければ作成」「条件付き削除」ができれば同じ手順で実装できます。
+期限は各マシンの時計で比べるので、時計は NTP などで合わせておいてください（ずれは LEASE_TTL より十分小さく）。
+"""
+import bisect
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+SHARD_LEASE_DIR = os.environ.get('SHARD_LEASE_DIR', '')
+NODE_ID = os.environ.get('NODE_ID') or f'{socket.gethostname()}-{os.getpid()}'
+LEASE_TTL = float(os.environ.get('LEASE_TTL', '300'))
+# リング上の1ノードあたりの仮想ノード数（多いほど担当の偏りが小さい）
+VNODES = int(os.environ.get('SHARD_VNODES', '64'))
+# 生存ノードの一覧を読み直す間隔（秒）
+RING_REFRESH = 5.0
+# 自分の分が終わったあと、ほかのノードの処理中の作品（落ちたら引き継ぐ）を見届ける最大時間（秒）
+DRAIN_WAIT = float(os.environ.get('SHARD_DRAIN_WAIT', '3600'))
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    コンシステントハッシュのリング。
+    """
+
+    def __init__(self, nodes, vnodes=VNODES):
+        self.nodes = sorted(nodes)
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[i]
+
+
+class LeaseBusy(Exception):
+    """
+    ほかのノードがリースを持っている。落ちたノードのリースなら until（期限）を過ぎれば取れる。
+    """
+
+    def __init__(self, key, holder, until=None):
+        super().__init__(f'{key} は {holder} が処理中です')
+        self.key = key
+        self.holder = holder
+        self.until = until
+
+
+class LeaseLost(Exception):
+    """
+    処理中にリースを失った（延長できないうちに期限が切れ、ほかのノードが引き継いだ）。
+    """
+
+
+class Lease:
+    """
+    取得したリース1件。valid() が False になったら、その作品の処理をやめます。
+    """
+
+    def __init__(self, key, path, token, expires, taken_over_from=None):
+        self.key = key
+        self.path = path
+        self.token = token
+        self.expires = expires
+        # 期限切れのリースを引き継いだ場合の、前の持ち主
+        self.taken_over_from = taken_over_from
+        self.lost = False
+
+    def valid(self):
+        return not self.lost and time.time() < self.expires
+
+
+class LeaseStore:
+    """
+    共有ディレクトリ上のハートビートとリース。
+    """
+
+    def __init__(self, root, node_id=NODE_ID, ttl=LEASE_TTL):
+        self.root = root
+        self.node_id = node_id
+        self.ttl = ttl
+        self.nodes_dir = os.path.join(root, 'nodes')
+        self.leases_dir = os.path.join(root, 'leases')
+        os.makedirs(self.nodes_dir, exist_ok=True)
+        os.makedirs(self.leases_dir, exist_ok=True)
+        self._held = {}
+        self._lock = threading.Lock()
+        self._ring = None
+        self._ring_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- ファイル操作 ---
+
+    def _write_tmp(self, path, record):
+        tmp_path = f'{path}.{self.node_id}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def _create(self, path, record):
+        """
+        path がなければ record の内容で作ります（中身が書き終わった状態で現れる）。
+        """
+        tmp_path = self._write_tmp(path, record)
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _lease_path(self, key):
+        return os.path.join(self.leases_dir, f'{hashlib.sha1(key.encode("utf-8")).hexdigest()}.json')
+
+    # --- ハートビートとリング ---
+
+    def heartbeat(self):
+        """
+        生存を知らせ、持っているリースを延長します。
+        """
+        path = os.path.join(self.nodes_dir, f'{self.node_id}.json')
+        os.replace(self._write_tmp(path, {'node': self.node_id, 'expires': time.time() + self.ttl}), path)
+        with self._lock:
+            leases = list(self._held.values())
+        for lease in leases:
+            self.renew(lease)
+
+    def live_nodes(self):
+        now = time.time()
+        nodes = set()
+        for name in os.listdir(self.nodes_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.nodes_dir, name)
+                record = self._read(path)
+                if record and record.get('expires', 0) > now:
+                    nodes.add(record['node'])
+                elif record and record.get('expires', 0) < now - self.ttl * 10:
+                    # ずっと前に止まったノードの登録は片付ける
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        nodes.add(self.node_id)
+        return nodes
+
+    def ring(self):
+        now = time.monotonic()
+        if self._ring is None or now - self._ring_at >= RING_REFRESH:
+            self._ring = HashRing(self.live_nodes())
+            self._ring_at = now
+        return self._ring
+
+    def owns(self, key):
+        """
+        今の生存ノードで作ったリング上で、このノードが key の担当かどうか。
+        """
+        return self.ring().owner(key) == self.node_id
+
+    def is_alive(self, node_id):
+        if node_id == self.node_id:
+            return True
+        record = self._read(os.path.join(self.nodes_dir, f'{node_id}.json'))
+        return bool(record) and record.get('expires', 0) > time.time()
+
+    def holder(self, key):
+        """
+        key のリースの内容（{node, expires, …}）。誰も持っていなければ None。
+        """
+        return self._read(self._lease_path(key))
+
+    def busy_elsewhere(self):
+        """
+        生きているほかのノードが持っているリースの数。
+        """
+        busy = 0
+        for name in os.listdir(self.leases_dir):
+            if name.endswith('.json'):
+                record = self._read(os.path.join(self.leases_dir, name))
+                if record and record.get('node') != self.node_id and self.is_alive(record.get('node')):
+                    busy += 1
+        return busy
+
+    def start(self):
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.heartbeat()
+            except OSError as e:
+                print(f'ハートビートの書き込みに失敗しました: {e}')
+
+    def stop(self):
+        """
+        持っているリースを返し、ノードの登録を消します。
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            leases = list(self._held.values())
+        for lease in leases:
+            self.release(lease)
+        try:
+            os.remove(os.path.join(self.nodes_dir, f'{self.node_id}.json'))
+        except FileNotFoundError:
+            pass
+
+    # --- リース ---
+
+    def acquire(self, key):
+        """
+        key のリースを取って Lease を返します。取れなければ LeaseBusy。
+        """
+        path = self._lease_path(key)
+        token = uuid.uuid4().hex
+        record = {'key': key, 'node': self.node_id, 'token': token, 'expires': time.time() + self.ttl}
+        previous = None
+        if not self._create(path, record):
+            current = self._read(path)
+            if current is None:
+                # 持ち主がちょうど返したところ
+                if not self._create(path, record):
+                    raise LeaseBusy(key, '?')
+            elif current.get('node') != self.node_id and current.get('expires', 0) > time.time():
+                raise LeaseBusy(key, current.get('node'), current.get('expires'))
+            else:
+                # 期限切れ（または前回の自分）のリースを退避して回収する
+                stale_path = f'{path}.{token}.stale'
+                try:
+                    os.rename(path, stale_path)
+                except FileNotFoundError:
+                    raise LeaseBusy(key, '?')
+                grabbed = self._read(stale_path)
+                if grabbed and grabbed.get('token') != current.get('token'):
+                    # 見てから退避するまでの間に、ほかのノードが取り直していた → 元に戻す
+                    try:
+                        os.link(stale_path, path)
+                    except FileExistsError:
+                        pass
+                    os.remove(stale_path)
+                    raise LeaseBusy(key, grabbed.get('node'), grabbed.get('expires'))
+                os.remove(stale_path)
+                previous = current.get('node')
+                print(f'リースを引き継ぎます: {key}（前の持ち主 {previous}）')
+                if not self._create(path, record):
+                    holder = self._read(path) or {}
+                    raise LeaseBusy(key, holder.get('node'), holder.get('expires'))
+
+        lease = Lease(key, path, token, record['expires'], previous)
+        with self._lock:
+            self._held[key] = lease
+        return lease
+
+    def renew(self, lease):
+        """
+        リースを延長します。ほかのノードに取られていたら lost にして False を返します。
+        """
+        current = self._read(lease.path)
+        if not current or current.get('token') != lease.token:
+            lease.lost = True
+            with self._lock:
+                self._held.pop(lease.key, None)
+            return False
+        expires = time.time() + self.ttl
+        record = dict(current, expires=expires)
+        os.replace(self._write_tmp(lease.path, record), lease.path)
+        lease.expires = expires
+        return True
+
+    def release(self, lease):
+        with self._lock:
+            self._held.pop(lease.key, None)
+        current = self._read(lease.path)
+        if current and current.get('token') == lease.token:
+            try:
+                os.remove(lease.path)
+            except FileNotFoundError:
+                pass
+
+
+def from_env():
+    """
+    SHARD_LEASE_DIR が指定されていれば LeaseStore を開始して返します（なければ None）。
+    """
+    if not SHARD_LEASE_DIR:
+        return None
+    store = LeaseStore(SHARD_LEASE_DIR).start()
+    print(f'分担モード: ノード {store.node_id}（生存ノード {len(store.live_nodes())} 台）')
+    return store
@@ -0,0 +1,213 @@
+"""
+サイトごとの違いをまとめたアダプタ。
+
+カクヨム / 小説家になろう / なろうR18 の3つのスクリプトはほぼ同じ処理の写しだったため、
+サイトごとに違う部分（URL一覧・履歴ファイル・目次の読み方・本文の取り出し方・保存フォルダ名）だけを
+ここに集め、共通の処理は common.crawler で1回だけ書くようにしています。
+"""
+import os
+import re
+from collections import namedtuple
+
+from common.author_notes import EpisodeText, split_kakuyomu
+from common.html_extract import extract_text, extract_texts
+from common.kakuyomu_work import load_work
+from common.narou_toc import read_toc
+from common.precheck import NAROU18_API_URL, NAROU_API_URL, kakuyomu_metadata, narou_metadata
+from common.session import fetch
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 履歴・作品状態・ダウンロードしたファイルを置くローカルの作業ディレクトリ
+WORK_DIR = os.environ.get('WORK_DIR', '/tmp')
+
+# 目次の1話分: 話数（1始まり）・サブタイトル・本文ページの URL・話の変わらない ID・目次上の更新日時
+EpisodeRef = namedtuple('EpisodeRef', ['index', 'title', 'url', 'key', 'updated_at'], defaults=(None, None))
+
+
+class Site:
+    """
+    サイトアダプタの共通部分。サブクラスでクラス属性と read_toc / fetch_episode を定義します。
+    base_url と url_file は環境変数（KAKUYOMU_BASE_URL / NAROU_URL_FILE など）で差し替えられます
+    （ベンチマークでローカルのスタブサーバーに向けるため）。
+    """
+    name = None
+    base_url = None
+    url_file = None
+    history_file = None
+    state_file = None
+    index_file = None
+    download_dir = None
+    remote_root = 'drive:'
+    cookies = None
+
+    @property
+    def local_history_path(self):
+        return os.path.join(WORK_DIR, self.history_file)
+
+    @property
+    def remote_history_path(self):
+        return f'drive:{self.history_file}'
+
+    @property
+    def local_state_path(self):
+        return os.path.join(WORK_DIR, self.state_file)
+
+    @property
+    def remote_state_path(self):
+        return f'drive:{self.state_file}'
+
+    @property
+    def local_index_path(self):
+        return os.path.join(WORK_DIR, self.index_file)
+
+    @property
+    def remote_index_path(self):
+        return f'drive:{self.index_file}'
+
+    def load_urls(self):
+        """
+        URL一覧ファイルから小説の URL を読み込みます（相対パスはリポジトリからの位置）。
+        """
+        with open(os.path.join(REPO_DIR, self.url_file), 'r', encoding='utf-8') as f:
+            return [line.strip().rstrip('/') for line in f if line.strip().startswith('http')]
+
+    def metadata(self, urls):
+        """
+        事前チェック用に {URL: {count, updated_at}} を返します。
+        """
+        raise NotImplementedError
+
+    def read_toc(self, novel_url):
+        """
+        (保存フォルダ名, EpisodeRef のイテラブル) を返します。
+        """
+        raise NotImplementedError
+
+    def fetch_episode(self, episode):
+        """
+        1話分の本文（日本語）を、前書き・後書きと分けた EpisodeText で返します。
+        """
+        raise NotImplementedError
+
+    def folder_title(self, title):
+        """
+        小説タイトルを保存フォルダ名に使える形にします。
+        """
+        raise NotImplementedError
+
+    def episode_paths(self, folder_title, index):
+        """
+        1話分の保存先 (日本語ファイル, 英語ファイル) を返します（フォルダは保存時に common.storage が作る）。
+
+        <download_dir>/<folder_title>/<999話ごとのフォルダ 001～>/japanese|english/<話数>.txt
+        """
+        folder_name = f'{(index - 1) // 999 + 1:03d}'
+        file_name = f'{index:03d}.txt'
+        base_path = os.path.join(self.download_dir, folder_title, folder_name)
+        return (os.path.join(base_path, 'japanese', file_name),
+                os.path.join(base_path, 'english', file_name))
+
+    def notes_path(self, folder_title, index):
+        """
+        1話分の前書き・後書きの保存先（<999話ごとのフォルダ>/notes/<話数>.txt）を返します。
+        """
+        base_path = os.path.join(self.download_dir, folder_title, f'{(index - 1) // 999 + 1:03d}', 'notes')
+        return os.path.join(base_path, f'{index:03d}.txt')
+
+
+class KakuyomuSite(Site):
+    name = 'kakuyomu'
+    base_url = os.environ.get('KAKUYOMU_BASE_URL', 'https://kakuyomu.jp')
+    url_file = os.environ.get('KAKUYOMU_URL_FILE', 'kakuyomu/カクヨム.txt')
+    history_file = 'カクヨムダウンロード経歴.txt'
+    state_file = 'カクヨム作品状態.json'
+    index_file = 'カクヨム話索引.sqlite3'
+    download_dir = os.path.join(WORK_DIR, 'kakuyomu_dl')
+
+    def metadata(self, urls):
+        return kakuyomu_metadata(urls)
+
+    def folder_title(self, title):
+        # ファイル・フォルダ名として安全な小説タイトル（30文字まで）
+        return re.sub(r'[\\/*?:"<>|]', '_', title.strip())[:30]
+
+    def read_toc(self, novel_url):
+        # 作品ページを1回だけ取得して、タイトルとエピソード一覧を得る
+        work = load_work(novel_url)
+        if not work.episodes:
+            print(f'[{self.name}] 指定されたページからエピソード情報を取得できませんでした。')
+        episodes = [EpisodeRef(i + 1, episode.title, episode.url, episode.id, episode.published_at)
+                    for i, episode in enumerate(work.episodes)]
+        return self.folder_title(work.title), episodes
+
+    def fetch_episode(self, episode):
+        response = fetch(episode.url, cookies=self.cookies)
+        response.raise_for_status()
+        body = extract_text(response.text, 'div.widget-episodeBody', strip=True)
+        if body is None:
+            raise ValueError(f'本文が見つかりません: {episode.url}')
+        return split_kakuyomu(body)
+
+
+class NarouSite(Site):
+    name = 'narou'
+    base_url = os.environ.get('NAROU_BASE_URL', 'https://ncode.syosetu.com')
+    url_file = os.environ.get('NAROU_URL_FILE', 'narou/小説家になろう.txt')
+    history_file = '小説家になろうダウンロード経歴.txt'
+    state_file = '小説家になろう作品状態.json'
+    index_file = '小説家になろう話索引.sqlite3'
+    download_dir = os.path.join(WORK_DIR, 'narou_dl')
+    api_url = NAROU_API_URL
+    # 本文の前後の空白を取り除くかどうか（なろうは取り除く、R18 は従来どおりそのまま）
+    strip_body = True
+    # 前書き・本文・後書き、と、それらの区切りがない古い形式のページ用の本文全体
+    body_selectors = [
+        '.p-novel__body .p-novel__text--preface',
+        '.p-novel__body .p-novel__text:not(.p-novel__text--preface):not(.p-novel__text--afterword)',
+        '.p-novel__body .p-novel__text--afterword',
+        '.p-novel__body',
+    ]
+
+    def metadata(self, urls):
+        return narou_metadata(urls, self.api_url)
+
+    def folder_title(self, title):
+        for char in '<>:"/\\|?*':
+            title = title.replace(char, '')
+        return title.strip()
+
+    def read_toc(self, novel_url):
+        # 2ページ目以降は並列に取得しながら、1ページ目の分から順に流れてくる
+        title, episodes = read_toc(novel_url, self.base_url, cookies=self.cookies)
+        refs = (EpisodeRef(episode.index, episode.title, f'{self.base_url}{episode.href}',
+                           episode.href, episode.updated_at)
+                for episode in episodes)
+        return self.folder_title(title), refs
+
+    def fetch_episode(self, episode):
+        response = fetch(episode.url, cookies=self.cookies)
+        # エラーページを本文なしとして保存すると、その話は二度と取り直されないので例外にする
+        response.raise_for_status()
+        preface, body, afterword, whole = extract_texts(response.text, self.body_selectors)
+        if body is None:
+            if whole is None:
+                return EpisodeText('[本文が取得できませんでした]', '', '')
+            preface, body, afterword = None, whole, None
+        return EpisodeText(body.strip() if self.strip_body else body,
+                           (preface or '').strip(), (afterword or '').strip())
+
+
+class NarouR18Site(NarouSite):
+    name = 'narouR18'
+    base_url = os.environ.get('NAROU18_BASE_URL', 'https://novel18.syosetu.com')
+    url_file = os.environ.get('NAROU18_URL_FILE', 'narouR18/小説家になろうR18.txt')
+    history_file = '小説家になろうR18ダウンロード経歴.txt'
+    state_file = '小説家になろうR18作品状態.json'
+    index_file = '小説家になろうR18話索引.sqlite3'
+    download_dir = os.path.join(WORK_DIR, 'narouR18_dl')
+    api_url = NAROU18_API_URL
+    cookies = {'over18': 'yes'}
+    strip_body = False
+
+
+SITES = {site.name: site for site in (KakuyomuSite(), NarouSite(), NarouR18Site())}
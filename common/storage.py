@@ -0,0 +1,274 @@
+"""
+取得した話の保存先（ファイル / 作品ごとの SQLite パック）。
+
+従来の形式（files）では1話ごとに <タイトル>/<999話ごとのフォルダ>/japanese|english/<話数>.txt の
+小さなファイルが2つ以上でき、3,000話の作品で 6,000 ファイルを超えます。rclone はその1つ1つを
+一覧・比較・転送するので、Drive の API 呼び出しの回数がボトルネックになっていました。
+
+STORAGE_FORMAT=packed にすると、作品ごとに <タイトル>.pack.sqlite3 を1つだけ作り、
+各話を従来の相対パス（001/japanese/001.txt など）をキーにして zlib で圧縮して格納します。
+アップロードは作品ごとに大きなファイル1つになり（PACK_UPLOAD_EVERY 話ごとと最後）、
+手元のディレクトリもほとんど増えません。
+
+書き込み中のパック（<ダウンロード先>/.packs/）をそのまま送ると、取得スレッドが書いている途中の
+壊れたデータベースを送りかねないため、sync() で sqlite3 の backup を使ってスナップショット
+（<ダウンロード先>/<タイトル>.pack.sqlite3）を作り直し、アップロードするのはそちらだけにします。
+パックを Drive から取れなかった場合は、「Drive にまだない」（rclone の終了コード 3 / 4）ときだけ
+空のパックから始め、それ以外の失敗では StorageError にします（空のパックで Drive 上の完全なパックを
+上書きしないように）。
+
+パックから従来の形式へは、いつでも書き出せます。
+    python -m common.storage export <パック または パックを置いたフォルダ> <書き出し先>
+
+どちらの形式でも、呼び出し側は従来のファイルパス（Site.episode_paths の戻り値）を渡して
+write(path, text) するだけで、戻り値がアップロードするファイルのパスです。
+アップロードを始める前には sync() を呼び、戻り値のパスもアップロードに加えます。
+"""
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+STORAGE_FORMAT = os.environ.get('STORAGE_FORMAT', 'files')
+PACK_SUFFIX = '.pack.sqlite3'
+# パック形式で、何話ごとにパック（作品全体）をアップロードし直すか
+PACK_UPLOAD_EVERY = int(os.environ.get('PACK_UPLOAD_EVERY', '200'))
+COMPRESS_LEVEL = 6
+# 書き込み中のパックを置くフォルダ（ダウンロード先からの相対パス）
+LIVE_DIR = '.packs'
+# rclone の終了コードのうち「コピー元がない」を表すもの（3: ディレクトリがない、4: ファイルがない）
+RCLONE_NOT_FOUND = (3, 4)
+
+
+class StorageError(Exception):
+    """
+    保存先を用意できなかった（Drive からパックを取得できなかったなど）。
+    """
+
+
+def write_atomic(path, text):
+    """
+    一時ファイルに書いてから置き換えます（途中で落ちても書きかけのファイルが残らない）。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class FileStorage:
+    """
+    従来どおり1話1ファイルで保存します。
+    """
+
+    def __init__(self, root, upload_every):
+        self.root = root
+        self.upload_every = upload_every
+
+    def write(self, path, text):
+        write_atomic(path, text)
+        return path
+
+    def sync(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class PackedStorage:
+    """
+    作品ごとの SQLite パックに保存します。root 直下の1段目のフォルダ（作品）ごとに1パック。
+    パックが手元になければ、最初に書く前に Drive（remote_root）から取ってきて追記します。
+    """
+
+    def __init__(self, root, remote_root, upload_every=PACK_UPLOAD_EVERY):
+        self.root = root
+        self.remote_root = remote_root
+        self.upload_every = upload_every
+        self._packs = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _split(self, path):
+        rel = os.path.relpath(path, self.root)
+        novel, _, inner = rel.partition(os.sep)
+        if not inner or novel in ('.', '..'):
+            raise ValueError(f'作品フォルダの下のパスではありません: {path}')
+        return novel, inner.replace(os.sep, '/')
+
+    def snapshot_path(self, novel):
+        return os.path.join(self.root, f'{novel}{PACK_SUFFIX}')
+
+    def _pull(self, novel, path):
+        """
+        Drive 上のパックを path に取ってきます。Drive にまだなければ何もしません。
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        remote_copy = f'{path}.remote'
+        result = subprocess.run(['rclone', 'copyto', f'{self.remote_root}{novel}{PACK_SUFFIX}', remote_copy],
+                                check=False, capture_output=True, text=True)
+        if result.returncode == 0:
+            os.replace(remote_copy, path)
+        elif result.returncode not in RCLONE_NOT_FOUND:
+            if os.path.exists(remote_copy):
+                os.remove(remote_copy)
+            raise StorageError(f'Drive からパックを取得できませんでした（rclone exit {result.returncode}）: '
+                               f'{novel} {result.stderr.strip()[-300:]}')
+
+    def _pack(self, novel):
+        with self._lock:
+            pack = self._packs.get(novel)
+            if pack is None:
+                path = os.path.join(self.root, LIVE_DIR, f'{novel}{PACK_SUFFIX}')
+                if os.path.exists(path):
+                    pass
+                elif os.path.exists(self.snapshot_path(novel)):
+                    # 手元に前回の（または書き込み中のパックを分ける前の）パックがある
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.copyfile(self.snapshot_path(novel), path)
+                else:
+                    self._pull(novel, path)
+                pack = self._packs[novel] = Pack(path)
+            return pack
+
+    def write(self, path, text):
+        novel, inner = self._split(path)
+        pack = self._pack(novel)
+        pack.put(inner, text)
+        snapshot = self.snapshot_path(novel)
+        if os.path.exists(snapshot):
+            with self._lock:
+                self._dirty.add(novel)
+        else:
+            # アップロードに加えたパスが必ずあるように、最初の1話でスナップショットを作っておく
+            pack.snapshot(snapshot)
+        return snapshot
+
+    def sync(self):
+        """
+        書き込みのあったパックのスナップショットを作り直し、そのパス（アップロードし直すもの）を返します。
+        """
+        with self._lock:
+            novels = sorted(self._dirty)
+            self._dirty.clear()
+            packs = [(novel, self._packs[novel]) for novel in novels]
+        paths = []
+        for novel, pack in packs:
+            path = self.snapshot_path(novel)
+            pack.snapshot(path)
+            paths.append(path)
+        return paths
+
+    def close(self):
+        with self._lock:
+            packs = list(self._packs.values())
+            self._packs.clear()
+        for pack in packs:
+            pack.close()
+
+
+class Pack:
+    """
+    1作品分のパック（相対パス → zlib 圧縮した本文）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            ' path TEXT PRIMARY KEY,'
+            ' data BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._conn.commit()
+
+    def put(self, inner, text):
+        data = text.encode('utf-8')
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (path, data, size, updated_at) VALUES (?, ?, ?, ?)',
+                (inner, zlib.compress(data, COMPRESS_LEVEL), len(data), time.time())
+            )
+            self._conn.commit()
+
+    def get(self, inner):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM files WHERE path = ?', (inner,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def items(self):
+        """
+        (相対パス, 本文) を相対パス順に返します。
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT path, data FROM files ORDER BY path').fetchall()
+        for inner, data in rows:
+            yield inner, zlib.decompress(data).decode('utf-8')
+
+    def snapshot(self, path):
+        """
+        書き込み途中の状態を含まない複製を path に作ります（一時ファイル経由で置き換え）。
+        """
+        tmp_path = f'{path}.tmp'
+        with self._lock:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+            os.replace(tmp_path, path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_storage(site, upload_every):
+    """
+    STORAGE_FORMAT に応じてサイトの保存先を返します（files のときの upload_every は従来の間隔）。
+    """
+    if STORAGE_FORMAT == 'packed':
+        return PackedStorage(site.download_dir, site.remote_root)
+    if STORAGE_FORMAT != 'files':
+        raise ValueError(f'不明な STORAGE_FORMAT: {STORAGE_FORMAT}（指定できるのは files / packed）')
+    return FileStorage(site.download_dir, upload_every)
+
+
+def export(source, out_dir):
+    """
+    パック（またはパックを置いたフォルダ内のすべてのパック）を従来の形式で out_dir に書き出し、
+    書き出したファイル数を返します。
+    """
+    if os.path.isdir(source):
+        packs = sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith(PACK_SUFFIX))
+    else:
+        packs = [source]
+    written = 0
+    for path in packs:
+        novel = os.path.basename(path)[:-len(PACK_SUFFIX)]
+        pack = Pack(path)
+        try:
+            for inner, text in pack.items():
+                write_atomic(os.path.join(out_dir, novel, *inner.split('/')), text)
+                written += 1
+        finally:
+            pack.close()
+        print(f'{novel}: 書き出しました')
+    return written
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'export':
+        sys.exit('使い方: python -m common.storage export <パック または パックを置いたフォルダ> <書き出し先>')
+    print(f'{export(sys.argv[2], sys.argv[3])} ファイルを書き出しました')
@@ -0,0 +1,417 @@
+"""
+g4f を使った日本語→英語翻訳（既定は GPT-4o-mini）。
+
+長い話（1万字超）を1回のリクエストで送ると遅い・途中で切れる・丸ごと失敗する、
+ということがあるため、本文を段落・場面転換の位置で「トークン数上限付きの塊（チャンク）」に分け、
+チャンクごとに並列で翻訳してから元の順番でつなぎ直します。
+
+- 各チャンクには直前のチャンクの末尾数行を「文脈（翻訳不要）」として添える
+- チャンクごとにリトライし、それでも失敗したチャンクだけを [Translation failed: ...] にする
+  （strict=True なら TranslationError にして、呼び出し元があとで翻訳し直せるようにする）
+- 全チャンクが成功した訳文は common.translation_cache に保存し、同じ本文なら再利用する
+- リクエストは common.translation_pool で、複数のプロバイダ・モデルのうち速くて健全なものへ送る
+- 応答はストリーミングで受け取り、届いた分から一時ファイル（.part）へ書く。チャンクを訳し終えたら
+  os.replace でチェックポイント（<WORK_DIR>/translate.partial/<キャッシュキー>/<番号>-<ハッシュ>.txt）にし、
+  途中で落ちたり一部のチャンクが失敗したりした話を翻訳し直すときは、チェックポイントのあるチャンクを送らない。
+  全チャンクそろったらチェックポイントは消す（TRANSLATE_STREAM=0 なら従来どおり応答をまとめて受け取る）
+- 本文が書き換えられた・翻訳をあきらめた話のチェックポイントは、PARTIAL_KEEP_DAYS 日更新がなければ
+  翻訳キャッシュの整理と一緒に消す（prune_checkpoints）
+"""
+import contextvars
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import metrics
+from common.pipeline import TRANSLATE_WORKERS
+from common.translation_cache import cache, cache_key
+from common.translation_pool import pool
+
+# 翻訳APIのクライアント（最初に使うときに g4f の Client を作る。set_client で差し替え可能）
+client = None
+_client_lock = threading.Lock()
+
+# 翻訳キャッシュのキーに使うモデル名（TRANSLATION_BACKENDS の先頭＝プライマリ）
+MODEL = pool.primary.model
+SYSTEM_PROMPT = (
+    "You are a professional translator specializing in Japanese fantasy novels. "
+    "Translate the following passage into natural, expressive English that preserves the original tone, atmosphere, and character voices. "
+    "Remove any forewords or afterwords such as author notes, promotional content, or update logs. Output only the translated body."
+)
+CONTEXT_INSTRUCTION = (
+    "The text inside <context> tags is the end of the preceding passage, given only for continuity. "
+    "Do not translate or output it; translate only the text after it."
+)
+
+# 1チャンクあたりの推定トークン数の上限
+CHUNK_TOKENS = int(os.environ.get('TRANSLATE_CHUNK_TOKENS', '2500'))
+# 直前チャンクから文脈として添える文字数のめやす
+CONTEXT_CHARS = int(os.environ.get('TRANSLATE_CONTEXT_CHARS', '200'))
+# チャンクごとのリトライ回数
+CHUNK_RETRIES = int(os.environ.get('TRANSLATE_CHUNK_RETRIES', '3'))
+# 長い話の2つ目以降のチャンクを翻訳する、全話で共有のスレッド数
+# （既定は同時に翻訳しうる話の数 = NOVEL_WORKERS × TRANSLATE_WORKERS。1つ目のチャンクは呼び出し元で翻訳する）
+CHUNK_WORKERS = int(os.environ.get('TRANSLATE_CHUNK_WORKERS',
+                                   str(int(os.environ.get('NOVEL_WORKERS', '4')) * TRANSLATE_WORKERS)))
+
+# 応答をストリーミングで受け取るか（対応していないクライアント・プロバイダでは自動でまとめて受け取る）
+STREAM = os.environ.get('TRANSLATE_STREAM', '1') != '0'
+# 翻訳途中の話のチェックポイントを置くディレクトリ
+PARTIAL_DIR = os.path.join(os.environ.get('WORK_DIR', '/tmp'), 'translate.partial')
+# この日数より前から更新のないチェックポイントは消す
+PARTIAL_KEEP_DAYS = float(os.environ.get('PARTIAL_KEEP_DAYS', '7'))
+
+_executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS)
+
+# 場面転換としてよく使われる記号だけの行（◇◆、＊＊＊、―――、☆ など）
+SCENE_BREAK_RE = re.compile(r'^[\s◇◆○●□■☆★＊*※〇―ー─\-=＝~〜・…]+$')
+
+
+class TranslationError(Exception):
+    """
+    translate_text(strict=True) で、翻訳できなかったチャンクがあった。
+    """
+
+
+def set_client(new_client):
+    """
+    翻訳APIのクライアントを差し替えます（ベンチマークの偽翻訳など）。
+    client.chat.completions.create(model=..., messages=...) が使えるものなら何でも構いません
+    （stream=True を受け付けず、まとめて応答を返すものでも構いません）。
+    """
+    global client
+    with _client_lock:
+        client = new_client
+
+
+def get_client():
+    global client
+    with _client_lock:
+        if client is None:
+            from g4f.client import Client
+            client = Client()
+        return client
+
+
+def _call_backend(backend, messages, checkpoint_path=None):
+    """
+    1つのバックエンド（モデルとプロバイダ）に messages を送り、訳文を返します。
+    checkpoint_path を渡すと、届いた分から同じディレクトリの一時ファイルへ書き、
+    訳文が空でなければ最後に checkpoint_path へ置き換えます。
+    """
+    options = {'provider': backend.provider} if backend.provider else {}
+    if STREAM:
+        options['stream'] = True
+    response = get_client().chat.completions.create(
+        model=backend.model,
+        messages=messages,
+        web_search=False,
+        **options
+    )
+    if hasattr(response, 'choices'):
+        # ストリーミングに対応していない → まとめて返ってきた
+        text = (response.choices[0].message.content or '').strip()
+        if checkpoint_path and text:
+            _write_checkpoint(checkpoint_path, [text])
+        return text
+    if not checkpoint_path:
+        return ''.join(_deltas(response)).strip()
+    return _write_checkpoint(checkpoint_path, _deltas(response))
+
+
+def _deltas(stream):
+    """
+    ストリーミングの応答から、届いた順に文字列の断片を取り出します。
+    """
+    started = time.perf_counter()
+    first = True
+    for part in stream:
+        choices = getattr(part, 'choices', None)
+        delta = getattr(choices[0], 'delta', None) if choices else None
+        content = getattr(delta, 'content', None)
+        if content:
+            if first:
+                metrics.record_span('translate_first_token', time.perf_counter() - started)
+                first = False
+            yield content
+
+
+def _write_checkpoint(path, pieces):
+    """
+    pieces を一時ファイルへ順に書き、空でなければ path へ置き換えて訳文を返します。
+    ヘッジで同じチャンクを2本同時に受け取っても、一時ファイルは別々になります。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for piece in pieces:
+                f.write(piece)
+                f.flush()
+        with open(tmp_path, 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+        if text:
+            os.replace(tmp_path, path)
+        return text
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class Checkpoints:
+    """
+    1話分の翻訳のチェックポイント（訳し終えたチャンクの訳文）。
+    ファイル名にチャンクのハッシュを含めるので、本文やチャンクの分け方が変わったら使われません。
+    """
+
+    def __init__(self, japanese_text):
+        self.dir = os.path.join(PARTIAL_DIR, cache_key(japanese_text, SYSTEM_PROMPT, MODEL))
+
+    def path(self, index, chunk, context):
+        digest = hashlib.sha256(f'{context}\0{chunk}'.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.dir, f'{index:03d}-{digest}.txt')
+
+    def load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def discard(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def prune_checkpoints(max_age_days=None):
+    """
+    PARTIAL_KEEP_DAYS 日より前から更新のない（チャンクが書き足されていない）話のチェックポイントを消し、
+    消した話の数を返します。本文が書き換えられた話は別のキーになるので、古いキーのものはここでしか消えません。
+    """
+    cutoff = time.time() - (PARTIAL_KEEP_DAYS if max_age_days is None else max_age_days) * 86400
+    try:
+        entries = list(os.scandir(PARTIAL_DIR))
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    for entry in entries:
+        try:
+            # チャンクの書き足し（os.replace）でディレクトリの更新日時も変わる
+            if not entry.is_dir() or entry.stat().st_mtime >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def estimate_tokens(text):
+    """
+    トークン数のおおよその見積もり。
+    日本語は1文字≒1トークン、英数字は4文字≒1トークンとして数えます（多めに見積もる側）。
+    """
+    ascii_chars = sum(1 for c in text if c < '\x80')
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+def _break_strength(line):
+    """
+    その行の直前で区切るときの区切りやすさ。場面転換 > 空行 > 通常の行。
+    """
+    if not line.strip():
+        return 1
+    if SCENE_BREAK_RE.match(line):
+        return 2
+    return 0
+
+
+def _split_long_line(line, max_tokens):
+    """
+    1行だけで上限を超える場合に、句点の位置（なければ文字数）で分割します。
+    """
+    pieces = []
+    current = ''
+    for sentence in re.split(r'(?<=[。！？!?」』])', line):
+        if current and estimate_tokens(current + sentence) > max_tokens:
+            pieces.append(current)
+            current = ''
+        while estimate_tokens(sentence) > max_tokens:
+            pieces.append(sentence[:max_tokens])
+            sentence = sentence[max_tokens:]
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text, max_tokens=None):
+    """
+    本文を推定トークン数 max_tokens 以下のチャンクに分けて返します。
+
+    上限に達したら、チャンクの後半にある「いちばん区切りやすい行」
+    （場面転換 > 空行 > 通常の行）の直前で切ります。
+    チャンクをすべてつなげると元の本文に戻ります。
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    lines = []
+    for line in text.splitlines(keepends=True):
+        if estimate_tokens(line) > max_tokens:
+            lines.extend(_split_long_line(line, max_tokens))
+        else:
+            lines.append(line)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for line in lines:
+        tokens = estimate_tokens(line)
+        # 切った残りと次の行でもまだ上限を超えるなら、収まるまで切り続ける
+        while current and current_tokens + tokens > max_tokens:
+            # 後半（半分以降）でいちばん区切りやすい位置を探す
+            cut = len(current)
+            best = -1
+            running = 0
+            for j, candidate in enumerate(current):
+                if j > 0 and running >= current_tokens // 2:
+                    strength = _break_strength(candidate)
+                    if strength >= best:
+                        best, cut = strength, j
+                running += estimate_tokens(candidate)
+            if best <= 0:
+                cut = len(current)
+            chunks.append(''.join(current[:cut]))
+            current = current[cut:]
+            current_tokens = sum(estimate_tokens(c) for c in current)
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def _context_tail(text):
+    """
+    直前のチャンクの末尾から、CONTEXT_CHARS 字程度になるまで行単位で取り出します。
+    """
+    tail = []
+    size = 0
+    for line in reversed(text.strip().splitlines()):
+        if size and size + len(line) > CONTEXT_CHARS:
+            break
+        tail.insert(0, line)
+        size += len(line)
+    return '\n'.join(tail)[-CONTEXT_CHARS * 2:]
+
+
+def _request(japanese_text, context='', checkpoint_path=None):
+    """
+    1チャンク分を翻訳APIに送り、訳文を返します（失敗時は例外）。
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if context:
+        messages.append({"role": "system", "content": CONTEXT_INSTRUCTION})
+        japanese_text = f"<context>\n{context}\n</context>\n\n{japanese_text}"
+    messages.append({"role": "user", "content": japanese_text})
+    return pool.request(messages, lambda backend, m: _call_backend(backend, m, checkpoint_path))
+
+
+def _attempt(chunk, context, checkpoint_path):
+    """
+    1チャンクを1回だけ翻訳します。戻り値: (訳文, 例外)
+    """
+    try:
+        return _request(chunk, context, checkpoint_path), None
+    except Exception as e:
+        return None, e
+
+
+def _translate_chunks(jobs):
+    """
+    [(チャンク, 文脈, チェックポイントのパス)] を翻訳し、[(訳文, 成功したかどうか)] を元の順番で返します。
+
+    1つ目は呼び出し元のスレッドで翻訳し、残りだけを共有のスレッドプールに回します
+    （1チャンクの話はプールを使わないので、TRANSLATE_WORKERS / NOVEL_WORKERS がそのまま効く）。
+    失敗したチャンクは CHUNK_RETRIES 回まで翻訳し直します。待ち時間は呼び出し元のスレッドで取るので、
+    待っている間もプールのスレッドはほかの話のチャンクに使えます。
+    """
+    results = [None] * len(jobs)
+    errors = {}
+    remaining = list(range(len(jobs)))
+    for attempt in range(CHUNK_RETRIES):
+        if attempt:
+            metrics.count('translate_retries', len(remaining))
+            time.sleep(2 ** (attempt - 1))
+        futures = [
+            _executor.submit(contextvars.copy_context().run, _attempt, *jobs[i])
+            for i in remaining[1:]
+        ]
+        outcomes = [_attempt(*jobs[remaining[0]])] + [future.result() for future in futures]
+        failed = []
+        for i, (text, error) in zip(remaining, outcomes):
+            if error is None:
+                results[i] = (text, True)
+            else:
+                errors[i] = error
+                failed.append(i)
+        remaining = failed
+        if not remaining:
+            break
+    for i in remaining:
+        metrics.count('translate_chunk_failures')
+        results[i] = (f"[Translation failed: {errors[i]}]", False)
+    return results
+
+
+def translate_text(japanese_text, strict=False):
+    """
+    日本語本文を英訳して返します。
+    長い本文はチャンクに分けて並列に翻訳し、元の順番でつなぎ直します。
+    失敗したチャンクはその部分だけ [Translation failed: ...] になります
+    （strict=True なら、1つでも失敗したら TranslationError を送出します）。
+    キャッシュにあればそれを返し、全チャンクが成功したときだけキャッシュに保存します。
+    前回の途中までのチェックポイントがあれば、そのチャンクは翻訳APIに送りません。
+    """
+    cached = cache.get(japanese_text, SYSTEM_PROMPT, MODEL)
+    if cached is not None:
+        metrics.count('translate_cache_hits')
+        return cached
+    metrics.count('translate_cache_misses')
+    metrics.count('chars_translated', len(japanese_text))
+
+    chunks = split_into_chunks(japanese_text)
+    contexts = [''] + [_context_tail(chunk) for chunk in chunks[:-1]]
+    # 1チャンクだけの話は途中から再開できないので、チェックポイントは使わない
+    checkpoints = Checkpoints(japanese_text) if len(chunks) > 1 else None
+    results = []
+    jobs = {}
+    for index, (chunk, context) in enumerate(zip(chunks, contexts)):
+        if not chunk.strip():
+            continue
+        path = checkpoints.path(index, chunk, context) if checkpoints else None
+        done = checkpoints.load(path) if checkpoints else None
+        if done is not None:
+            metrics.count('translate_chunks_resumed')
+            results.append((done, True))
+        else:
+            jobs[len(results)] = (chunk, context, path)
+            results.append(None)
+    if jobs:
+        for position, result in zip(jobs, _translate_chunks(list(jobs.values()))):
+            results[position] = result
+    failed = [text for text, ok in results if not ok]
+    if strict and failed:
+        raise TranslationError(f'{len(failed)}/{len(results)} チャンクの翻訳に失敗しました: {failed[0]}')
+    translated = '\n\n'.join(text for text, _ in results)
+    if results and not failed:
+        cache.put(japanese_text, SYSTEM_PROMPT, MODEL, translated)
+    if checkpoints and not failed:
+        checkpoints.discard()
+    return translated
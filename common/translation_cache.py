@@ -0,0 +1,206 @@
+"""
+翻訳結果のキャッシュ（SQLite）。
+
+キーは「日本語本文・システムプロンプト・モデル名」をまとめたハッシュなので、
+履歴のリセットや /tmp の消失で同じ話を取り直しても、本文が変わっていなければ翻訳し直しません。
+
+- 最終利用日時が古いもの（CACHE_MAX_AGE_DAYS 日より前）から削除
+- 合計サイズが CACHE_MAX_BYTES を超えたら、使われていない順に削除
+- 履歴ファイルと同じく、rclone copyto で Drive と同期
+  （複数台で使う場合は push(merge=True) で、Drive 上のキャッシュにしかない訳文を取り込んでから上げる）
+"""
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+
+CACHE_FILE = '翻訳キャッシュ.sqlite3'
+LOCAL_CACHE_PATH = os.path.join(os.environ.get('WORK_DIR', '/tmp'), CACHE_FILE)
+REMOTE_CACHE_PATH = f'drive:{CACHE_FILE}'
+
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+CACHE_MAX_AGE_DAYS = int(os.environ.get('CACHE_MAX_AGE_DAYS', '365'))
+
+
+def cache_key(japanese_text, prompt, model):
+    """
+    本文・プロンプト・モデル名から SHA-256 のキーを作ります。
+    """
+    h = hashlib.sha256()
+    for part in (model, prompt, japanese_text):
+        data = part.encode('utf-8')
+        # 区切りの位置で衝突しないよう、各要素の長さも混ぜる
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class TranslationCache:
+    """
+    翻訳結果の永続キャッシュ。複数スレッドから同時に使えます。
+    """
+
+    def __init__(self, path=LOCAL_CACHE_PATH, remote_path=REMOTE_CACHE_PATH,
+                 max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.path = path
+        self.remote_path = remote_path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                ' key TEXT PRIMARY KEY,'
+                ' model TEXT NOT NULL,'
+                ' translation TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' last_used REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)'
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, japanese_text, prompt, model):
+        """
+        キャッシュ済みの訳文を返します。なければ None。
+        """
+        key = cache_key(japanese_text, prompt, model)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT translation FROM translations WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute('UPDATE translations SET last_used = ? WHERE key = ?', (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, japanese_text, prompt, model, translation):
+        """
+        訳文を保存します。
+        """
+        key = cache_key(japanese_text, prompt, model)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO translations'
+                ' (key, model, translation, size, created_at, last_used)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, translation, len(translation.encode('utf-8')), now, now)
+            )
+            conn.commit()
+
+    def evict(self):
+        """
+        古いもの・容量超過分を削除し、削除した件数を返します。
+        """
+        with self._lock:
+            conn = self._connect()
+            cutoff = time.time() - self.max_age_days * 86400
+            removed = conn.execute('DELETE FROM translations WHERE last_used < ?', (cutoff,)).rowcount
+
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM translations').fetchone()[0]
+            if total > self.max_bytes:
+                doomed = []
+                for key, size in conn.execute('SELECT key, size FROM translations ORDER BY last_used'):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                conn.executemany('DELETE FROM translations WHERE key = ?', doomed)
+                removed += len(doomed)
+            conn.commit()
+            if removed:
+                conn.execute('VACUUM')
+            return removed
+
+    def stats(self):
+        """
+        ヒット数・ミス数・件数・合計サイズを辞書で返します。
+        """
+        with self._lock:
+            count, size = self._connect().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM translations'
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': count, 'bytes': size}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def pull(self):
+        """
+        ローカルにキャッシュがなければ Drive から取得します（なくてもエラーにしない）。
+        """
+        if not os.path.exists(self.path):
+            subprocess.run(['rclone', 'copyto', self.remote_path, self.path], check=False)
+
+    def merge_remote(self):
+        """
+        Drive 上のキャッシュにあって手元にない訳文を取り込み、取り込んだ件数を返します。
+        """
+        remote_copy = f'{self.path}.remote'
+        result = subprocess.run(['rclone', 'copyto', self.remote_path, remote_copy], check=False)
+        if result.returncode != 0 or not os.path.exists(remote_copy):
+            return 0
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('ATTACH DATABASE ? AS remote', (remote_copy,))
+                try:
+                    added = conn.execute(
+                        'INSERT OR IGNORE INTO translations SELECT key, model, translation, size, created_at, last_used'
+                        ' FROM remote.translations'
+                    ).rowcount
+                    conn.commit()
+                finally:
+                    conn.execute('DETACH DATABASE remote')
+            return added
+        except sqlite3.DatabaseError as e:
+            print(f'Drive 上の翻訳キャッシュを取り込めませんでした: {e}')
+            return 0
+        finally:
+            os.remove(remote_copy)
+
+    def push(self, merge=False):
+        """
+        削除処理をしてから Drive へ上書きコピーします。
+        merge=True なら先に Drive 上の分を取り込みます（他のノードの訳文を消さないため）。
+        """
+        if merge:
+            self.merge_remote()
+        self.evict()
+        self.close()
+        result = subprocess.run(['rclone', 'copyto', self.path, self.remote_path], check=False)
+        if result.returncode != 0:
+            print(f'翻訳キャッシュのアップロード失敗 (rclone exit {result.returncode})')
+
+    def report(self):
+        """
+        今回の実行でのヒット率などを表示します。
+        """
+        s = self.stats()
+        total = s['hits'] + s['misses']
+        rate = s['hits'] / total * 100 if total else 0.0
+        print(f"翻訳キャッシュ: ヒット {s['hits']} / ミス {s['misses']} ({rate:.1f}%)、"
+              f"{s['entries']} 件 {s['bytes'] / 1024 / 1024:.1f} MB")
+
+
+cache = TranslationCache()
@@ -0,0 +1,300 @@
+"""
+複数の翻訳バックエンド（g4f のプロバイダ・モデルの組み合わせ）をまとめて使うプール。
+
+1つのプロバイダが遅い・落ちているときに、全話がそのタイムアウトを待ってから
+[Translation failed: ...] になっていたため、次のようにします。
+
+- バックエンドごとに直近の応答時間と失敗率を記録し、
+  「応答時間（中央値）÷ 重み」がいちばん小さい健全なバックエンドへ送る
+- 応答が直近の p95（HEDGE_PERCENTILE）を超えても返ってこなければ、
+  別のバックエンドへ同じリクエストをもう1本送り（ヘッジ）、先に返ってきたほうを使う
+- 失敗が続いたバックエンドはサーキットブレーカーで一定時間外し、
+  時間が経ったら1本だけ試して、成功すれば戻す（失敗すれば外す時間を倍にする）
+
+バックエンドは環境変数 TRANSLATION_BACKENDS で「モデル[@プロバイダ][:重み]」をカンマ区切りで指定します。
+    例: TRANSLATION_BACKENDS="gpt-4o-mini,gpt-4o-mini@PollinationsAI:0.5,llama-3.3-70b:0.3"
+先頭がプライマリで、翻訳キャッシュのキーにはプライマリのモデル名を使います。
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common import metrics
+from common.pipeline import TRANSLATE_WORKERS
+
+TRANSLATION_BACKENDS = os.environ.get('TRANSLATION_BACKENDS', 'gpt-4o-mini')
+# 直近何回分の結果で応答時間・失敗率を見るか
+WINDOW = int(os.environ.get('BACKEND_WINDOW', '50'))
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+# 記録が少ないうちのヘッジまでの待ち時間と、ヘッジまでの最短の待ち時間（秒）
+HEDGE_DEFAULT_DELAY = float(os.environ.get('HEDGE_DEFAULT_DELAY', '60'))
+HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '2'))
+# すべてのバックエンドが外れているときに、どれかが戻るのを待つ最大時間（秒）
+BACKEND_WAIT = float(os.environ.get('BACKEND_WAIT', '900'))
+# この回数続けて失敗するか、直近の失敗率が BREAKER_ERROR_RATE を超えたら外す
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', '5'))
+BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '60'))
+BREAKER_MAX_COOLDOWN = float(os.environ.get('BREAKER_MAX_COOLDOWN', '900'))
+# request を同時に呼びうるのは、話の翻訳段（NOVEL_WORKERS × TRANSLATE_WORKERS）・2つ目以降のチャンク
+# （TRANSLATE_CHUNK_WORKERS、既定は同じ数）・翻訳待ちのワーカー（BACKLOG_WORKERS）。それぞれがヘッジをもう1本
+# 送れるよう既定はその2倍にする（足りないと、ヘッジが避けたいはずの遅いリクエストの後ろに並んでしまう）
+_EPISODE_CALLERS = int(os.environ.get('NOVEL_WORKERS', '4')) * TRANSLATE_WORKERS
+_CALLERS = (_EPISODE_CALLERS + int(os.environ.get('TRANSLATE_CHUNK_WORKERS', str(_EPISODE_CALLERS)))
+            + int(os.environ.get('BACKLOG_WORKERS', '4')))
+POOL_WORKERS = int(os.environ.get('TRANSLATE_POOL_WORKERS', str(2 * _CALLERS)))
+
+
+class BackendError(Exception):
+    """
+    どのバックエンドでも翻訳できなかった。
+    """
+
+
+class Backend:
+    """
+    1つのプロバイダ・モデルと、その直近の成績・サーキットブレーカーの状態。
+    """
+
+    def __init__(self, model, provider=None, weight=1.0):
+        self.model = model
+        self.provider = provider
+        self.weight = weight
+        self.name = f'{model}@{provider}' if provider else model
+        self.latencies = deque(maxlen=WINDOW)
+        self.outcomes = deque(maxlen=WINDOW)
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.trial = False
+        self.requests = 0
+        self.failures = 0
+
+    def percentile(self, p):
+        """
+        直近の応答時間の p パーセンタイル（記録がなければ None）。
+        latencies は他のスレッドが書き足すので、BackendPool._lock を持って呼ぶこと。
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self):
+        """
+        小さいほど優先。記録がまだなければ試してみる（0 扱い）。
+        """
+        median = self.percentile(50)
+        return (median or 0.0) * (1 + self.in_flight) / self.weight
+
+    def state(self, now):
+        if now < self.open_until:
+            return 'open'
+        if self.open_until:
+            return 'half-open'
+        return 'closed'
+
+
+def parse_backends(value):
+    backends = []
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        spec, _, weight = item.partition(':')
+        model, _, provider = spec.partition('@')
+        backends.append(Backend(model.strip(), provider.strip() or None, float(weight or 1.0)))
+    return backends
+
+
+class BackendPool:
+    """
+    request(messages, call) で、call(backend, messages) を最適なバックエンドに送ります。
+    """
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError('翻訳バックエンドがありません')
+        self.backends = backends
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=POOL_WORKERS)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def primary(self):
+        return self.backends[0]
+
+    def _choose(self, exclude=()):
+        """
+        送り先を1つ選び、in_flight を増やして返します（使えるものがなければ None）。
+        半開き（外していた時間が過ぎた）のバックエンドは、試しの1本だけ通します。
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            for backend in self.backends:
+                if backend in exclude:
+                    continue
+                state = backend.state(now)
+                if state == 'open' or (state == 'half-open' and backend.trial):
+                    continue
+                candidates.append(backend)
+            if not candidates:
+                return None
+            backend = min(candidates, key=Backend.score)
+            if backend.state(now) == 'half-open':
+                backend.trial = True
+            backend.in_flight += 1
+            backend.requests += 1
+            return backend
+
+    def _record(self, backend, elapsed, ok):
+        with self._lock:
+            backend.in_flight -= 1
+            backend.outcomes.append(ok)
+            was_trial = backend.trial
+            backend.trial = False
+            if ok:
+                backend.latencies.append(elapsed)
+                backend.consecutive_failures = 0
+                if backend.open_until:
+                    print(f'翻訳バックエンド {backend.name} を戻します')
+                backend.open_until = 0.0
+                backend.cooldown = BREAKER_COOLDOWN
+                return
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            tripped = (was_trial
+                       or backend.consecutive_failures >= BREAKER_FAILURES
+                       or (len(backend.outcomes) >= 10 and backend.error_rate() > BREAKER_ERROR_RATE))
+            if tripped and backend.state(time.monotonic()) != 'open':
+                if was_trial:
+                    backend.cooldown = min(BREAKER_MAX_COOLDOWN, backend.cooldown * 2)
+                backend.open_until = time.monotonic() + backend.cooldown
+                backend.outcomes.clear()
+                print(f'翻訳バックエンド {backend.name} を {backend.cooldown:.0f} 秒外します'
+                      f'（連続失敗 {backend.consecutive_failures} 回）')
+                metrics.count('translate_breaker_open')
+
+    def _run(self, backend, messages, call, started=None):
+        if started is not None:
+            started.set()
+        start = time.perf_counter()
+        ok = False
+        try:
+            with metrics.labels(backend=backend.name):
+                with metrics.span('translate_request'):
+                    result = call(backend, messages)
+            if not result:
+                raise ValueError('empty response')
+            ok = True
+            return result
+        finally:
+            self._record(backend, time.perf_counter() - start, ok)
+
+    def _wait_for_backend(self):
+        """
+        すべて外れている（または試しの1本が返ってくるのを待っている）間は、
+        リクエストを失敗にせず、どれかが使えるようになるまで待ちます。
+        """
+        give_up = time.monotonic() + BACKEND_WAIT
+        while True:
+            backend = self._choose()
+            if backend is not None:
+                return backend
+            if time.monotonic() >= give_up:
+                raise BackendError('すべての翻訳バックエンドが停止中です')
+            time.sleep(0.5)
+
+    def _hedge_delay(self, backend):
+        with self._lock:
+            p = backend.percentile(HEDGE_PERCENTILE)
+            recorded = len(backend.latencies)
+        if p is None or recorded < 10:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, p)
+
+    def request(self, messages, call):
+        """
+        いちばん良いバックエンドに送り、遅ければヘッジ、失敗すれば次のバックエンドに回します。
+        使えるバックエンドをすべて試しても失敗したら BackendError。
+        """
+        tried = []
+        hedge_futures = set()
+        futures = {}
+        errors = []
+        hedged = False
+
+        def submit(backend, started=None):
+            tried.append(backend)
+            future = self._executor.submit(contextvars.copy_context().run, self._run, backend, messages, call,
+                                           started)
+            futures[future] = backend
+            return future
+
+        def send(backend):
+            """
+            送り、ヘッジするまでの期限を返します。期限は実際に送り始めてから数える
+            （スレッドの空き待ちで遅れただけのリクエストをヘッジしない）。
+            """
+            started = threading.Event()
+            submit(backend, started)
+            started.wait()
+            return time.monotonic() + self._hedge_delay(backend)
+
+        deadline = send(self._wait_for_backend())
+
+        while futures:
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 遅い → 別のバックエンドへ同じリクエストを送る（なければ同じバックエンドへ）
+                backend = self._choose(exclude=tried) or self._choose()
+                hedged = True
+                if backend is not None:
+                    with self._lock:
+                        self.hedges += 1
+                    metrics.count('translate_hedges')
+                    hedge_futures.add(submit(backend))
+                continue
+            for future in done:
+                backend = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f'{backend.name}: {e}')
+                    continue
+                if future in hedge_futures:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return result
+            if not futures:
+                # 全部失敗した → まだ試していないバックエンドへ
+                backend = self._choose(exclude=tried)
+                if backend is not None:
+                    deadline = send(backend)
+                    hedged = False
+        raise BackendError('; '.join(errors) or 'no backend available')
+
+    def report(self):
+        """
+        バックエンドごとの成績を表示します。
+        """
+        now = time.monotonic()
+        with self._lock:
+            rows = [(b.name, b.requests, b.failures, b.percentile(50), b.percentile(95), b.state(now))
+                    for b in self.backends]
+            hedges, wins = self.hedges, self.hedge_wins
+        for name, requests, failures, p50, p95, state in rows:
+            latency = f'p50 {p50:.1f}s / p95 {p95:.1f}s' if p50 is not None else '記録なし'
+            print(f'翻訳バックエンド {name}: {requests} 件（失敗 {failures}）{latency} [{state}]')
+        if hedges:
+            print(f'ヘッジ: {hedges} 回（うち後から送ったほうが先に返った {wins} 回）')
+
+
+pool = BackendPool(parse_backends(TRANSLATION_BACKENDS))
@@ -0,0 +1,274 @@
+"""
+翻訳待ちの話の永続キュー（SQLite）。
+
+以前は翻訳に失敗した話も english/NNN.txt に [Translation failed: ...] と書かれ、
+履歴はその先へ進んでしまうため、手で履歴を戻さない限り二度と翻訳し直されませんでした。
+
+ここでは「日本語本文の保存」と「翻訳」を分け、翻訳する話を1件ずつジョブとして記録します。
+
+- enqueue()  : 日本語本文を保存した話を、本文ごと翻訳待ちに入れる
+- claim()    : 翻訳する時刻になったジョブを1件取り出す（取り出したものは running）
+- complete() : 英訳ファイルを書き終えたジョブを done にする（本文は消す）
+- drop()     : 本文が話の索引と合わなくなった（改稿・話の挿入や削除で古くなった）ジョブを、翻訳せずに done にする
+- discard()  : その場（inline）で翻訳できた話の、前から残っているジョブを done にする
+- retry()    : 翻訳に失敗したジョブを、間隔を倍々に空けて（QUEUE_RETRY_MAX まで）あとで再び翻訳する
+- 翻訳キャッシュと同じく rclone copyto で Drive と同期する（GitHub Actions などで /tmp が消えても続きから）。
+  複数台で使う場合は push(merge=True) で、ジョブごとに更新日時が新しいほうを採る
+
+途中で落ちて running のまま残ったジョブは、次に開いたときに pending へ戻します。
+"""
+import os
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import namedtuple
+
+QUEUE_FILE = '翻訳待ち.sqlite3'
+LOCAL_QUEUE_PATH = os.path.join(os.environ.get('WORK_DIR', '/tmp'), QUEUE_FILE)
+REMOTE_QUEUE_PATH = f'drive:{QUEUE_FILE}'
+
+# 失敗したジョブを次に試すまでの間隔（秒）。失敗するたびに倍にし、QUEUE_RETRY_MAX で頭打ち
+QUEUE_RETRY_BASE = float(os.environ.get('QUEUE_RETRY_BASE', '60'))
+QUEUE_RETRY_MAX = float(os.environ.get('QUEUE_RETRY_MAX', str(6 * 3600)))
+# 完了したジョブの記録を残す日数（複数台でのマージ用）
+QUEUE_KEEP_DONE_DAYS = int(os.environ.get('QUEUE_KEEP_DONE_DAYS', '30'))
+
+Job = namedtuple('Job', 'site novel_url episode title en_path body attempts')
+
+
+class TranslationQueue:
+    """
+    翻訳待ちの話のキュー。複数スレッドから同時に使えます。
+    ジョブは (サイト名, 作品URL, 話数) で一意で、en_path はサイトのダウンロード先からの相対パスです。
+    """
+
+    def __init__(self, path=LOCAL_QUEUE_PATH, remote_path=REMOTE_QUEUE_PATH):
+        self.path = path
+        self.remote_path = remote_path
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._added = threading.Condition(self._lock)
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' site TEXT NOT NULL,'
+                ' novel_url TEXT NOT NULL,'
+                ' episode INTEGER NOT NULL,'
+                ' title TEXT NOT NULL,'
+                ' en_path TEXT NOT NULL,'
+                ' body TEXT,'
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' next_at REAL NOT NULL,'
+                ' last_error TEXT,'
+                ' updated_at REAL NOT NULL,'
+                ' PRIMARY KEY (site, novel_url, episode))'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_at)')
+            # 前回の実行が途中で落ちたときに取り出し中だったもの
+            self._conn.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+            self._conn.commit()
+        return self._conn
+
+    def enqueue(self, site, novel_url, episode, title, en_path, body):
+        """
+        翻訳待ちに入れます（同じ話が既にあれば、新しい本文で置き換えて最初からやり直す）。
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs'
+                ' (site, novel_url, episode, title, en_path, body, status, attempts, next_at, updated_at)'
+                " VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?)",
+                (site, novel_url, episode, title, en_path, body, now, now)
+            )
+            conn.commit()
+            self._added.notify_all()
+
+    def claim(self, sites, accept=None):
+        """
+        sites（サイト名の集まり）のジョブのうち、翻訳する時刻になったものを古い順に1件取り出します。
+        accept(job) が False のジョブ（分担モードでほかのノードの担当など）は飛ばします。
+        なければ None。
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                'SELECT site, novel_url, episode, title, en_path, body, attempts FROM jobs'
+                " WHERE status = 'pending' AND next_at <= ?"
+                ' ORDER BY next_at, site, novel_url, episode',
+                (now,)
+            )
+            for row in rows:
+                job = Job(*row)
+                if job.site in sites and (accept is None or accept(job)):
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ?"
+                        ' WHERE site = ? AND novel_url = ? AND episode = ?',
+                        (now, job.site, job.novel_url, job.episode)
+                    )
+                    conn.commit()
+                    return job
+            return None
+
+    def _finish(self, conn, job):
+        # 取り出したあとで同じ話が新しい本文で入れ直されていたら、そちらは残す
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'done', body = NULL, last_error = NULL, updated_at = ?"
+            " WHERE site = ? AND novel_url = ? AND episode = ? AND status = 'running' AND body = ?",
+            (time.time(), job.site, job.novel_url, job.episode, job.body)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+    def complete(self, job):
+        with self._lock:
+            if self._finish(self._connect(), job):
+                self.completed += 1
+
+    def drop(self, job):
+        with self._lock:
+            if self._finish(self._connect(), job):
+                self.dropped += 1
+
+    def discard(self, site, novel_url, episode):
+        """
+        (site, novel_url, episode) のジョブがあれば done にします。
+        取り出し中のジョブは、書く直前に本文を索引と比べるので、そこで drop されます。
+        """
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', body = NULL, last_error = NULL, updated_at = ?"
+                " WHERE site = ? AND novel_url = ? AND episode = ? AND status != 'done'",
+                (time.time(), site, novel_url, episode)
+            )
+            conn.commit()
+            self.dropped += cursor.rowcount
+
+    def retry(self, job, error):
+        """
+        失敗したジョブを、次に試す時刻を延ばして pending に戻します。戻り値: 次に試すまでの秒数
+        """
+        delay = min(QUEUE_RETRY_MAX, QUEUE_RETRY_BASE * 2 ** job.attempts) * random.uniform(0.8, 1.2)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = attempts + 1, next_at = ?, last_error = ?,"
+                " updated_at = ? WHERE site = ? AND novel_url = ? AND episode = ? AND status = 'running' AND body = ?",
+                (now + delay, str(error)[:500], now, job.site, job.novel_url, job.episode, job.body)
+            )
+            conn.commit()
+            self.failed += 1
+        return delay
+
+    def wait(self, timeout):
+        """
+        新しいジョブが入るか timeout 秒経つまで待ちます。
+        """
+        with self._added:
+            self._added.wait(timeout)
+
+    def next_due(self, sites):
+        """
+        sites の pending のジョブのうち、いちばん早く翻訳する時刻（なければ None）。
+        """
+        with self._lock:
+            marks = ','.join('?' * len(sites))
+            return self._connect().execute(
+                f"SELECT MIN(next_at) FROM jobs WHERE status = 'pending' AND site IN ({marks})",
+                tuple(sites)
+            ).fetchone()[0]
+
+    def stats(self):
+        """
+        状態ごとの件数と、いちばん失敗しているジョブの失敗回数を辞書で返します。
+        """
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+            worst = conn.execute("SELECT MAX(attempts) FROM jobs WHERE status = 'pending'").fetchone()[0]
+        return {'pending': counts.get('pending', 0) + counts.get('running', 0), 'done': counts.get('done', 0),
+                'max_attempts': worst or 0, 'completed': self.completed, 'failed': self.failed,
+                'dropped': self.dropped}
+
+    def prune(self):
+        """
+        古い done の記録を消します。
+        """
+        cutoff = time.time() - QUEUE_KEEP_DONE_DAYS * 86400
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (cutoff,))
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def pull(self):
+        """
+        ローカルにキューがなければ Drive から取得します（なくてもエラーにしない）。
+        """
+        if not os.path.exists(self.path):
+            subprocess.run(['rclone', 'copyto', self.remote_path, self.path], check=False)
+
+    def merge_remote(self):
+        """
+        Drive 上のキューを取り込みます（ジョブごとに更新日時が新しいほうを採る）。
+        """
+        remote_copy = f'{self.path}.remote'
+        result = subprocess.run(['rclone', 'copyto', self.remote_path, remote_copy], check=False)
+        if result.returncode != 0 or not os.path.exists(remote_copy):
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('ATTACH DATABASE ? AS remote', (remote_copy,))
+                try:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO jobs SELECT * FROM remote.jobs r WHERE NOT EXISTS ('
+                        ' SELECT 1 FROM jobs l WHERE l.site = r.site AND l.novel_url = r.novel_url'
+                        ' AND l.episode = r.episode AND l.updated_at >= r.updated_at)'
+                    )
+                    conn.commit()
+                finally:
+                    conn.execute('DETACH DATABASE remote')
+        except sqlite3.DatabaseError as e:
+            print(f'Drive 上の翻訳待ちキューを取り込めませんでした: {e}')
+        finally:
+            os.remove(remote_copy)
+
+    def push(self, merge=False):
+        """
+        Drive へ上書きコピーします。merge=True なら先に Drive 上の分を取り込みます。
+        """
+        if merge:
+            self.merge_remote()
+        self.prune()
+        self.close()
+        result = subprocess.run(['rclone', 'copyto', self.path, self.remote_path], check=False)
+        if result.returncode != 0:
+            print(f'翻訳待ちキューのアップロード失敗 (rclone exit {result.returncode})')
+
+    def report(self):
+        s = self.stats()
+        print(f"翻訳待ちキュー: 今回 完了 {s['completed']} / 失敗（あとで再試行）{s['failed']}"
+              f" / 古くなったため取り消し {s['dropped']}、"
+              f"残り {s['pending']} 件（最大失敗回数 {s['max_attempts']}）")
+
+
+queue = TranslationQueue()
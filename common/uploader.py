@@ -0,0 +1,155 @@
+"""
+Drive への差分アップロード。
+
+以前は10話ごとに小説フォルダ（なろうR18 は /tmp/narouR18_dl 全体）を rclone copy していたため、
+毎回ツリー全体の走査・比較が走り、ライブラリが大きくなるほど遅くなっていました。
+
+ここでは「前回のアップロード以降に書いたファイル」だけを記録しておき（マニフェスト）、
+rclone copy --files-from-raw でそれだけを送ります。アップロードは裏のスレッドで行うので、
+ダウンロード側は待たされません。
+
+- add(path)  : 書いたファイルを記録（マニフェストファイルにも追記するので、落ちても次回に送られる）
+- flush()    : 記録済みの分のアップロードを裏で開始
+- close()    : 残りをすべて送り終えるまで待ち、結果を表示
+"""
+import atexit
+import contextvars
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+
+from common import metrics
+
+RCLONE_FLAGS = ['--transfers=4', '--checkers=8', '--no-traverse']
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+class Uploader:
+    """
+    local_root 以下に書いたファイルを remote_root の同じ相対パスへ送ります。
+    """
+
+    def __init__(self, local_root, remote_root, manifest_path=None):
+        self.local_root = local_root
+        self.remote_root = remote_root
+        self.manifest_path = manifest_path or f'{local_root.rstrip("/")}.upload-manifest'
+        self.uploaded = 0
+        self.failed_batches = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._closed = False
+
+        # 前回アップロードしきれなかった分を引き継ぐ
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    rel = line.rstrip('\n')
+                    if rel:
+                        self._pending[rel] = object()
+        self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
+
+        # アップロードの記録にも作成時の文脈（metrics のラベル）を付ける
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, path):
+        """
+        アップロード対象のファイルを記録します。
+        """
+        rel = os.path.relpath(path, self.local_root)
+        with self._lock:
+            if rel not in self._pending:
+                self._manifest.write(f'{rel}\n')
+                self._manifest.flush()
+            # 送信中に同じファイルが書き直された場合に、送り終えても記録から消さないための印
+            self._pending[rel] = object()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """
+        記録済みの分のアップロードを裏で開始します（待たない）。
+        """
+        self._requests.put(_FLUSH)
+
+    def close(self):
+        """
+        残りをすべてアップロードし終えるまで待って、結果を表示します。
+        失敗した分が残っていれば False を返します（マニフェストに残るので次回送られます）。
+        """
+        if self._closed:
+            return not self._pending
+        self._closed = True
+        self._requests.put(_CLOSE)
+        self._thread.join()
+        with self._lock:
+            self._manifest.close()
+            left = len(self._pending)
+        if left:
+            print(f'アップロード未完了: {left} ファイル（次回の実行で再送します）')
+        else:
+            print(f'アップロード完了: 今回 {self.uploaded} ファイル')
+        return left == 0
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            # 溜まっている依頼はまとめて1回で処理する
+            closing = request is _CLOSE
+            while not closing:
+                try:
+                    closing = self._requests.get_nowait() is _CLOSE
+                except queue.Empty:
+                    break
+            self._upload_pending()
+            if closing:
+                return
+
+    def _upload_pending(self):
+        with self._lock:
+            marks = dict(self._pending)
+            batch = list(marks)
+        if not batch:
+            return
+
+        fd, list_path = tempfile.mkstemp(prefix='upload-', suffix='.txt')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(''.join(f'{rel}\n' for rel in batch))
+            print(f'→ Google Drive に {len(batch)} ファイルをアップロード中…')
+            with metrics.span('upload'):
+                result = subprocess.run([
+                    'rclone', 'copy',
+                    self.local_root, self.remote_root,
+                    '--files-from-raw', list_path,
+                    *RCLONE_FLAGS
+                ], check=False)
+        finally:
+            os.remove(list_path)
+
+        if result.returncode != 0:
+            self.failed_batches += 1
+            print(f'アップロード失敗 (rclone exit {result.returncode})。次回の同期で再送します')
+            return
+
+        with self._lock:
+            for rel in batch:
+                if rel in self._pending and self._pending[rel] is marks[rel]:
+                    del self._pending[rel]
+            self.uploaded += len(batch)
+            metrics.count('uploaded_files', len(batch))
+            # 送り終えた分をマニフェストから消す（残りだけを書き直す）
+            self._manifest.close()
+            tmp_path = f'{self.manifest_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(''.join(f'{rel}\n' for rel in self._pending))
+            os.replace(tmp_path, self.manifest_path)
+            self._manifest = open(self.manifest_path, 'a', encoding='utf-8')
@@ -0,0 +1,201 @@
+"""
+常駐（watch）モード。
+
+毎回の実行は新しいプロセスなので、そのたびに g4f / bs4 の読み込み・履歴や作品状態の Drive からの取得が走り、
+毎日更新される作品も 2019 年から止まっている作品も URL 一覧の順に同じように問い合わせていました。
+
+ここではプロセスを起動したままにして、HTTP セッション・翻訳クライアント・履歴・話の索引・作品状態を
+メモリに持ち続け、WATCH_TICK 秒ごとに「見に行く時刻になった作品」だけを事前チェックします。
+
+- 作品ごとの問い合わせ間隔は、最後の更新に最近の更新の間隔（作品状態の interval）を足した「次の更新の見込み時刻」
+  までの残りの半分（見込み時刻に近づくほど短くなる）。見込み時刻を過ぎたら過ぎた時間の 1/8、
+  interval がまだなければ最後の更新からの経過時間の 1/8。どれも WATCH_MIN_POLL〜WATCH_MAX_POLL に収める
+  （毎日更新される作品は更新の見込み時刻のまわりで数分おき、何年も止まっている作品は1日1回）
+- 見に行く作品は間隔の短い（よく更新される）順に処理する
+- URL 一覧ファイルが書き換えられたら読み直し、新しく加わった作品はすぐに見に行く
+- 履歴・作品状態などは処理のたびに、翻訳キャッシュ・翻訳待ちキューは WATCH_SYNC_INTERVAL 秒ごとに Drive へ同期
+- Ctrl+C / SIGTERM で、処理中の作品を終えてから同期して終了する
+
+    python download_all.py --watch [サイト名 ...]
+"""
+import os
+import re
+import signal
+import threading
+import time
+from datetime import datetime, timezone
+
+from common import metrics
+from common.crawler import check_mode, close_runs, open_runs, process_pending
+from common.sites import REPO_DIR
+from common.translate import prune_checkpoints
+from common.translation_cache import cache as translation_cache
+from common.translation_queue import queue as translation_queue
+
+WATCH_TICK = float(os.environ.get('WATCH_TICK', '60'))
+WATCH_MIN_POLL = float(os.environ.get('WATCH_MIN_POLL', '300'))
+WATCH_MAX_POLL = float(os.environ.get('WATCH_MAX_POLL', '86400'))
+WATCH_SYNC_INTERVAL = float(os.environ.get('WATCH_SYNC_INTERVAL', '1800'))
+
+# カクヨムの 2024-01-01T00:00:00Z、なろうの 2024-01-01 00:00:00 など
+TIME_RE = re.compile(r'(\d{4})[-/](\d{2})[-/](\d{2})[ T](\d{2}):(\d{2})')
+
+
+def parse_time(value):
+    """
+    サイトの最終更新日時を UNIX 時刻にします（タイムゾーンの差は順位付けには影響しないので UTC とみなす）。
+    """
+    match = TIME_RE.search(value or '')
+    if not match:
+        return None
+    return datetime(*map(int, match.groups()), tzinfo=timezone.utc).timestamp()
+
+
+def poll_interval(state, now):
+    """
+    作品状態 state（なければ None）から、次に見に行くまでの秒数を決めます。
+    次の更新の見込み時刻（最後の更新 + interval）の前は残りの半分ずつ間を詰め、過ぎたら少しずつ間を空けます。
+    """
+    if not state:
+        return WATCH_MIN_POLL
+    # changed_at は最初に記録したときにも入る（何年も止まっている作品でもその時刻になる）ので、
+    # サイトの最終更新日時のほうが古ければそちらを使う
+    times = [value for value in (state.get('changed_at'), parse_time(state.get('updated_at'))) if value]
+    last_change = min(times) if times else None
+    if not last_change:
+        return WATCH_MAX_POLL
+    interval = state.get('interval')
+    if not interval:
+        delay = (now - last_change) / 8
+    else:
+        until = last_change + interval - now
+        delay = until / 2 if until > 0 else -until / 8
+    return min(WATCH_MAX_POLL, max(WATCH_MIN_POLL, delay))
+
+
+class Watcher:
+    """
+    サイトごとの SiteRun を持ち続け、見に行く時刻になった作品だけを処理します。
+    """
+
+    def __init__(self, sites, workers=None, site_workers=None, mode=None):
+        self.mode = check_mode(mode)
+        self.workers = workers
+        self.site_workers = site_workers
+        self.runs, self.shard = open_runs(sites)
+        self.next_poll = {}
+        self.url_mtimes = {run.site.name: self._mtime(run) for run in self.runs}
+        self.last_sync = time.monotonic()
+        self.stopping = threading.Event()
+
+    @staticmethod
+    def _mtime(run):
+        try:
+            return os.path.getmtime(os.path.join(REPO_DIR, run.site.url_file))
+        except OSError:
+            return None
+
+    def reload_urls(self, run):
+        """
+        URL 一覧ファイルが書き換えられていたら読み直します。
+        """
+        mtime = self._mtime(run)
+        if mtime == self.url_mtimes.get(run.site.name):
+            return
+        self.url_mtimes[run.site.name] = mtime
+        old = set(run.urls)
+        run.urls = run.site.load_urls()
+        added = [url for url in run.urls if url not in old]
+        for url in added:
+            self.next_poll.pop(url, None)
+        print(f'[{run.site.name}] URL 一覧を読み直しました（追加 {len(added)} / 削除 {len(old - set(run.urls))}）')
+
+    def due(self, run, now):
+        """
+        見に行く時刻になった作品を、よく更新される順に返します。
+        """
+        urls = [url for url in run.urls if self.next_poll.get(url, 0) <= now]
+        if self.shard is not None:
+            urls = [url for url in urls if self.shard.owns(url)]
+        intervals = {url: poll_interval(run.state.get(url), now) for url in urls}
+        urls.sort(key=intervals.get)
+        for url in urls:
+            self.next_poll[url] = now + intervals[url]
+        return urls
+
+    def tick(self):
+        """
+        1回分: URL 一覧の読み直し → 時刻になった作品の事前チェック → 処理 → 同期。処理した作品数を返します。
+        """
+        now = time.time()
+        checked = 0
+        for run in self.runs:
+            self.reload_urls(run)
+            urls = self.due(run, now)
+            if urls:
+                checked += run.check(urls)
+        # crawl 以外では、再試行の時刻になった翻訳待ちの話も拾う
+        next_job = translation_queue.next_due([run.site.name for run in self.runs])
+        if checked or (self.mode != 'crawl' and next_job is not None and next_job <= now):
+            process_pending(self.runs, self.shard, self.mode, self.workers, self.site_workers, drain_peers=False,
+                            stopping=self.stopping)
+        if checked:
+            for run in self.runs:
+                run.checkpoint()
+        if time.monotonic() - self.last_sync >= WATCH_SYNC_INTERVAL:
+            self.last_sync = time.monotonic()
+            translation_cache.push(merge=self.shard is not None)
+            prune_checkpoints()
+            translation_queue.push(merge=self.shard is not None)
+        metrics.write_prometheus()
+        return checked
+
+    def stop(self, *_):
+        print('終了の合図を受け取りました。処理中の作品を終えてから終了します')
+        self.stopping.set()
+
+    def _tick_in_thread(self):
+        """
+        tick() を別スレッドで動かして終わるまで待ちます。
+        メインスレッドは待っているだけなので、Ctrl+C（KeyboardInterrupt）を受けても stopping を立てて待ち続け、
+        処理中の作品のワーカーが保存・履歴の更新を終えてから戻ります（その前に close_runs しない）。
+        """
+        errors = []
+        done = threading.Event()
+
+        def target():
+            try:
+                self.tick()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        # Thread.join は KeyboardInterrupt で中断されるとスレッドが終わったものとして扱ってしまう
+        # （Python 3.11 まで）ので、終わりの合図は Event で待つ
+        threading.Thread(target=target).start()
+        while not done.is_set():
+            try:
+                done.wait()
+            except KeyboardInterrupt:
+                self.stop()
+        if errors:
+            raise errors[0]
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        total = sum(len(run.urls) for run in self.runs)
+        print(f'常駐モードで開始します（{len(self.runs)} サイト・{total} 作品、{WATCH_TICK:.0f} 秒ごとに確認）')
+        try:
+            while not self.stopping.is_set():
+                self._tick_in_thread()
+                self.stopping.wait(WATCH_TICK)
+        except KeyboardInterrupt:
+            # tick と tick の間（何も処理していないとき）
+            self.stop()
+        finally:
+            close_runs(self.runs, self.shard)
+
+
+def watch(sites, workers=None, site_workers=None, mode=None):
+    Watcher(sites, workers, site_workers, mode).run()
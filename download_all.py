@@ -0,0 +1,35 @@
+"""
+カクヨム / 小説家になろう / なろうR18 をまとめてダウンロード・翻訳します。
+
+    python download_all.py                  # 全サイト
+    python download_all.py kakuyomu narou   # 指定したサイトだけ
+
+サイトをまたいで作品を並行して処理します（common.crawler）。
+翻訳を取得と切り離す場合は TRANSLATE_MODE=both / crawl / translate を指定します。
+
+    TRANSLATE_MODE=crawl python download_all.py       # 日本語本文の保存と翻訳待ちへの登録だけ
+    TRANSLATE_MODE=translate python download_all.py   # 翻訳待ちの話だけを翻訳
+
+--watch を付けると終了せずに常駐し、よく更新される作品ほど頻繁に見に行きます（common.watch）。
+
+    python download_all.py --watch narou
+サイトごとのスクリプト（kakuyomu/download_kakuyomu.py など）も従来どおり使えます。
+"""
+import sys
+
+from common.crawler import crawl
+from common.sites import SITES
+from common.watch import watch
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    watching = '--watch' in args
+    names = [arg for arg in args if arg != '--watch'] or list(SITES)
+    unknown = [name for name in names if name not in SITES]
+    if unknown:
+        sys.exit(f'不明なサイト: {", ".join(unknown)}（指定できるのは {", ".join(SITES)}）')
+    sites = [SITES[name] for name in names]
+    if watching:
+        watch(sites)
+    else:
+        crawl(sites)